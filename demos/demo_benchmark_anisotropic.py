@@ -0,0 +1,77 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+import time
+import sys
+import logging
+
+import numpy as np
+
+from pyrateoptics.raytracer.material.material_anisotropic import\
+    AnisotropicMaterial
+from pyrateoptics.raytracer.localcoordinates import LocalCoordinates
+
+logging.basicConfig(level=logging.INFO)
+
+
+def mytiming():
+    if sys.version_info.major >= 3:
+        return time.perf_counter()
+    else:
+        return time.clock()
+
+
+# throughput of the k/E solution at a surface (as used in refract and
+# reflect) for a uniaxial crystal: closed form vs. general eigen solver
+
+lc = LocalCoordinates.p(name="crystal")
+
+no = 1.5
+neo = 1.8
+myeps = np.array([[no, 0, 0], [0, no, 0], [0, 0, neo]])
+
+crystal_closed_form = AnisotropicMaterial.p(lc, myeps)
+crystal_general = AnisotropicMaterial.p(lc, myeps)
+crystal_general.uniaxial_parameters = None
+
+logging.getLogger().setLevel(logging.WARNING)
+
+for nrays in [1000, 10000, 100000]:
+    normal = np.zeros((3, nrays))
+    normal[2] = 1.
+    kpa = np.zeros((3, nrays))
+    kpa[0] = np.random.random(nrays)*0.5
+    kpa[1] = np.random.random(nrays)*0.5
+    x = np.zeros((3, nrays))
+
+    for (name, material) in [("closed form", crystal_closed_form),
+                             ("general", crystal_general)]:
+        t1 = mytiming()
+        material.sortKnormEField(x, normal, kpa, normal)
+        t2 = mytiming()
+        logging.warning("benchmark : %s, %d rays, %f s, %f rays per s" %
+                        (name, nrays, t2 - t1, nrays/(t2 - t1)))
@@ -0,0 +1,99 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import time
+import sys
+import logging
+import multiprocessing
+
+import numpy as np
+
+from pyrateoptics import build_rotationally_symmetric_optical_system
+from pyrateoptics.raytracer.ray import RayBundle
+from pyrateoptics.raytracer.parallel_trace import ParallelTraceExecutor
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def mytiming():
+    if sys.version_info.major >= 3:
+        return time.perf_counter()
+    else:
+        return time.clock()
+
+
+def build_lens_stack(num_lenses):
+    """
+    Stack of num_lenses weak biconvex lenses made of constant index glass.
+    Does not need the refractiveindex.info database.
+    """
+    builduplist = [(0, 0, 0.0, None, "object", {})]
+    for i in range(num_lenses):
+        builduplist.append((100.0, 0, 2.0, 1.5, "front" + str(i), {}))
+        builduplist.append((-100.0, 0, 1.0, None, "back" + str(i), {}))
+    builduplist.append((0, 0, 10.0, None, "image", {}))
+    return build_rotationally_symmetric_optical_system(builduplist)
+
+
+# scaling of the parallel trace of a large raybundle with the number
+# of worker processes; the pools are started before the timing
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    (s, seq) = build_lens_stack(8)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    nrays = 1000000
+    num_calls = 3
+    x0 = np.zeros((3, nrays))
+    x0[0] = np.random.uniform(-1., 1., nrays)
+    x0[1] = np.random.uniform(-1., 1., nrays)
+    k0 = np.zeros((3, nrays))
+    k0[2] = 1.
+    initialraybundle = RayBundle(x0=x0, k0=k0, Efield0=None)
+
+    t1 = mytiming()
+    for i in range(num_calls):
+        s.seqtrace(initialraybundle, seq, keep_history=False,
+                   use_trace_plan=True)
+    t2 = mytiming()
+    time_serial = (t2 - t1)/num_calls
+    logging.warning("benchmark : %d rays, serial: %f s per call" %
+                    (nrays, time_serial))
+
+    num_workers = 1
+    while num_workers <= multiprocessing.cpu_count():
+        with ParallelTraceExecutor(s, num_workers=num_workers) as executor:
+            executor.seqtrace(initialraybundle, seq, use_trace_plan=True)
+            t1 = mytiming()
+            for i in range(num_calls):
+                executor.seqtrace(initialraybundle, seq, use_trace_plan=True)
+            t2 = mytiming()
+        time_parallel = (t2 - t1)/num_calls
+        logging.warning("benchmark : %d rays, %d workers: %f s per call, "
+                        "speedup %f" % (nrays, num_workers, time_parallel,
+                                        time_serial/time_parallel))
+        num_workers *= 2
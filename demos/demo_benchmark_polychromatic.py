@@ -0,0 +1,103 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import time
+import sys
+import logging
+
+import numpy as np
+
+from pyrateoptics import build_rotationally_symmetric_optical_system
+from pyrateoptics.raytracer.ray import RayBundle, concatenateRayBundles
+from pyrateoptics.raytracer.material.material_isotropic import ModelGlass
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def mytiming():
+    if sys.version_info.major >= 3:
+        return time.perf_counter()
+    else:
+        return time.clock()
+
+
+def build_dispersive_lens_stack(num_lenses):
+    """
+    Stack of num_lenses weak biconvex lenses made of a model glass.
+    Does not need the refractiveindex.info database.
+    """
+    builduplist = [(0, 0, 0.0, None, "object", {})]
+    for i in range(num_lenses):
+        builduplist.append((100.0, 0, 2.0, 1.5, "front" + str(i), {}))
+        builduplist.append((-100.0, 0, 1.0, None, "back" + str(i), {}))
+    builduplist.append((0, 0, 10.0, None, "image", {}))
+    (s, seq) = build_rotationally_symmetric_optical_system(builduplist)
+    element = s.elements["stdelem"]
+    glass = element.materials["constantindexglass_1.5"]
+    element.addMaterial("modelglass", ModelGlass.p(glass.lc))
+    for i in range(num_lenses):
+        element.changeMaterialsForSurface("front" + str(i),
+                                          (None, "modelglass"))
+        element.changeMaterialsForSurface("back" + str(i),
+                                          ("modelglass", None))
+    return (s, seq)
+
+
+# polychromatic spot diagram: one trace per wavelength compared to
+# one trace of a raybundle with one wavelength per ray
+
+logging.getLogger().setLevel(logging.ERROR)
+(s, seq) = build_dispersive_lens_stack(8)
+logging.getLogger().setLevel(logging.WARNING)
+
+waves = np.linspace(0.4e-3, 0.7e-3, 7)
+num_calls = 20
+
+for nrays in [10, 100, 10000]:
+    x0 = np.zeros((3, nrays))
+    x0[1] = np.linspace(-1., 1., nrays)
+    k0 = np.zeros((3, nrays))
+    k0[2] = 1.
+    bundles = [RayBundle(x0=x0, k0=k0, Efield0=None, wave=wave)
+               for wave in waves]
+    polychromatic = concatenateRayBundles(bundles)
+
+    for use_trace_plan in [False, True]:
+        t1 = mytiming()
+        for i in range(num_calls):
+            for bundle in bundles:
+                s.seqtrace(bundle, seq, keep_history=False,
+                           use_trace_plan=use_trace_plan)
+        t2 = mytiming()
+        for i in range(num_calls):
+            s.seqtrace(polychromatic, seq, keep_history=False,
+                       use_trace_plan=use_trace_plan)
+        t3 = mytiming()
+        logging.warning("benchmark : %d wavelengths x %d rays, "
+                        "trace plan %s: %f ms per loop over wavelengths, "
+                        "%f ms per polychromatic trace" %
+                        (len(waves), nrays, use_trace_plan,
+                         1e3*(t2 - t1)/num_calls, 1e3*(t3 - t2)/num_calls))
@@ -0,0 +1,99 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import time
+import sys
+import logging
+
+import numpy as np
+
+from pyrateoptics import build_rotationally_symmetric_optical_system
+from pyrateoptics.sampling2d import raster
+from pyrateoptics.raytracer.ray import RayBundle
+from pyrateoptics.raytracer.globalconstants import degree
+from pyrateoptics.raytracer.analysis.optical_system_analysis import\
+    OpticalSystemAnalysis
+
+logging.basicConfig(level=logging.INFO)
+
+
+def mytiming():
+    if sys.version_info.major >= 3:
+        return time.perf_counter()
+    else:
+        return time.clock()
+
+
+def build_lens_stack(num_lenses):
+    """
+    Stack of num_lenses weak biconvex lenses made of constant index glass.
+    Does not need the refractiveindex.info database.
+    """
+    builduplist = [(0, 0, 0.0, None, "object", {})]
+    for i in range(num_lenses):
+        builduplist.append((100.0, 0, 2.0, 1.5, "front" + str(i), {}))
+        builduplist.append((-100.0, 0, 1.0, None, "back" + str(i), {}))
+    builduplist.append((0, 0, 10.0, None, "image", {}))
+    return build_rotationally_symmetric_optical_system(builduplist)
+
+
+nrays = 10000
+logging.getLogger().setLevel(logging.WARNING)
+
+for num_lenses in [2, 4, 8, 16, 32]:
+    (s, seq) = build_lens_stack(num_lenses)
+    num_surfaces = len(s.elements["stdelem"].surfaces) - 1
+
+    osa = OpticalSystemAnalysis(s, seq, name="Analysis")
+    (x0, k0, E0) = osa.divergent_bundle(nrays,
+                                        {"radius": 1.*degree,
+                                         "raster": raster.RectGrid()})
+    initialraybundle = RayBundle(x0=x0, k0=k0, Efield0=E0)
+    t1 = mytiming()
+    raypath = s.seqtrace(initialraybundle, seq)
+    t2 = mytiming()
+    logging.warning("benchmark : %d surfaces, %f s for tracing %d rays, "
+                    "%f us per ray-surface-operation" %
+                    (num_surfaces, t2 - t1, nrays,
+                     1e6*(t2 - t1)/(nrays*num_surfaces)))
+
+# history of a single bundle (e.g. GRIN integration steps):
+# appending should scale linearly with the number of steps
+
+x = np.zeros((3, nrays))
+k = np.zeros((3, nrays))
+k[2] = 1.
+valid = np.ones(nrays, dtype=bool)
+
+for num_steps in [10, 100, 1000]:
+    raybundle = RayBundle(x0=x, k0=k, Efield0=None)
+    t1 = mytiming()
+    for i in range(num_steps):
+        raybundle.append(x + i, k, raybundle.Efield[-1], valid)
+    t2 = mytiming()
+    logging.warning("benchmark : %d history points, %f s, "
+                    "%f us per point and ray" %
+                    (num_steps, t2 - t1, 1e6*(t2 - t1)/(nrays*num_steps)))
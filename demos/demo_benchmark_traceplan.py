@@ -0,0 +1,98 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import time
+import sys
+import logging
+
+import numpy as np
+
+from pyrateoptics import build_rotationally_symmetric_optical_system
+from pyrateoptics.raytracer.ray import RayBundle
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def mytiming():
+    if sys.version_info.major >= 3:
+        return time.perf_counter()
+    else:
+        return time.clock()
+
+
+def build_lens_stack(num_lenses):
+    """
+    Stack of num_lenses weak biconvex lenses made of constant index glass.
+    Does not need the refractiveindex.info database.
+    """
+    builduplist = [(0, 0, 0.0, None, "object", {})]
+    for i in range(num_lenses):
+        builduplist.append((100.0, 0, 2.0, 1.5, "front" + str(i), {}))
+        builduplist.append((-100.0, 0, 1.0, None, "back" + str(i), {}))
+    builduplist.append((0, 0, 10.0, None, "image", {}))
+    return build_rotationally_symmetric_optical_system(builduplist)
+
+
+# small raybundles as used in merit functions: the overhead per call
+# of seqtrace dominates; without history the plan traces in the local
+# coordinates of the surfaces (see TracePlan.traceLocalFrames)
+
+logging.getLogger().setLevel(logging.ERROR)
+(s, seq) = build_lens_stack(8)
+logging.getLogger().setLevel(logging.WARNING)
+num_surfaces = len(s.elements["stdelem"].surfaces) - 1
+
+for (nrays, num_calls) in [(10000, 10), (1, 200), (10, 200), (100, 200)]:
+    x0 = np.zeros((3, nrays))
+    x0[1] = np.linspace(-1., 1., nrays)
+    k0 = np.zeros((3, nrays))
+    k0[2] = 1.
+    initialraybundle = RayBundle(x0=x0, k0=k0, Efield0=None)
+
+    timings = []
+    for use_trace_plan in [False, True]:
+        t1 = mytiming()
+        for i in range(num_calls):
+            s.seqtrace(initialraybundle, seq, keep_history=False,
+                       use_trace_plan=use_trace_plan)
+        t2 = mytiming()
+        timings.append((t2 - t1)/num_calls)
+    logging.warning("benchmark : %d rays, %d surfaces, "
+                    "%f ms per call (generic), %f ms per call (trace plan)" %
+                    (nrays, num_surfaces,
+                     1e3*timings[0], 1e3*timings[1]))
+
+# changing a variable compiles the plan again at the next call
+
+num_calls = 200
+curvature = s.elements["stdelem"].surfaces["front0"].shape.curvature
+t1 = mytiming()
+for i in range(num_calls):
+    curvature.set_value(0.01 + 1e-6*i)
+    s.seqtrace(initialraybundle, seq, keep_history=False, use_trace_plan=True)
+t2 = mytiming()
+logging.warning("benchmark : %f ms per call with variable change "
+                "(trace plan)" % (1e3*(t2 - t1)/num_calls,))
@@ -29,6 +29,8 @@ import uuid
 import random
 import json
 import os
+import itertools
+import functools
 try:
     import pkg_resources
 except ImportError:
@@ -36,6 +38,127 @@ except ImportError:
 else:
     pkg_resources_import_failed = False
 
+
+# Word pool for random names. It is loaded once on first use.
+_word_pool = None
+
+# Counter for deterministic names.
+_name_counter = itertools.count()
+
+# Random names are generated only if this is True.
+_random_names_state = {"enabled": True}
+
+# All objects log via this logger. Their names are added to the messages
+# by an ObjectLoggerAdapter.
+shared_logger = logging.getLogger(name="pyrateoptics")
+
+
+def get_word_pool():
+    """
+    Returns (adjectives, nouns) for random name generation. The word lists
+    are read only once. If they cannot be read, both lists are empty.
+    """
+    global _word_pool
+
+    if _word_pool is None:
+        try:
+            if not pkg_resources_import_failed:
+                file_adjectives_string = pkg_resources.resource_string(
+                    "pyrateoptics.core.names",
+                    "adjectives.json"
+                ).decode("utf-8")  # transform bytes into string
+                file_nouns_string = pkg_resources.resource_string(
+                    "pyrateoptics.core.names",
+                    "nouns.json"
+                ).decode("utf-8")
+                adjectives = json.loads(file_adjectives_string)
+                nouns = json.loads(file_nouns_string)
+            else:
+                mycorespath = os.path.dirname(__file__)
+                with open(mycorespath +
+                          "/names/adjectives.json", "rt") as file_adjectives:
+                    adjectives = json.load(file_adjectives)
+                with open(mycorespath +
+                          "/names/nouns.json", "rt") as file_nouns:
+                    nouns = json.load(file_nouns)
+        except (IOError, OSError, ValueError):
+            adjectives = []
+            nouns = []
+        _word_pool = (adjectives, nouns)
+
+    return _word_pool
+
+
+def deterministic_name(kind):
+    """
+    Cheap name of the form kind_number.
+    """
+    return kind + "_" + str(next(_name_counter))
+
+
+def random_name(kind):
+    """
+    Name of the form adjective_noun_kind. Falls back to a
+    deterministic name if random names are switched off or if
+    the word lists are not available.
+    """
+    if not _random_names_state["enabled"]:
+        return deterministic_name(kind)
+
+    (adjectives, nouns) = get_word_pool()
+    if not adjectives or not nouns:
+        return deterministic_name(kind)
+
+    my_adjective = adjectives[random.randint(0, len(adjectives) - 1)]
+    my_noun = nouns[random.randint(0, len(nouns) - 1)]
+    # bring into form which can also be used by FreeCAD
+    return my_adjective + "_" + my_noun + "_" + kind
+
+
+class deterministic_names(object):
+    """
+    Context manager which switches off random name generation, e.g.
+    for constructing a lot of objects at once:
+
+    with deterministic_names():
+        ...
+    """
+
+    def __enter__(self):
+        self.previous_state = _random_names_state["enabled"]
+        _random_names_state["enabled"] = False
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _random_names_state["enabled"] = self.previous_state
+        return False
+
+
+def with_deterministic_names(func):
+    """
+    Decorator which calls func with random name generation switched off.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with deterministic_names():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ObjectLoggerAdapter(logging.LoggerAdapter):
+    """
+    Logs via a shared logger and prepends the name of the
+    logging object to every message.
+    """
+
+    def __init__(self, logger, owner):
+        logging.LoggerAdapter.__init__(self, logger, {})
+        self.owner = owner
+
+    def process(self, msg, kwargs):
+        return ("%s: %s" % (self.owner.name, msg), kwargs)
+
+
 class BaseLogger(object):
     """
     Provides logging functionality and gives access to
@@ -56,9 +179,9 @@ class BaseLogger(object):
         hierarchy after loading.
 
         The logger is the object which is responsible for logging. If None
-        a new one is created with the name of the object. If it is not None
-        the one provided is used which is useful to spit out log files or logs
-        in e.g. a GUI.
+        the shared logger is used which prepends the name of the object to
+        the messages. If it is not None the one provided is used which is
+        useful to spit out log files or logs in e.g. a GUI.
 
         The observer interface is added to the BaseLogger since maybe not only
         the optimizable classes should be coupled to observers.
@@ -72,7 +195,7 @@ class BaseLogger(object):
         self.list_observers = []
 
         if logger is None:
-            logger = logging.getLogger(name=self.__name)
+            logger = ObjectLoggerAdapter(shared_logger, self)
         self.logger = logger
         # self.debug("logger \"" + name + "\" created")
 
@@ -89,34 +212,7 @@ class BaseLogger(object):
         Setter for name.
         """
         if name == "":
-
-            if not pkg_resources_import_failed:
-                file_adjectives_string = pkg_resources.resource_string(
-                    "pyrateoptics.core.names",
-                    "adjectives.json"
-                ).decode("utf-8")  # transform bytes into string
-                file_nouns_string = pkg_resources.resource_string(
-                    "pyrateoptics.core.names",
-                    "nouns.json"
-                ).decode("utf-8")
-                adjectives = json.loads(file_adjectives_string)
-                nouns = json.loads(file_nouns_string)
-            else:
-                mycorespath = os.path.dirname(__file__)
-                with open(mycorespath +
-                          "/names/adjectives.json", "rt") as file_adjectives:
-                    adjectives = json.load(file_adjectives)
-                with open(mycorespath +
-                          "/names/nouns.json", "rt") as file_nouns:
-                    nouns = json.load(file_nouns)
-
-            my_index_ad = random.randint(0, len(adjectives) - 1)
-            my_index_no = random.randint(0, len(nouns) - 1)
-
-            my_adjective = adjectives[my_index_ad]
-            my_noun = nouns[my_index_no]
-            name = my_adjective + "_" + my_noun + "_" + self.kind
-            # bring into form which can also be used by FreeCAD
+            name = random_name(self.kind)
 
         self.__name = name
 
@@ -181,7 +277,7 @@ class BaseLogger(object):
         We have to restore the logger manually.
         """
         self.__dict__.update(state)
-        self.logger = logging.getLogger(name=self.name)
+        self.logger = ObjectLoggerAdapter(shared_logger, self)
 
     def append_observers(self, obslist):
         """
@@ -30,6 +30,27 @@ from .functionobject import FunctionObject
 from .log import BaseLogger
 
 
+# Counts all changes of values or states of optimizable variables
+# (and of other objects which call notify_modification, e.g. coordinate
+# systems). Caches like trace plans compare it to find out whether
+# they are outdated.
+_modification_count = [0]
+
+
+def notify_modification():
+    """
+    Increments global modification counter.
+    """
+    _modification_count[0] += 1
+
+
+def get_modification_count():
+    """
+    Returns global modification counter.
+    """
+    return _modification_count[0]
+
+
 class State(object):
     """
     State basic object which uses the State pattern of the gang of four.
@@ -269,12 +290,14 @@ class OptimizableVariable(BaseLogger):
         State transition to fixed.
         """
         self._state.to_fixed(self)
+        notify_modification()
 
     def to_variable(self):
         """
         State transition to variable.
         """
         self._state.to_variable(self)
+        notify_modification()
 
     def to_pickup(self, functionobject_tuple, args):
         """
@@ -286,6 +309,7 @@ class OptimizableVariable(BaseLogger):
                 which fit as arguments list into functionname.
         """
         self._state.to_pickup(self, functionobject_tuple, args)
+        notify_modification()
 
     def evaluate(self):
         """
@@ -299,6 +323,7 @@ class OptimizableVariable(BaseLogger):
         fixed and variable states.
         """
         self._state.set_value(value)
+        notify_modification()
 
     def __call__(self):
         """
@@ -33,7 +33,7 @@ from pprint import pformat
 import yaml
 
 
-from .log import BaseLogger
+from .log import BaseLogger, with_deterministic_names
 from .iterators import SerializationIterator
 from .optimizable_variables_pool import OptimizableVariablesPool
 
@@ -164,12 +164,14 @@ class Deserializer(BaseLogger):
         else:
             return False
 
+    @with_deterministic_names
     def deserialize(self, source_checked, variables_checked):
         """
         Convert the list obtained from a file or another source back
         into a class with optimizable variables, via a recursive
         reconstruction of subclasses. Source checked and variables checked
-        are to be set to True by the user.
+        are to be set to True by the user. Intermediate objects without
+        names get deterministic names.
         """
 
         def is_structure_free_of_uuids(structure_dict):
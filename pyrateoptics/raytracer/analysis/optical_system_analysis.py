@@ -32,7 +32,7 @@ from ...core.log import BaseLogger
 from ...sampling2d.raster import RectGrid
 from ..globalconstants import (standard_wavelength,
                                degree, canonical_ey)
-from ..ray import RayBundle
+from ..ray import RayBundle, concatenateRayBundles
 from .ray_analysis import RayBundleAnalysis
 from .optical_element_analysis import OpticalElementAnalysis
 
@@ -91,6 +91,25 @@ class OpticalSystemAnalysis(BaseLogger):
         @param properties_dict (dict) collimated ray bundle properties
         @param wavelength (float) wavelength (default is standard_wavelength)
         """
+        if properties_dict is None:
+            properties_dict = {}
+        rasterobj = properties_dict.get("raster", RectGrid())
+        (point_x, point_y) = rasterobj.getGrid(nrays)
+        return self.collimated_bundle_from_grid(point_x, point_y,
+                                                properties_dict, wave=wave)
+
+    def collimated_bundle_from_grid(self, point_x, point_y,
+                                    properties_dict=None,
+                                    wave=standard_wavelength):
+        """
+        Generates a collimated bundle for given normalized raster points
+        (see collimated_bundle).
+
+        @param point_x (1d numpy array of float) raster x coordinates
+        @param point_y (1d numpy array of float) raster y coordinates
+        @param properties_dict (dict) collimated ray bundle properties
+        @param wavelength (float) wavelength (default is standard_wavelength)
+        """
         if properties_dict is None:
             properties_dict = {}
 
@@ -99,13 +118,10 @@ class OpticalSystemAnalysis(BaseLogger):
         startx = properties_dict.get("startx", 0.)
         starty = properties_dict.get("starty", 0.)
         startz = properties_dict.get("startz", 0.)
-        rasterobj = properties_dict.get("raster", RectGrid())
         radius = properties_dict.get("radius", 1.0)
         angley = properties_dict.get("angley", 0.0)
         anglex = properties_dict.get("anglex", 0.0)
 
-        (point_x, point_y) = rasterobj.getGrid(nrays)
-
         origin = np.vstack((radius*point_x + startx, radius*point_y + starty,
                             startz*np.ones_like(point_x)))
         unitvector = np.zeros_like(origin)
@@ -131,6 +147,25 @@ class OpticalSystemAnalysis(BaseLogger):
         @param properties_dict (dict) collimated ray bundle properties
         @param wavelength (float) wavelength (default is standard_wavelength)
         """
+        if properties_dict is None:
+            properties_dict = {}
+        rasterobj = properties_dict.get("raster", RectGrid())
+        (angle_x, angle_y) = rasterobj.getGrid(nrays)
+        return self.divergent_bundle_from_grid(angle_x, angle_y,
+                                               properties_dict, wave=wave)
+
+    def divergent_bundle_from_grid(self, angle_x, angle_y,
+                                   properties_dict=None,
+                                   wave=standard_wavelength):
+        """
+        Generates a divergent bundle for given normalized raster points
+        (see divergent_bundle).
+
+        @param angle_x (1d numpy array of float) raster x coordinates
+        @param angle_y (1d numpy array of float) raster y coordinates
+        @param properties_dict (dict) divergent ray bundle properties
+        @param wavelength (float) wavelength (default is standard_wavelength)
+        """
         if properties_dict is None:
             properties_dict = {}
 
@@ -139,13 +174,10 @@ class OpticalSystemAnalysis(BaseLogger):
         startx = properties_dict.get("startx", 0.)
         starty = properties_dict.get("starty", 0.)
         startz = properties_dict.get("startz", 0.)
-        rasterobj = properties_dict.get("raster", RectGrid())
         radius = properties_dict.get("radius", 45.0*degree)
         angley = properties_dict.get("angley", 0.0)
         anglex = properties_dict.get("anglex", 0.0)
 
-        (angle_x, angle_y) = rasterobj.getGrid(nrays)
-
         origin = np.vstack((startx*np.ones_like(angle_x),
                             starty*np.ones_like(angle_x),
                             startz*np.ones_like(angle_x)))
@@ -180,15 +212,88 @@ class OpticalSystemAnalysis(BaseLogger):
                                           wave=wave)]
         # TODO: need access to (o, k, E) triples
 
-    def trace(self, **kwargs):
+    def trace(self, merge_bundles=False, **kwargs):
         """
         Convenience function to trace rays. Later the bundletype functionality
         will be substituted by aiming functionality.
+
+        @param merge_bundles (bool) if True all initial bundles (e.g. for
+               several wavelengths) are traced in one pass as one
+               raybundle with one wavelength per ray
+               (see concatenateRayBundles); the result then contains
+               only one list of raypaths
         """
         self.info("tracing rays")
+        if merge_bundles:
+            return [self.opticalsystem.seqtrace(
+                concatenateRayBundles(self.initial_bundles),
+                self.sequence, **kwargs)]
         return [self.opticalsystem.seqtrace(ib, self.sequence, **kwargs)
                 for ib in self.initial_bundles]
 
+    def trace_chunks(self, numrays, chunk_size, rays_dict=None,
+                     bundletype="collimated", wave=standard_wavelength,
+                     **kwargs):
+        """
+        Generator which traces numrays rays chunk by chunk, such that
+        the memory consumption is bounded by chunk_size instead of
+        numrays. The raster (or random sampler) in rays_dict["raster"]
+        provides the points of each chunk (see RectGrid.getGridChunks).
+        The rayIDs of the raybundles count the rays of all chunks.
+        Unless given in kwargs, no history is kept (keep_history=False).
+
+        @param numrays (int) number of rays
+        @param chunk_size (int) maximal number of rays per chunk
+        @param rays_dict (dict) ray bundle properties (see aim)
+        @param bundletype (str) "collimated" or "divergent"
+        @param wave (float) wavelength
+        @param kwargs further arguments for seqtrace
+
+        @return generator of lists of final raybundles, one per raypath
+        """
+        if rays_dict is None:
+            rays_dict = {}
+        kwargs.setdefault("keep_history", False)
+
+        call_dict = {"collimated": self.collimated_bundle_from_grid,
+                     "divergent": self.divergent_bundle_from_grid}
+
+        rasterobj = rays_dict.get("raster", RectGrid())
+        first_ray_id = 0
+        for (point_x, point_y) in rasterobj.getGridChunks(numrays,
+                                                          chunk_size):
+            (org, kvec, evec) = call_dict[bundletype](point_x, point_y,
+                                                      rays_dict, wave=wave)
+            num_chunk = len(point_x)
+            initialbundle = RayBundle(
+                x0=org, k0=kvec, Efield0=evec, wave=wave,
+                rayID=np.arange(first_ray_id, first_ray_id + num_chunk))
+            first_ray_id += num_chunk
+            self.debug("tracing chunk of %d rays" % (num_chunk,))
+            raypaths = self.opticalsystem.seqtrace(initialbundle,
+                                                   self.sequence, **kwargs)
+            yield [raypath.getLastRayBundle() for raypath in raypaths]
+
+    def reduce_chunks(self, reducers, numrays, chunk_size, rays_dict=None,
+                      bundletype="collimated", wave=standard_wavelength,
+                      **kwargs):
+        """
+        Traces numrays rays chunk by chunk (see trace_chunks) and feeds
+        all final raybundles into the reducers (see ray_reducers).
+
+        @param reducers (list of RayBundleReducer objects)
+
+        @return reducers
+        """
+        for finalbundles in self.trace_chunks(numrays, chunk_size,
+                                              rays_dict=rays_dict,
+                                              bundletype=bundletype,
+                                              wave=wave, **kwargs):
+            for raybundle in finalbundles:
+                for reducer in reducers:
+                    reducer.add(raybundle)
+        return reducers
+
     def trace_3d_global(self, x0, k0, wave=standard_wavelength, **kwargs):
         """
         Convenience function to trace rays in global coordinates.
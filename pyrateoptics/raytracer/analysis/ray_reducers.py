@@ -0,0 +1,188 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+Reducers accumulate results of the final raybundles of chunked traces
+(see OpticalSystemAnalysis.trace_chunks) without keeping the rays.
+"""
+
+import numpy as np
+from ...core.log import BaseLogger
+from ..globalconstants import numerical_tolerance
+
+
+class RayBundleReducer(BaseLogger):
+    """
+    Base class for reducers. Only valid rays at the end of the
+    raybundles are taken into account.
+    """
+    def __init__(self, localcoordinates=None, name=""):
+        """
+        :param localcoordinates (LocalCoordinates object) coordinate
+               system for positions; if None -> global coordinates
+        """
+        super(RayBundleReducer, self).__init__(name=name)
+        self.localcoordinates = localcoordinates
+
+    def setKind(self):
+        self.kind = "raybundlereducer"
+
+    def get_valid_positions(self, raybundle):
+        """
+        Returns positions of the valid rays at the end of the raybundle.
+
+        :return (2d numpy 3xN array of float)
+        """
+        position = raybundle.x[-1][:, raybundle.valid[-1]]
+        if self.localcoordinates is not None:
+            position = self.localcoordinates.\
+                returnGlobalToLocalPoints(position)
+        return position
+
+    def add(self, raybundle):
+        """
+        Accumulates the results of one raybundle.
+        """
+        raise NotImplementedError()
+
+    def get_result(self):
+        """
+        Returns the accumulated result.
+        """
+        raise NotImplementedError()
+
+
+class SpotStatisticsReducer(RayBundleReducer):
+    """
+    Number of rays, centroid and RMS spot size. The moments of the
+    chunks are merged pairwise, which is numerically stable also for
+    large numbers of rays.
+    """
+    def __init__(self, localcoordinates=None, name=""):
+        super(SpotStatisticsReducer, self).__init__(
+            localcoordinates=localcoordinates, name=name)
+        self.num_rays = 0
+        self.centroid = np.zeros(3)
+        self.sum_squared_deviations = 0.
+
+    def add(self, raybundle):
+        position = self.get_valid_positions(raybundle)
+        (_, num_chunk) = np.shape(position)
+        if num_chunk == 0:
+            return
+        centroid_chunk = np.mean(position, axis=1)
+        squared_deviations_chunk = np.sum(
+            (position - centroid_chunk[:, np.newaxis])**2)
+        num_total = self.num_rays + num_chunk
+        delta = centroid_chunk - self.centroid
+        self.sum_squared_deviations += squared_deviations_chunk +\
+            np.sum(delta**2)*self.num_rays*num_chunk/float(num_total)
+        self.centroid = self.centroid + delta*num_chunk/float(num_total)
+        self.num_rays = num_total
+
+    def get_centroid_position(self):
+        """
+        :return centroid position (1d numpy array of 3 floats)
+        """
+        return self.centroid
+
+    def get_rms_spot_size_centroid(self):
+        """
+        RMS deviation with respect to the centroid, normalized as in
+        RayBundleAnalysis.get_rms_spot_size.
+
+        :return rms spot size (float)
+        """
+        return np.sqrt(self.sum_squared_deviations /
+                       (self.num_rays - 1 + numerical_tolerance))
+
+    def get_result(self):
+        """
+        :return (number of rays, centroid, rms spot size)
+        """
+        return (self.num_rays, self.get_centroid_position(),
+                self.get_rms_spot_size_centroid())
+
+
+class HistogramReducer(RayBundleReducer):
+    """
+    Histogram with fixed bins of a scalar quantity of the rays.
+    """
+    def __init__(self, function, bins, value_range, name=""):
+        """
+        :param function (callable) function(raybundle) returning one
+               value per ray (1d numpy array of float)
+        :param bins (int) number of bins
+        :param value_range (tuple of 2 floats) lower and upper bound
+        """
+        super(HistogramReducer, self).__init__(name=name)
+        self.function = function
+        self.counts = np.zeros(bins, dtype=int)
+        self.edges = np.linspace(value_range[0], value_range[1], bins + 1)
+
+    def add(self, raybundle):
+        values = np.asarray(self.function(raybundle))[raybundle.valid[-1]]
+        (counts, _) = np.histogram(values, bins=self.edges)
+        self.counts += counts
+
+    def get_result(self):
+        """
+        :return (counts, bin edges) (1d numpy arrays)
+        """
+        return (self.counts, self.edges)
+
+
+class IrradianceMapReducer(RayBundleReducer):
+    """
+    Power of the rays per area binned on a fixed xy grid in the
+    coordinate system of e.g. the image surface.
+    """
+    def __init__(self, localcoordinates, bins, x_range, y_range, name=""):
+        """
+        :param localcoordinates (LocalCoordinates object)
+        :param bins (tuple of 2 ints) number of bins in x and y
+        :param x_range (tuple of 2 floats)
+        :param y_range (tuple of 2 floats)
+        """
+        super(IrradianceMapReducer, self).__init__(
+            localcoordinates=localcoordinates, name=name)
+        self.power = np.zeros(bins)
+        self.xedges = np.linspace(x_range[0], x_range[1], bins[0] + 1)
+        self.yedges = np.linspace(y_range[0], y_range[1], bins[1] + 1)
+
+    def add(self, raybundle):
+        position = self.get_valid_positions(raybundle)
+        (power, _, _) = np.histogram2d(
+            position[0], position[1], bins=(self.xedges, self.yedges),
+            weights=raybundle.power[raybundle.valid[-1]])
+        self.power += power
+
+    def get_result(self):
+        """
+        :return (irradiance, x edges, y edges) where irradiance is the
+                power per bin area (2d numpy array of float)
+        """
+        bin_area = (self.xedges[1] - self.xedges[0]) *\
+            (self.yedges[1] - self.yedges[0])
+        return (self.power/bin_area, self.xedges, self.yedges)
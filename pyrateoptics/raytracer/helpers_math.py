@@ -65,6 +65,48 @@ def check_efield_compatibility1(efield, efield1,
     return check_efield_compatibility2(efield, efield1, ortho_efield1, tol=tol)
 
 
+def horner_with_derivatives(coefficients, s, order=0):
+    """
+    Evaluates the polynomial sum_p coefficients[p] s**p and its first and
+    second derivative by a simultaneous Horner scheme. For a 2d
+    coefficient array every row is a polynomial of its own.
+
+    :param coefficients: (1d numpy array of float, or RxD array of float)
+                         coefficients in ascending powers
+    :param s: (1d numpy array of float) N evaluation points
+    :param order: (int) highest derivative order (0, 1 or 2)
+
+    :return tuple of length order + 1: value, first and second derivative
+            (each N or RxN numpy array of float)
+    """
+    coefficients = np.asarray(coefficients, dtype=float)
+    value = coefficients[..., -1:]*np.ones_like(s)
+    first = np.zeros_like(value)
+    second = np.zeros_like(value)
+    for power in range(coefficients.shape[-1] - 2, -1, -1):
+        if order >= 2:
+            second = second*s + first
+        if order >= 1:
+            first = first*s + value
+        value = value*s + coefficients[..., power:power + 1]
+    return (value, first, 2.*second)[:order + 1]
+
+
+def reshape_points(arrays, shape):
+    """
+    Reshapes the last axis (the points) of every array to shape,
+    e.g. to restore the shape of input points after evaluating on the
+    flattened points.
+
+    :param arrays: (tuple of numpy arrays of float, last axis N)
+    :param shape: (tuple of int) with product N
+
+    :return tuple of numpy arrays with shape array.shape[:-1] + shape
+    """
+    return tuple(array.reshape(array.shape[:-1] + shape)
+                 for array in arrays)
+
+
 def rodrigues(angle, axis):
     '''
     returns numpy matrix from Rodrigues formula.
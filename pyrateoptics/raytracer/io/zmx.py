@@ -42,7 +42,7 @@ from ..surface_shape import (Conic,
                              Biconic,
                              GridSag)
 from ..aperture import CircularAperture, RectangularAperture
-from ...core.log import BaseLogger
+from ...core.log import BaseLogger, with_deterministic_names
 from ..material.material_isotropic import ModelGlass, ConstantIndexGlass
 from ..globalconstants import numerical_tolerance, degree
 
@@ -507,11 +507,13 @@ class ZMXParser(BaseLogger):
 
         return raybundle_dicts
 
+    @with_deterministic_names
     def create_optical_system(self, matdict=None, options=None,
                               elementname="zmxelem"):
         """
         Creates optical system from ZEMAX file with material
-        data and options.
+        data and options. Objects without names in the file get
+        deterministic names.
         """
         # It is intended that matdict and options should not
         # be changed at a higher level from within this function.
@@ -32,7 +32,8 @@ import numpy as np
 from .helpers_math import rodrigues
 
 from ..core.base import ClassWithOptimizableVariables
-from ..core.optimizable_variable import FloatOptimizableVariable, FixedState
+from ..core.optimizable_variable import FloatOptimizableVariable, FixedState,\
+    notify_modification
 
 
 class LocalCoordinates(ClassWithOptimizableVariables):
@@ -294,6 +295,7 @@ class LocalCoordinates(ClassWithOptimizableVariables):
             # examine!
 
         self.updateAnnotations()
+        notify_modification()
         self.debug("updating children")
 
         for ch in self.__children:
@@ -413,24 +415,22 @@ class LocalCoordinates(ClassWithOptimizableVariables):
 
     def returnGlobalToLocalTensors(self, globaltensor):
         """
-        @param: globaldirs (3x3xN numpy array)
-        @return: localdirs (3x3xN numpy array)
+        @param: globaltensor (3x3xN or constant 3x3x1 or 3x3 numpy array)
+        @return: localtensor (numpy array of same shape)
         """
 
-        (num_dims_r, num_dims_c, num_pts) = np.shape(globaltensor)
-        localbasisT = np.repeat(self.localbasis.T[:, :, np.newaxis], num_pts, axis=2)
-        localtensor = np.einsum('lj...,ji...,ki...', localbasisT, globaltensor, localbasisT).T
+        localtensor = np.einsum('lj,ji...,ki->lk...', self.localbasis.T,
+                                globaltensor, self.localbasis.T)
         return localtensor
 
     def returnLocalToGlobalTensors(self, localtensor):
         """
-        @param: globaldirs (3x3xN numpy array)
-        @return: localdirs (3x3xN numpy array)
+        @param: localtensor (3x3xN or constant 3x3x1 or 3x3 numpy array)
+        @return: globaltensor (numpy array of same shape)
         """
 
-        (num_dims_r, num_dims_c, num_pts) = np.shape(localtensor)
-        localbasis = np.repeat(self.localbasis[:, :, np.newaxis], num_pts, axis=2)
-        globaltensor = np.einsum('lj...,ji...,ki...', localbasis, localtensor, localbasis).T
+        globaltensor = np.einsum('lj,ji...,ki->lk...', self.localbasis,
+                                 localtensor, self.localbasis)
         return globaltensor
 
 
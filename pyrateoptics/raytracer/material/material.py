@@ -32,6 +32,30 @@ from ...core.base import ClassWithOptimizableVariables
 from ..globalconstants import standard_wavelength
 
 
+def generalized_eigensolutions(amatrix, bmatrix, number):
+    """
+    Solves the generalized eigenvalue problem A v = w B v for one point
+    and keeps the number finite eigenvalues with smallest absolute value.
+    Fallback for points where the batched transformation into a
+    standard eigenvalue problem is ill-conditioned.
+
+    :param amatrix (DxD numpy array of complex)
+    :param bmatrix (DxD numpy array of complex)
+    :param number (int)
+
+    :return (w, vr): w (number numpy array of complex),
+            vr (D x number numpy array of complex)
+    """
+    (w, vr) = sla.eig(amatrix, b=bmatrix)
+
+    wfinite = np.isfinite(w)
+    w = w[wfinite]
+    vr = vr[:, wfinite]
+
+    sorted_indices = np.abs(w).argsort()[:number]
+    return (w[sorted_indices], vr[:, sorted_indices])
+
+
 class Material(ClassWithOptimizableVariables):
     """Abstract base class for materials."""
 
@@ -76,6 +100,13 @@ class Material(ClassWithOptimizableVariables):
 
 class MaxwellMaterial(Material):
 
+    # limit for the condition number of the matrices which are inverted
+    # in the batched eigenvalue solvers; points above use
+    # generalized_eigensolutions
+    eigensolver_condition_limit = 1e8
+    # angles (in units of pi) of the candidate shifts for the xi solver
+    eigensolver_shift_angles = (0.3, 0.7, 1.3)
+
     # TODO: rename procedures according to unified naming scheme
     # k divided in knorm and k0*knorm
     # calculation of det, xi, QEV from k_parallel, k_direction
@@ -87,7 +118,11 @@ class MaxwellMaterial(Material):
         """
         Calculate epsilon tensor if needed. (isotropic e.g.) eps = diag(3)*n^2
 
-        :return epsilon (3x3xN numpy array of complex)
+        The tensor field is either spatially varying (3x3xN) or
+        constant (3x3x1). Consumers have to broadcast along the last
+        axis instead of assuming N copies.
+
+        :return epsilon (3x3xN or 3x3x1 numpy array of complex)
         """
         raise NotImplementedError()
 
@@ -100,9 +135,8 @@ class MaxwellMaterial(Material):
         # xi_4: 4xN
         # efield_4: 4x3xN
 
-        k_norm_4 = np.zeros_like(efield_4)
-        for i in range(4):
-            k_norm_4[i, :, :] = kpa_norm + xi_4[i, :]*n
+        k_norm_4 = kpa_norm[np.newaxis, :, :] +\
+            xi_4[:, np.newaxis, :]*n[np.newaxis, :, :]
 
         return (k_norm_4, efield_4)
 
@@ -112,9 +146,7 @@ class MaxwellMaterial(Material):
         # xi_4: 4xN
         # efield_4: 4x3xN
 
-        k_norm_4 = np.zeros_like(efield_4)
-        for i in range(4):
-            k_norm_4[i, :, :] = k_4[i, :]*kd
+        k_norm_4 = k_4[:, np.newaxis, :]*kd[np.newaxis, :, :]
 
         return (k_norm_4, efield_4)
 
@@ -131,25 +163,9 @@ class MaxwellMaterial(Material):
 
         """
 
-        (num_dims, num_pts) = np.shape(n)
-
         (k_norm_4, Efield_4) = self.calcKnormEfield(x, n, kpa_norm, wave=wave)
 
-        k_norm_4_sorted = np.zeros_like(k_norm_4)
-        Efield_4_sorted = np.zeros_like(Efield_4)
-        Sn_scalarproduct = np.zeros((4, num_pts))
-
-
-        for i in range(4):
-            Si = self.calcPoytingVectorNorm(k_norm_4[i, :, :], Efield_4[i, :, :])
-            Sn_scalarproduct[i, :] = np.sum(Si*e, axis=0)
-
-        Sn_scalarproduct_argsort = Sn_scalarproduct.argsort(axis=0)
-        for i in range(num_pts):
-            k_norm_4_sorted[:, :, i] = k_norm_4[Sn_scalarproduct_argsort[:, i], :, i]
-            Efield_4_sorted[:, :, i] = Efield_4[Sn_scalarproduct_argsort[:, i], :, i]
-
-        return (k_norm_4_sorted, Efield_4_sorted)
+        return self.sortKnormEFieldByPoyntingVector(k_norm_4, Efield_4, e)
 
     def sortKnormUnitEField(self, x, kd, e, wave=standard_wavelength):
         """
@@ -164,23 +180,39 @@ class MaxwellMaterial(Material):
 
         """
 
-        (num_dims, num_pts) = np.shape(kd)
-
         (k_norm_4, Efield_4) = self.calcKnormDirectionEfield(x, kd, wave=wave)
 
-        k_norm_4_sorted = np.zeros_like(k_norm_4)
-        Efield_4_sorted = np.zeros_like(Efield_4)
-        Sn_scalarproduct = np.zeros((4, num_pts))
+        return self.sortKnormEFieldByPoyntingVector(k_norm_4, Efield_4, e)
 
+    def sortKnormEFieldByPoyntingVector(self, k_norm_4, Efield_4, e):
+        """
+        Sort k_norm and E-field solutions ascending by <S, e>
+        for all points at once.
+
+        :param k_norm_4 (4x3xN array of complex)
+        :param Efield_4 (4x3xN array of complex)
+        :param e (3xN array of float)
 
-        for i in range(4):
-            Si = self.calcPoytingVectorNorm(k_norm_4[i, :, :], Efield_4[i, :, :])
-            Sn_scalarproduct[i, :] = np.sum(Si*e, axis=0)
+        :return (k_norm_4_sorted, Efield_4_sorted)
+        """
 
-        Sn_scalarproduct_argsort = Sn_scalarproduct.argsort(axis=0)
-        for i in range(num_pts):
-            k_norm_4_sorted[:, :, i] = k_norm_4[Sn_scalarproduct_argsort[:, i], :, i]
-            Efield_4_sorted[:, :, i] = Efield_4[Sn_scalarproduct_argsort[:, i], :, i]
+        # S_j = Re((conj(E)_i E_i delta_{jl} - conj(E)_j E_l) k_l)
+        S_4 = np.real(
+            np.einsum("ai...,ai...->a...", np.conj(Efield_4),
+                      Efield_4)[:, np.newaxis, :]*k_norm_4
+            - np.einsum("ai...,ai...->a...", k_norm_4,
+                        Efield_4)[:, np.newaxis, :]*np.conj(Efield_4))
+        Sn_scalarproduct = np.sum(S_4*e[np.newaxis, :, :], axis=1)
+
+        Sn_scalarproduct_argsort = Sn_scalarproduct.argsort(axis=0)[
+            :, np.newaxis, :]
+
+        k_norm_4_sorted = np.take_along_axis(k_norm_4,
+                                             Sn_scalarproduct_argsort,
+                                             axis=0)
+        Efield_4_sorted = np.take_along_axis(Efield_4,
+                                             Sn_scalarproduct_argsort,
+                                             axis=0)
 
         return (k_norm_4_sorted, Efield_4_sorted)
 
@@ -252,6 +284,8 @@ class MaxwellMaterial(Material):
 
         p2 = (-a4*a1 + a5)#*k0**2 # remove k0?
         p0 = 1./6.*(a1**3 - 3*a1*a2 + 2*a3)#*k0**4
+        # constant eps tensor
+        p0 = np.broadcast_to(p0, (num_pts,))
 
         kappaarray = np.zeros((4, num_pts), dtype=complex)
 
@@ -292,6 +326,8 @@ class MaxwellMaterial(Material):
         p4 = a4*a6
         p2 = (-a4*a1 + a5)#*k0**2 # remove k0?
         p0 = 1./6.*(a1**3 - 3*a1*a2 + 2*a3)#*k0**4
+        # constant eps tensor
+        p0 = np.broadcast_to(p0, (num_pts,))
 
         kappaarray = np.zeros((4, num_pts), dtype=complex)
 
@@ -367,28 +403,17 @@ class MaxwellMaterial(Material):
 
         complexidmatrix = np.eye(3, dtype=complex)
 
-        IdMatrix = np.repeat(complexidmatrix[:, :, np.newaxis], num_pts, axis=2)
+        IdMatrix = np.broadcast_to(complexidmatrix[:, :, np.newaxis],
+                                   (3, 3, num_pts))
         ZeroMatrix = np.zeros((3, 3, num_pts), dtype=complex)
 
-        Mmatrix = -np.copy(IdMatrix)
-        Kmatrix = np.array(eps, dtype=complex) # if eps is only real we have to cast it to complex
-        Cmatrix = np.copy(ZeroMatrix)
-
-        # FIXME: subst for loop by einsum
-        #Mmatrix += np.einsum("i...,j...->ij...", n, n)
-        #Cmatrix += np.einsum("i...,j...->ij...", kpa_norm, n) +\
-        #    np.einsum("i...,j...->ij...", n, kpa_norm)
-        #Kmatrix += -np.einsum("k...,k...->...", kpa_norm, kpa_norm)*IdMatrix +\
-        #    np.einsum("i...,j...->ij...", kpa_norm, kpa_norm)
-
-        for j in range(num_pts):
-            Mmatrix[:, :, j] += np.outer(n[:, j], n[:, j])
-            Cmatrix[:, :, j] += np.outer(kpa_norm[:, j], n[:, j]) +\
-                np.outer(n[:, j], kpa_norm[:, j])
-            Kmatrix[:, :, j] += -np.dot(
-                kpa_norm[:, j],
-                kpa_norm[:, j]) * complexidmatrix +\
-                np.outer(kpa_norm[:, j], kpa_norm[:, j])
+        Mmatrix = -IdMatrix + np.einsum("i...,j...->ij...", n, n)
+        Cmatrix = np.einsum("i...,j...->ij...", kpa_norm, n) +\
+            np.einsum("i...,j...->ij...", n, kpa_norm)
+        # if eps is only real we have to cast it to complex
+        Kmatrix = np.array(eps, dtype=complex) +\
+            -np.einsum("k...,k...->...", kpa_norm, kpa_norm)*IdMatrix +\
+            np.einsum("i...,j...->ij...", kpa_norm, kpa_norm)
 
         Amatrix6x6 = np.vstack(
             (np.hstack((Cmatrix, Kmatrix)),
@@ -421,33 +446,77 @@ class MaxwellMaterial(Material):
 
         """
 
-        (num_dims, num_pts) = np.shape(kpa_norm)
-
-        eigenvectors = np.zeros((4, 3, num_pts), dtype=complex)
-        eigenvalues = np.zeros((4, num_pts), dtype=complex)
-        # xi number, eigv 3xN
-
         ((Amatrix6x6, Bmatrix6x6), (Mmatrix, Cmatrix, Kmatrix)) \
             = self.calcXiQEVMatricesNorm(x, n, kpa_norm, wave=wave)
 
-        for j in range(num_pts):
-            (w, vr) = sla.eig(Amatrix6x6[:, :, j], b=Bmatrix6x6[:, :, j])
-
-            # first remove infinite parts
-            # then sort w for abs value
-            # then remove the largest values until len(w) = 4
-
-            wfinite = np.isfinite(w)
-            w = w[wfinite]
-            vr = vr[:, wfinite]
+        # The generalized problem A v = xi B v has a singular B with two
+        # infinite eigenvalues. It is transformed into the standard
+        # problem (A - s B)^(-1) B v = nu v with xi = s + 1/nu, which can
+        # be solved for all points by one stacked eig call. The infinite
+        # solutions belong to nu = 0 and are removed by keeping the four
+        # nu with largest absolute value.
+        # The shift s has to be away from the eigenvalues xi, otherwise
+        # A - s B is (nearly) singular. Per point it is chosen from
+        # candidates on a circle whose radius |xi| ~ sqrt(|K|/|M|) is
+        # estimated from the QEV matrices, at angles away from the real
+        # and imaginary axes (where propagating and evanescent solutions
+        # of lossless materials are located). The first well conditioned
+        # candidate is used; points for which all candidates are
+        # ill-conditioned (e.g. lossy media with eigenvalues close to
+        # them) are solved by the generalized eigensolver.
+
+        Amatrices = np.moveaxis(Amatrix6x6, -1, 0)
+        Bmatrices = np.moveaxis(Bmatrix6x6, -1, 0)
+        num_pts = Amatrices.shape[0]
+
+        radius = 1. + np.sqrt(
+            np.linalg.norm(Kmatrix, axis=(0, 1)) /
+            np.maximum(np.linalg.norm(Mmatrix, axis=(0, 1)), 1e-300))
+
+        shift = np.zeros(num_pts, dtype=complex)
+        well_conditioned = np.zeros(num_pts, dtype=bool)
+        for angle in self.eigensolver_shift_angles:
+            # only points without well conditioned shift so far
+            remaining = np.flatnonzero(~well_conditioned)
+            if len(remaining) == 0:
+                break
+            candidate = radius[remaining]*np.exp(complex(0, np.pi*angle))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                condition = np.linalg.cond(
+                    Amatrices[remaining] -
+                    candidate[:, np.newaxis, np.newaxis] *
+                    Bmatrices[remaining])
+            accepted = np.isfinite(condition) &\
+                (condition < self.eigensolver_condition_limit)
+            shift[remaining[accepted]] = candidate[accepted]
+            well_conditioned[remaining[accepted]] = True
 
-            if len(w) > 4:
-                to_remove = len(w) - 4
-                sorted_indices = np.abs(w).argsort()
-                w = w[sorted_indices][:-to_remove]
-                vr = vr[:, sorted_indices][:, :-to_remove]
+        eigenvalues = np.zeros((4, num_pts), dtype=complex)
+        eigenvectors = np.zeros((4, 3, num_pts), dtype=complex)
 
-            eigenvalues[:, j] = np.copy(w)
+        indices = np.flatnonzero(well_conditioned)
+        if len(indices) > 0:
+            shift_column = shift[indices][:, np.newaxis, np.newaxis]
+            (nu, vr) = np.linalg.eig(
+                np.linalg.solve(Amatrices[indices] -
+                                shift_column*Bmatrices[indices],
+                                Bmatrices[indices]))
+
+            largest_indices = np.argsort(-np.abs(nu), axis=1)[:, :4]
+            nu = np.take_along_axis(nu, largest_indices, axis=1)
+            vr = np.take_along_axis(vr, largest_indices[:, np.newaxis, :],
+                                    axis=2)
+
+            # xi number, eigv 3xN
+            eigenvalues[:, indices] = (shift[indices][:, np.newaxis] +
+                                       1./nu).T
+            eigenvectors[:, :, indices] = np.transpose(vr[:, 3:, :],
+                                                       (2, 1, 0))
+
+        for j in np.flatnonzero(~well_conditioned):
+            (w, vr) = generalized_eigensolutions(Amatrices[j], Bmatrices[j],
+                                                 4)
+            eigenvalues[:, j] = w
             eigenvectors[:, :, j] = (vr.T)[:, 3:]
 
         return (eigenvalues, eigenvectors)
@@ -461,37 +530,59 @@ class MaxwellMaterial(Material):
                 (e is complex proportional to k vector)
         """
 
-
-        (num_dims, num_pts) = np.shape(x)
         eps = self.get_epsilon_tensor(x, wave=wave)
+        (num_dims, num_pts) = np.shape(x)
 
-        eigenvectors = np.zeros((4, 3, num_pts), dtype=complex)
-        eigenvalues = np.zeros((4, num_pts), dtype=complex)
-
-        Bmatrix = np.zeros((3, 3, num_pts), dtype=complex)
-        Amatrix = eps
+        # constant eps tensors are not copied; solve broadcasts
+        Amatrix = np.asarray(eps, dtype=complex)
         scalar_product_ee = np.sum(e*e, axis=0)
+        Bmatrix = np.eye(3)[:, :, np.newaxis]*scalar_product_ee -\
+            np.einsum("i...,j...->ij...", e, e)
+
+        # A v = k^2 B v with singular B (e is a zero mode) is transformed
+        # into eps^(-1) B v = 1/k^2 v, which is solved for all points
+        # at once. The infinite solution belongs to the zero eigenvalue
+        # and is removed by keeping the two largest ones. Points with
+        # singular or ill-conditioned eps are solved by the generalized
+        # eigensolver.
+
+        Amatrices = np.moveaxis(Amatrix, -1, 0)
+        Bmatrices = np.moveaxis(Bmatrix, -1, 0)
+        num_pts = Bmatrices.shape[0]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            condition = np.linalg.cond(Amatrices)
+        well_conditioned = np.broadcast_to(
+            np.isfinite(condition) &
+            (condition < self.eigensolver_condition_limit), (num_pts,))
 
-        for j in range(num_pts):
-            Bmatrix[:, :, j] = -(-np.eye(3)*scalar_product_ee[j] + np.outer(e[:, j], e[:, j]))
-
-        for j in range(num_pts):
-            (w, vr) = sla.eig(Amatrix[:, :, j], b=Bmatrix[:, :, j])
-
-            # first remove infinite parts
-            # then sort w for abs value
-            # then remove the largest values until len(w) = 4
-
-            wfinite = np.isfinite(w)
-            w = w[wfinite]
-            vr = vr[:, wfinite]
-
-            if len(w) > 2:
-                to_remove = len(w) - 2
-                sorted_indices = np.abs(w).argsort()
-                w = w[sorted_indices][:-to_remove]
-                vr = vr[:, sorted_indices][:, :-to_remove]
+        eigenvalues = np.zeros((4, num_pts), dtype=complex)
+        eigenvectors = np.zeros((4, 3, num_pts), dtype=complex)
 
+        if np.all(well_conditioned):
+            indices = slice(None)
+            amatrices_well = Amatrices
+        else:
+            indices = np.flatnonzero(well_conditioned)
+            Amatrices = np.broadcast_to(Amatrices, Bmatrices.shape)
+            amatrices_well = Amatrices[indices]
+
+        (nu, vr) = np.linalg.eig(np.linalg.solve(amatrices_well,
+                                                 Bmatrices[indices]))
+
+        largest_indices = np.argsort(-np.abs(nu), axis=1)[:, :2]
+        nu = np.take_along_axis(nu, largest_indices, axis=1)
+        vr = np.take_along_axis(vr, largest_indices[:, np.newaxis, :],
+                                axis=2)
+
+        w = (1./nu).T
+        eigenvalues[:, indices] = np.vstack((np.sqrt(w), -np.sqrt(w)))
+        eigenvectors[:, :, indices] = np.transpose(
+            np.concatenate((vr, vr), axis=2), (2, 1, 0))
+
+        for j in np.flatnonzero(~well_conditioned):
+            (w, vr) = generalized_eigensolutions(Amatrices[j], Bmatrices[j],
+                                                 2)
             eigenvalues[:, j] = np.hstack((np.sqrt(w), -np.sqrt(w)))
             eigenvectors[:, :, j] = np.vstack((vr.T, vr.T))
 
@@ -618,12 +709,14 @@ class MaxwellMaterial(Material):
 
         Propagator = np.zeros((num_dim, num_dim, num_pts), dtype=complex)
         dets = np.zeros(num_pts, dtype=complex)
+        eps = np.broadcast_to(self.get_epsilon_tensor(x, wave=wave),
+                              (num_dim, num_dim, num_pts))
 
         for j in range(num_pts):
             Propagator[:, :, j] =\
                 -np.dot(k_norm[:, j], k_norm[:, j])*np.eye(num_dim) +\
                 np.outer(k_norm[:, j], k_norm[:, j]) +\
-                self.get_epsilon_tensor(x, wave=wave)[:, :, j]
+                eps[:, :, j]
             dets[j] = np.linalg.det(Propagator[:, :, j])
         return dets
 
@@ -674,7 +767,7 @@ class MaxwellMaterial(Material):
         fifth = np.einsum("ij..., l..., l...", eps, k_norm, k_norm)
         sixth = np.einsum("ji..., l..., l...", eps, k_norm, k_norm)
 
-        delta_mat = np.repeat(np.eye(num_dims)[:, :, np.newaxis], num_pts, axis=2)
+        delta_mat = np.eye(num_dims)[:, :, np.newaxis]
 
         seventh = 2*np.einsum("ij...,kl...,k...,l...", delta_mat, eps, k_norm, k_norm)
 
@@ -26,7 +26,7 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import numpy as np
 
-from ..ray import RayBundle
+from ..ray import RayBundle, selectWave, selectWaveGroups
 from ..globalconstants import standard_wavelength
 from .material import MaxwellMaterial
 
@@ -38,21 +38,182 @@ class AnisotropicMaterial(MaxwellMaterial):
     """
 
     @classmethod
-    def p(cls, lc, epstensor, name="", comment=""):
+    def p(cls, lc, epstensor, name="", comment="", prune_threshold=0.):
 
         # up to now the material is not dispersive since the epsilon tensor
         # is not intended to be wave-dependent
-        return cls({"comment": comment, "epstensor": epstensor.tolist()},
+        # prune_threshold: rays with a relative power below this value
+        # are marked invalid at splitting; branches without remaining
+        # rays are dropped
+        return cls({"comment": comment, "epstensor": epstensor.tolist(),
+                    "prune_threshold": prune_threshold},
                    {"lc": lc}, name=name)
 
     def initialize_from_annotations(self):
         self.epstensor = np.array(self.annotations["epstensor"])
+        self.uniaxial_parameters = self.find_uniaxial_parameters(
+            self.epstensor)
+        if self.uniaxial_parameters is not None:
+            self.debug("uniaxial epsilon tensor: "
+                       "using closed form solutions")
+
+    @staticmethod
+    def find_uniaxial_parameters(epstensor, tol=1e-12):
+        """
+        Checks whether epstensor is of the uniaxial form
+        eps_o * 1 + (eps_e - eps_o) * c c^T with a real unit vector c.
+
+        :param epstensor (3x3 numpy array of float or complex)
+        :param tol (float) relative tolerance
+
+        :return None or (eps_o, eps_e, c)
+        """
+        epstensor = np.asarray(epstensor)
+        scale = np.max(np.abs(epstensor))
+        if scale == 0. or\
+                not np.allclose(epstensor, epstensor.T, rtol=0.,
+                                atol=tol*scale):
+            return None
+
+        # the optical axis belongs to the non-degenerate eigenvalue
+        # of the real or (if this one is isotropic) the imaginary part
+        for part in (np.real(epstensor), np.imag(epstensor)):
+            (eigenvalues, eigenvectors) = np.linalg.eigh(part)
+            differences = np.abs(np.diff(eigenvalues))
+            if np.all(differences <= tol*scale):
+                continue
+            index = 0 if differences[0] > differences[1] else 2
+            c = eigenvectors[:, index]
+            c_perp = eigenvectors[:, 2 - index]
+            eps_e = np.dot(c, np.dot(epstensor, c))
+            eps_o = np.dot(c_perp, np.dot(epstensor, c_perp))
+            uniaxial = eps_o*np.eye(3) + (eps_e - eps_o)*np.outer(c, c)
+            # singular tensors are left to the general solver
+            if abs(eps_o) > tol*scale and abs(eps_e) > tol*scale and\
+                    np.allclose(epstensor, uniaxial, rtol=0., atol=tol*scale):
+                return (eps_o, eps_e, c)
+            return None
+        return None
 
     def get_epsilon_tensor(self, x, wave=standard_wavelength):
+        """
+        Constant epsilon tensor field (3x3x1).
+        """
+        return self.epstensor[:, :, np.newaxis]
+
+    def calcUniaxialEfields(self, k_norm):
+        """
+        Closed form ordinary and extraordinary E-fields for uniaxial
+        epsilon tensor.
+
+        :param k_norm (3xN numpy array of complex)
+
+        :return (e_ord, e_ext) (each 3xN numpy array of complex,
+                                normalized to unit length)
+        """
+        (eps_o, eps_e, c) = self.uniaxial_parameters
+
+        # D_o ~ k x c, D_e ~ k x D_o; for k parallel to c every direction
+        # perpendicular to k is an ordinary one. Below sqrt(machine eps)
+        # the cross product is dominated by cancellation errors, which are
+        # larger than the error of treating k as parallel to c.
+        d_ord = np.cross(k_norm, c, axis=0)
+        d_ord_length = np.sqrt(np.sum(np.abs(d_ord)**2, axis=0))
+        k_length = np.sqrt(np.sum(np.abs(k_norm)**2, axis=0))
+        parallel = d_ord_length <= np.sqrt(np.finfo(float).eps)*k_length
+        if np.any(parallel):
+            auxiliary = np.zeros(3)
+            auxiliary[np.argmin(np.abs(c))] = 1.
+            d_ord[:, parallel] = np.cross(k_norm[:, parallel], auxiliary,
+                                          axis=0)
+        d_ext = np.cross(k_norm, d_ord, axis=0)
+
+        # E = eps^(-1) D
+        e_ord = d_ord
+        e_ext = d_ext/eps_o +\
+            (1./eps_e - 1./eps_o)*c[:, np.newaxis]*np.dot(c, d_ext)
+
+        e_ord = e_ord/np.sqrt(np.sum(np.abs(e_ord)**2, axis=0))
+        e_ext = e_ext/np.sqrt(np.sum(np.abs(e_ext)**2, axis=0))
+
+        return (e_ord, e_ext)
+
+    def calcXiEigenvectorsNorm(self, x, n, kpa_norm, wave=standard_wavelength):
+        """
+        For uniaxial materials the xi are calculated in closed form:
+
+        ordinary:      k.k = eps_o
+        extraordinary: eps_o (k.k) + (eps_e - eps_o) (k.c)^2 = eps_o eps_e
+
+        with k = kpa + xi n. Otherwise the general eigenvalue solver
+        is used.
+        """
+
+        if self.uniaxial_parameters is None:
+            return super(AnisotropicMaterial, self).calcXiEigenvectorsNorm(
+                x, n, kpa_norm, wave=wave)
+
+        (eps_o, eps_e, c) = self.uniaxial_parameters
+        delta_eps = eps_e - eps_o
+
+        kpa2 = np.sum(kpa_norm*kpa_norm, axis=0)
+        kpa_c = np.dot(c, kpa_norm)
+        n_c = np.dot(c, n)
 
-        (_, num_pts) = np.shape(x)
+        xi_ord = np.sqrt(eps_o - kpa2 + 0j)
 
-        return np.repeat(self.epstensor[:, :, np.newaxis], num_pts, axis=2)
+        a_coeff = eps_o + delta_eps*n_c**2
+        b_coeff = delta_eps*kpa_c*n_c
+        c_coeff = eps_o*kpa2 + delta_eps*kpa_c**2 - eps_o*eps_e
+        xi_ext_sqrt = np.sqrt(b_coeff**2 - a_coeff*c_coeff + 0j)
+
+        eigenvalues = np.array([xi_ord, -xi_ord,
+                                (-b_coeff + xi_ext_sqrt)/a_coeff,
+                                (-b_coeff - xi_ext_sqrt)/a_coeff])
+
+        k_norm_4 = kpa_norm[np.newaxis, :, :] +\
+            eigenvalues[:, np.newaxis, :]*n[np.newaxis, :, :]
+
+        eigenvectors = np.zeros_like(k_norm_4)
+        (eigenvectors[0], _) = self.calcUniaxialEfields(k_norm_4[0])
+        (eigenvectors[1], _) = self.calcUniaxialEfields(k_norm_4[1])
+        (_, eigenvectors[2]) = self.calcUniaxialEfields(k_norm_4[2])
+        (_, eigenvectors[3]) = self.calcUniaxialEfields(k_norm_4[3])
+
+        # same normalization as the eigenvectors (xi E, E) of the general
+        # solver; this keeps the ordering by Poynting vector identical
+        eigenvectors /= np.sqrt(1. + np.abs(eigenvalues)**2)[:, np.newaxis, :]
+
+        return (eigenvalues, eigenvectors)
+
+    def calcKnormEigenvectorsDirection(self, x, e, wave=standard_wavelength):
+        """
+        For uniaxial materials |k| is calculated in closed form:
+
+        ordinary:      k^2 = eps_o
+        extraordinary: k^2 = eps_o eps_e/(eps_o (e.e) + (eps_e - eps_o) (e.c)^2)
+
+        Otherwise the general eigenvalue solver is used.
+        """
+
+        if self.uniaxial_parameters is None:
+            return super(AnisotropicMaterial,
+                         self).calcKnormEigenvectorsDirection(x, e, wave=wave)
+
+        (eps_o, eps_e, c) = self.uniaxial_parameters
+
+        e_c = np.dot(c, e)
+        k2_ord = eps_o*np.ones_like(e_c) + 0j
+        k2_ext = eps_o*eps_e/(eps_o*np.sum(e*e, axis=0) +
+                              (eps_e - eps_o)*e_c**2) + 0j
+
+        (e_ord, e_ext) = self.calcUniaxialEfields(e + 0j)
+
+        eigenvalues = np.array([np.sqrt(k2_ord), np.sqrt(k2_ext),
+                                -np.sqrt(k2_ord), -np.sqrt(k2_ext)])
+        eigenvectors = np.array([e_ord, e_ext, e_ord, e_ext])
+
+        return (eigenvalues, eigenvectors)
 
     def propagate(self, raybundle, nextSurface):
 
@@ -66,6 +227,122 @@ class AnisotropicMaterial(MaxwellMaterial):
 
         nextSurface.intersect(raybundle)
 
+    def calcBranchPowerFractions(self, e_in, n, k_modes, e_modes):
+        """
+        Fresnel-like splitting of power between two outgoing modes.
+
+        The tangential component of the incoming E-field is expanded
+        into the tangential components of both mode E-fields (least
+        squares). The power of each branch is given by the squared
+        amplitude times the normal component of its Poynting vector.
+
+        :param e_in (3xN numpy array of complex) incoming E-field
+        :param n (3xN numpy array of float) surface normals
+        :param k_modes (2x3xN numpy array of complex)
+        :param e_modes (2x3xN numpy array of complex)
+
+        :return fractions (2xN numpy array of float), sum up to 1
+        """
+
+        def tangential(v):
+            return v - np.sum(v*n, axis=0)*n
+
+        e_in_t = tangential(e_in)
+        e_a_t = tangential(e_modes[0])
+        e_b_t = tangential(e_modes[1])
+
+        # normal equations of the 2x2 least squares problem
+        g_aa = np.sum(np.abs(e_a_t)**2, axis=0)
+        g_bb = np.sum(np.abs(e_b_t)**2, axis=0)
+        g_ab = np.sum(np.conj(e_a_t)*e_b_t, axis=0)
+        r_a = np.sum(np.conj(e_a_t)*e_in_t, axis=0)
+        r_b = np.sum(np.conj(e_b_t)*e_in_t, axis=0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            det = g_aa*g_bb - np.abs(g_ab)**2
+            alpha = (g_bb*r_a - g_ab*r_b)/det
+            beta = (g_aa*r_b - np.conj(g_ab)*r_a)/det
+
+            s_a = self.calcPoytingVectorNorm(k_modes[0], e_modes[0])
+            s_b = self.calcPoytingVectorNorm(k_modes[1], e_modes[1])
+
+            power_a = np.abs(alpha)**2*np.abs(np.sum(s_a*n, axis=0))
+            power_b = np.abs(beta)**2*np.abs(np.sum(s_b*n, axis=0))
+
+            fraction_a = power_a/(power_a + power_b)
+
+        # degenerate modes or no power at all: split equally
+        fraction_a[~np.isfinite(fraction_a)] = 0.5
+
+        return np.array([fraction_a, 1. - fraction_a])
+
+    def splitRayBundle(self, raybundle, n, k_modes, e_modes, splitup):
+        """
+        Creates the child raybundles of both modes (given in local
+        coordinates) and distributes the power of the parent rays
+        among them. Rays below the prune threshold are marked invalid.
+        If splitup is True, branches without valid rays are dropped.
+        """
+
+        e_in = self.lc.returnGlobalToLocalDirections(raybundle.Efield[-1])
+        fractions = self.calcBranchPowerFractions(e_in, n, k_modes, e_modes)
+        powers = raybundle.power[np.newaxis, :]*fractions
+
+        threshold = self.annotations.get("prune_threshold", 0.)
+        pruned = powers < threshold
+        # only rays which survived up to now count as pruned
+        pruned_counted = pruned*raybundle.valid[-1][np.newaxis, :]
+
+        orig = raybundle.x[-1]
+
+        if not splitup:
+            newk = self.lc.returnLocalToGlobalDirections(
+                np.hstack((k_modes[0], k_modes[1])))
+            newe = self.lc.returnLocalToGlobalDirections(
+                np.hstack((e_modes[0], e_modes[1])))
+
+            both_modes = np.tile(np.arange(len(raybundle.rayID)), 2)
+            rb = RayBundle(np.hstack((orig, orig)), newk, newe,
+                           np.hstack((raybundle.rayID, raybundle.rayID)),
+                           selectWave(raybundle.wave, both_modes),
+                           splitted=True,
+                           power=np.hstack((powers[0], powers[1])),
+                           wave_groups=selectWaveGroups(
+                               raybundle.getWaveGroups(), both_modes))
+            rb.valid[0] = ~np.hstack((pruned[0], pruned[1]))
+            rb.pruned_rays = int(np.sum(pruned_counted))
+            rb.pruned_power = float(np.sum(powers*pruned_counted))
+            return (rb,)
+
+        raybundles = []
+        for (k_mode, e_mode, power, pruned_mode, pruned_mode_counted) in\
+                zip(k_modes, e_modes, powers, pruned, pruned_counted):
+            rb = RayBundle(orig,
+                           self.lc.returnLocalToGlobalDirections(k_mode),
+                           self.lc.returnLocalToGlobalDirections(e_mode),
+                           raybundle.rayID, raybundle.wave, power=power,
+                           wave_groups=raybundle.getWaveGroups())
+            rb.valid[0] = ~pruned_mode
+            rb.pruned_rays = int(np.sum(pruned_mode_counted))
+            rb.pruned_power = float(np.sum(power*pruned_mode_counted))
+            raybundles.append(rb)
+
+        # drop branches which contain no valid rays anymore,
+        # but always keep at least one branch to continue the raypath
+        surviving = [rb for rb in raybundles if np.any(rb.valid[0])]
+        if not surviving:
+            surviving = raybundles[:1]
+        dropped = [rb for rb in raybundles if rb not in surviving]
+        for rb in dropped:
+            surviving[0].pruned_branches += 1
+            surviving[0].pruned_rays += rb.pruned_rays
+            surviving[0].pruned_power += rb.pruned_power
+        if dropped:
+            self.debug("dropped %d branch(es) below prune threshold %g" %
+                       (len(dropped), threshold))
+
+        return tuple(surviving)
+
     def refract(self, raybundle, actualSurface, splitup=False):
 
         k1_vec = self.lc.returnGlobalToLocalDirections(raybundle.k[-1])
@@ -83,33 +360,9 @@ class AnisotropicMaterial(MaxwellMaterial):
             xlocal, normal,
             k_inplane, normal, wave=raybundle.wave)
 
-        if not splitup:
-            # 2 vectors with largest scalarproduct of S with n
-            k2 = np.hstack((k2_sorted[2], k2_sorted[3]))
-
-            e2 = np.hstack((e2_sorted[2], e2_sorted[3]))
-
-            newids = np.hstack((raybundle.rayID, raybundle.rayID))
-
-            orig = np.hstack((raybundle.x[-1], raybundle.x[-1]))
-            newk = self.lc.returnLocalToGlobalDirections(k2)
-            newe = self.lc.returnLocalToGlobalDirections(e2)
-
-            return (RayBundle(orig, newk, newe, newids,
-                              raybundle.wave, splitted=True),)
-        else:
-            k2_1 = self.lc.returnLocalToGlobalDirections(k2_sorted[2])
-            k2_2 = self.lc.returnLocalToGlobalDirections(k2_sorted[3])
-
-            e2_1 = self.lc.returnLocalToGlobalDirections(e2_sorted[2])
-            e2_2 = self.lc.returnLocalToGlobalDirections(e2_sorted[3])
-
-            orig = raybundle.x[-1]
-
-            return (
-                RayBundle(orig, k2_1, e2_1, raybundle.rayID, raybundle.wave),
-                RayBundle(orig, k2_2, e2_2, raybundle.rayID, raybundle.wave)
-                )
+        # 2 vectors with largest scalarproduct of S with n
+        return self.splitRayBundle(raybundle, normal,
+                                   k2_sorted[2:4], e2_sorted[2:4], splitup)
 
     def reflect(self, raybundle, actualSurface, splitup=False):
 
@@ -128,27 +381,5 @@ class AnisotropicMaterial(MaxwellMaterial):
         # TODO: negative sign due to compatibility with z-direction of
         # coordinate decenter
 
-        if not splitup:
-            k2_vec = -np.hstack((k2_sorted[0], k2_sorted[1]))
-            e2_vec = -np.hstack((e2_sorted[0], e2_sorted[1]))
-            newids = np.hstack((raybundle.rayID, raybundle.rayID))
-
-            orig = np.hstack((raybundle.x[-1], raybundle.x[-1]))
-            newk = self.lc.returnLocalToGlobalDirections(k2_vec)
-            newe = self.lc.returnLocalToGlobalDirections(e2_vec)
-
-            return (RayBundle(orig, newk, newe, newids, raybundle.wave,
-                              splitted=True),)
-        else:
-            k2_1 = self.lc.returnLocalToGlobalDirections(-k2_sorted[0])
-            k2_2 = self.lc.returnLocalToGlobalDirections(-k2_sorted[1])
-
-            e2_1 = self.lc.returnLocalToGlobalDirections(-e2_sorted[0])
-            e2_2 = self.lc.returnLocalToGlobalDirections(-e2_sorted[1])
-
-            orig = raybundle.x[-1]
-
-            return (
-                RayBundle(orig, k2_1, e2_1, raybundle.rayID, raybundle.wave),
-                RayBundle(orig, k2_2, e2_2, raybundle.rayID, raybundle.wave)
-                )
+        return self.splitRayBundle(raybundle, normal,
+                                   -k2_sorted[0:2], -e2_sorted[0:2], splitup)
@@ -24,16 +24,35 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
+import os
+import pickle
+from copy import deepcopy
+
 import yaml
 import numpy as np
 from scipy.interpolate import interp1d
+from scipy.spatial import cKDTree
 
 
 from ...core.log import BaseLogger
-from ..globalconstants import Fline, dline, Cline
+from ..globalconstants import gline, Fline, dline, Cline
 from .material_isotropic import IsotropicMaterial
 
 
+def replace_file(source, destination):
+    """
+    Renames source to destination and replaces an existing destination.
+    Falls back to os.rename if os.replace is not available (Python 2.7);
+    there the destination has to be removed first on Windows.
+    """
+    if hasattr(os, "replace"):
+        os.replace(source, destination)
+    else:
+        if os.name == "nt" and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
 # FIXME: this class has too many methods
 class GlassCatalog(BaseLogger):
     """
@@ -52,19 +71,121 @@ class GlassCatalog(BaseLogger):
         import tool
         License: GNU General Public License 3
 
+    The parsed library, the lookup table of long names and all pages
+    read so far are stored in an index file next to the database
+    (library_index.pickle). The index is rebuilt if the modification
+    time of library.yml changed; pages are parsed again if the
+    modification time of their file changed. Newly parsed pages are
+    written to the index file once per get_material_dict or
+    get_glass_table call (see flush_index). If the index file cannot
+    be written, the catalog works without it.
+
     Example:
     gcat =\
         GlassCatalog(
             "/home/user/refractiveindex.info-database/database")
     """
 
-    def __init__(self, database_basepath, **kwargs):
+    # increase if the structure of the index file changes
+    index_version = 1
+
+    # weights of (nd, vd, PgF) for nearest glass searches: a difference
+    # of 0.01 in nd is as large as a difference of 1 in vd or 0.01 in PgF
+    default_weights = (1., 0.01, 1.)
+
+    def __init__(self, database_basepath, use_index=True,
+                 index_filename=None, **kwargs):
+        """
+        :param database_basepath: (str)
+        :param use_index: (bool) use and update the index file
+        :param index_filename: (str) path of the index file;
+               if None -> database_basepath/library_index.pickle
+        """
 
         super(GlassCatalog, self).__init__(**kwargs)
 
         self.database_basepath = database_basepath
-        self.librarydict = self.read_library(database_basepath +
-                                             "/library.yml")
+        if index_filename is None:
+            index_filename = database_basepath + "/library_index.pickle"
+        self.index_filename = index_filename
+        self.use_index = use_index
+        # index contains data which is not written to the index file yet
+        self.index_dirty = False
+
+        library_filename = database_basepath + "/library.yml"
+        library_mtime = self.get_file_mtime(library_filename)
+        self.index = None
+        if use_index and library_mtime is not None:
+            self.index = self.load_index(library_mtime)
+        if self.index is None:
+            librarydict = self.read_library(library_filename)
+            self.index = {"version": self.index_version,
+                          "library_mtime": library_mtime,
+                          "library": librarydict,
+                          "long_names":
+                              self.build_dict_of_long_names(librarydict),
+                          "pages": {}}
+            self.index_dirty = library_mtime is not None
+            self.flush_index()
+        self.librarydict = self.index["library"]
+        # validated glass table and KD-trees for nearest glass searches
+        self.glass_table = None
+        self.kdtrees = {}
+
+    @staticmethod
+    def get_file_mtime(filename):
+        """
+        Modification time of a file or None if it does not exist.
+        """
+        try:
+            return os.path.getmtime(filename)
+        except OSError:
+            return None
+
+    def load_index(self, library_mtime):
+        """
+        Loads the index file if it belongs to the current library.
+
+        :return index: (dict or None)
+        """
+        try:
+            with open(self.index_filename, "rb") as filehandler:
+                index = pickle.load(filehandler)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError, IndexError):
+            return None
+        if not isinstance(index, dict) or\
+                index.get("version") != self.index_version or\
+                index.get("library_mtime") != library_mtime:
+            self.info("Glass catalogue index outdated: %s" %
+                      (self.index_filename,))
+            return None
+        return index
+
+    def save_index(self):
+        """
+        Writes the index file. The file is replaced atomically such that
+        concurrent readers never see a partially written index.
+        """
+        tmpfilename = self.index_filename + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open(tmpfilename, "wb") as filehandler:
+                pickle.dump(self.index, filehandler,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            replace_file(tmpfilename, self.index_filename)
+        except (IOError, OSError):
+            self.info("Glass catalogue index not writable: %s" %
+                      (self.index_filename,))
+            if os.path.exists(tmpfilename):
+                os.remove(tmpfilename)
+
+    def flush_index(self):
+        """
+        Writes the index file if the index changed since the last write.
+        """
+        if self.index_dirty and self.use_index:
+            self.save_index()
+        self.index_dirty = False
 
     def read_yml_file(self, ymlfilename):
         """
@@ -140,12 +261,36 @@ class GlassCatalog(BaseLogger):
 
         self.logger.info("Material dict: %s" % (str(
             self.librarydict[shelf]["content"][book]["content"][page]),))
-        ymlfilename += self.librarydict[shelf]["content"]\
+        datapath = self.librarydict[shelf]["content"]\
             [book]["content"]\
             [page]["data"]
+        ymlfilename += datapath
         self.logger.info("Material file: %s" % (ymlfilename,))
 
-        data = self.read_yml_file(ymlfilename)
+        ymldict = self.load_page(datapath)
+        self.flush_index()
+        return deepcopy(ymldict)
+
+    def load_page(self, datapath):
+        """
+        Returns the parsed page file from the index or reads it if it
+        is not indexed yet or was changed. Do not modify the result.
+        Newly parsed pages are only stored in the index; call flush_index
+        to write them to the index file.
+
+        :param datapath: (str) path of the page file relative to data/
+
+        :return ymldict: (dict)
+        """
+        ymlfilename = self.database_basepath + "/data/" + datapath
+        mtime = self.get_file_mtime(ymlfilename)
+        (indexed_mtime, data) = self.index["pages"].get(datapath,
+                                                        (None, None))
+        if mtime is None or indexed_mtime != mtime:
+            data = self.read_yml_file(ymlfilename)
+            if mtime is not None:
+                self.index["pages"][datapath] = (mtime, data)
+                self.index_dirty = True
         return data
 
     # start of higher functionality section
@@ -187,6 +332,22 @@ class GlassCatalog(BaseLogger):
         return self.librarydict[shelf]["content"]\
             [book]["content"][page]["name"]
 
+    @staticmethod
+    def build_dict_of_long_names(librarydict):
+        """
+        Builds the lookup table of get_dict_of_long_names from the
+        library dict.
+        """
+        dic = {}
+        for (shelf, shelfdict) in librarydict.items():
+            for (book, bookdict) in shelfdict["content"].items():
+                for (page, pagedict) in bookdict["content"].items():
+                    # todo: if 2 pages have the same longName,
+                    # now only one will be put in dic
+                    if "name" in pagedict:
+                        dic[pagedict["name"]] = (shelf, book, page)
+        return dic
+
     def get_dict_of_long_names(self):
         """
         Returns a lookup table in which shelf, book and page
@@ -196,16 +357,7 @@ class GlassCatalog(BaseLogger):
                    keys are glass long names
                    values are tuples (shelf, book, page)
         """
-        dic = {}
-        for shelf in self.get_shelves():
-            self.debug("shelf=%s" % repr(shelf))
-            for book in self.get_books(shelf):
-                for page in self.get_pages(shelf, book):
-                    longname = self.get_page_long_name(shelf, book, page)
-                    # todo: if 2 pages have the same longName,
-                    # now only one will be put in dic
-                    dic[longname] = (shelf, book, page)
-        return dic
+        return dict(self.index["long_names"])
 
     def find_pages_with_long_name(self, searchterm):
         """
@@ -217,7 +369,7 @@ class GlassCatalog(BaseLogger):
                    keys are glass long names
                    values are tuples (shelf, book, page)
         """
-        allpages = self.get_dict_of_long_names()
+        allpages = self.index["long_names"]
         result = {}
         for longname in allpages:
             if longname.find(searchterm) != -1:
@@ -233,12 +385,7 @@ class GlassCatalog(BaseLogger):
         refractiveindex.info database.
         """
 
-        allpages = self.get_dict_of_long_names()
-        self.debug("allpages=%s" % repr(allpages))
-        result = []
-        for longname in allpages:
-            if longname == glass_name:
-                result = allpages[longname]
+        result = self.index["long_names"].get(glass_name, ())
 
         if len(result) == 0:  # no glass found, throwing exception
             errormsg = "glass name " + str(glass_name) + " not found."
@@ -265,25 +412,170 @@ class GlassCatalog(BaseLogger):
         matobj = CatalogMaterial.p(localcoordinates, matdict)
         return matobj
 
+    def get_glass_table(self):
+        """
+        Returns nd, vd and PgF of all pages whose dispersion can be
+        evaluated at the g, F, d and C lines. The table is evaluated
+        once and stored in the index file; it is evaluated again if
+        the library or one of the page files changed. Page files are only
+        checked for changes at the first call.
+
+        :return table: (dict)
+                keys: "pages" (list of (shelf, book, page)),
+                      "names" (list of str, long names),
+                      "nd_vd_pgf" (2d numpy Mx3 array of float),
+                      "page_mtimes" (dict)
+        """
+        if self.glass_table is not None:
+            return self.glass_table
+        table = self.index.get("glass_table")
+        self.kdtrees = {}
+        if table is not None and\
+                all([self.get_file_mtime(self.database_basepath + "/data/" +
+                                         datapath) == mtime
+                     for (datapath, mtime)
+                     in table["page_mtimes"].items()]):
+            self.glass_table = table
+            return table
+
+        self.info("Evaluating nd, vd and PgF of all catalog pages")
+        table = {"pages": [], "names": [], "nd_vd_pgf": [],
+                 "page_mtimes": {}}
+        for (shelf, shelfdict) in self.librarydict.items():
+            for (book, bookdict) in shelfdict["content"].items():
+                for (page, pagedict) in bookdict["content"].items():
+                    if "data" not in pagedict:
+                        continue
+                    datapath = pagedict["data"]
+                    ymldict = self.load_page(datapath)
+                    table["page_mtimes"][datapath] = self.get_file_mtime(
+                        self.database_basepath + "/data/" + datapath)
+                    nd_vd_pgf = calc_nd_vd_pgf(ymldict)
+                    if nd_vd_pgf is None:
+                        continue
+                    table["pages"].append((shelf, book, page))
+                    table["names"].append(pagedict.get("name", page))
+                    table["nd_vd_pgf"].append(nd_vd_pgf)
+        table["nd_vd_pgf"] = np.array(table["nd_vd_pgf"],
+                                      dtype=float).reshape((-1, 3))
+        self.index["glass_table"] = table
+        self.glass_table = table
+        self.index_dirty = True
+        self.flush_index()
+        return table
+
+    def get_kdtree(self, use_pgf, weights):
+        """
+        KD-tree of the glass table in weighted coordinates
+        (nd, vd[, PgF]) * weights. Cached per weights.
+        """
+        table = self.get_glass_table()
+        key = (use_pgf, tuple(weights))
+        if key not in self.kdtrees:
+            num_dims = 3 if use_pgf else 2
+            self.kdtrees[key] = cKDTree(table["nd_vd_pgf"][:, :num_dims] *
+                                        np.asarray(weights)[:num_dims])
+        return self.kdtrees[key]
+
+    def get_weighted_query(self, nd_value, vd_value, pgf_value, weights):
+        """
+        Returns (use_pgf, weights, weighted query point).
+        """
+        if weights is None:
+            weights = self.default_weights
+        use_pgf = pgf_value is not None
+        point = np.array([nd_value, vd_value, pgf_value if use_pgf else 0.])
+        num_dims = 3 if use_pgf else 2
+        return (use_pgf, weights,
+                point[:num_dims]*np.asarray(weights)[:num_dims])
+
+    def find_nearest_glasses(self, nd_value, vd_value, pgf_value=None,
+                             number=1, weights=None):
+        """
+        Returns the nearest glasses with respect to the weighted distance
+        sqrt(sum_i (weights_i * (x_i - glass_i))**2) with
+        x = (nd, vd, PgF). If pgf_value is None, PgF is ignored.
+
+        :param nd_value: (float)
+        :param vd_value: (float)
+        :param pgf_value: (float or None)
+        :param number: (int) number of glasses
+        :param weights: (tuple of 3 floats) if None -> default_weights
+
+        :return result: (list of (distance, long name, (shelf, book, page)))
+                        sorted by distance
+        """
+        (use_pgf, weights, point) = self.get_weighted_query(
+            nd_value, vd_value, pgf_value, weights)
+        table = self.get_glass_table()
+        number = min(number, len(table["pages"]))
+        if number == 0:
+            return []
+        (distances, indices) = self.get_kdtree(use_pgf, weights).query(
+            point, k=number)
+        return [(distance, table["names"][index], table["pages"][index])
+                for (distance, index) in zip(np.atleast_1d(distances),
+                                             np.atleast_1d(indices))]
+
+    def find_glasses_in_range(self, nd_value, vd_value, pgf_value=None,
+                              radius=0.01, weights=None):
+        """
+        Returns all glasses with weighted distance below radius
+        (see find_nearest_glasses).
+
+        :return result: (list of (distance, long name, (shelf, book, page)))
+                        sorted by distance
+        """
+        (use_pgf, weights, point) = self.get_weighted_query(
+            nd_value, vd_value, pgf_value, weights)
+        table = self.get_glass_table()
+        if len(table["pages"]) == 0:
+            return []
+        indices = self.get_kdtree(use_pgf, weights).query_ball_point(
+            point, radius)
+        num_dims = len(point)
+        weighted = table["nd_vd_pgf"][:, :num_dims] *\
+            np.asarray(weights)[:num_dims]
+        result = [(np.sqrt(np.sum((weighted[index] - point)**2)),
+                   table["names"][index], table["pages"][index])
+                  for index in indices]
+        return sorted(result, key=lambda entry: entry[0])
+
+    def get_material_dict_from_nearest_glass(self, nd_value, vd_value,
+                                             pgf_value=None):
+        """
+        Returns the material dict of the nearest glass.
+        """
+        result = self.find_nearest_glasses(nd_value, vd_value, pgf_value)
+        if len(result) == 0:
+            raise Exception("no glasses with nd, vd and PgF in catalog.")
+        (_, longname, (shelf, book, page)) = result[0]
+        self.debug("nearest glass: %s" % (longname,))
+        return self.get_material_dict(shelf, book, page)
+
     def get_material_dict_nd_vd_pgf(self, nd_value=1.51680,
                                     vd_value=64.17, pgf_value=0.5349):
         """
         Search a material close to given parameters.
         """
-        raise NotImplementedError()
+        return self.get_material_dict_from_nearest_glass(nd_value, vd_value,
+                                                         pgf_value)
 
     def get_material_dict_nd_vd(self, nd_value=1.51680,
                                 vd_value=64.17):
         """
         Search a material close to given parameters.
         """
-        raise NotImplementedError()
+        return self.get_material_dict_from_nearest_glass(nd_value, vd_value)
 
     def get_material_dict_schott_code(self, schott_code=517642):
         """
         Identify and return a material from a given material code.
+        The first 3 digits are 1000*(nd-1), the last 3 digits are 10*vd.
         """
-        raise NotImplementedError()
+        nd_value = 1. + 0.001*(schott_code // 1000)
+        vd_value = 0.1*(schott_code % 1000)
+        return self.get_material_dict_from_nearest_glass(nd_value, vd_value)
 
 
 class IndexFormulaContainer:
@@ -314,51 +606,61 @@ class IndexFormulaContainer:
         """
         self.coeff = coeff
 
+        # all formulas accept scalar wavelengths as well as arrays of
+        # wavelengths; the coefficient terms are summed along the last axis
+
         def dispersion_sellmeier(w_um):
             """
             Sellmaier
             """
+            w_col = np.asarray(w_um)[..., np.newaxis]
             b_coeff = self.coeff[1::2]
             c_coeff = self.coeff[2::2]
             nsquared = 1 + self.coeff[0] +\
-                sum(b_coeff * w_um**2 / (w_um**2 - c_coeff**2))
+                np.sum(b_coeff * w_col**2 / (w_col**2 - c_coeff**2), axis=-1)
             return np.sqrt(nsquared)
 
         def dispersion_sellmeier2(w_um):
             """
             Sellmaier with C redefined
             """
+            w_col = np.asarray(w_um)[..., np.newaxis]
             b_coeff = self.coeff[1::2]
             c_coeff = self.coeff[2::2]
             nsquared = 1 + self.coeff[0] +\
-                sum(b_coeff * w_um**2 / (w_um**2 - c_coeff))
+                np.sum(b_coeff * w_col**2 / (w_col**2 - c_coeff), axis=-1)
             return np.sqrt(nsquared)
 
         def dispersion_polynomial(w_um):
             """
             Polynomial
             """
+            w_col = np.asarray(w_um)[..., np.newaxis]
             a_coeff = self.coeff[1::2]
             p_coeff = self.coeff[2::2]
-            nsquared = self.coeff[0] + sum(a_coeff * (w_um**p_coeff))
+            nsquared = self.coeff[0] +\
+                np.sum(a_coeff * (w_col**p_coeff), axis=-1)
             return np.sqrt(nsquared)
 
         def dispersion_with_9_or_less_coefficients(w_um):
             """
             Refractiveindex.info formula with 9 or less coefficients.
             """
+            w_col = np.asarray(w_um)[..., np.newaxis]
             a_coeff = self.coeff[1::4]
             b_coeff = self.coeff[2::4]
             c_coeff = self.coeff[3::4]
             d_coeff = self.coeff[4::4]
             nsquared = self.coeff[0] +\
-                sum(a_coeff * (w_um**b_coeff) / (w_um**2 - c_coeff**d_coeff))
+                np.sum(a_coeff * (w_col**b_coeff) /
+                       (w_col**2 - c_coeff**d_coeff), axis=-1)
             return np.sqrt(nsquared)
 
         def dispersion_with_11_or_more_coefficients(w_um):
             """
             Refractiveindex.info formula with 11 or more coefficients.
             """
+            w_col = np.asarray(w_um)[..., np.newaxis]
             a_coeff = self.coeff[[1, 5]]
             b_coeff = self.coeff[[2, 6]]
             c_coeff = self.coeff[[3, 7]]
@@ -366,37 +668,44 @@ class IndexFormulaContainer:
             e_coeff = self.coeff[9::2]
             f_coeff = self.coeff[10::2]
             nsquared = self.coeff[0] +\
-                sum(a_coeff * (w_um**b_coeff) / (w_um**2 - c_coeff**d_coeff)) +\
-                sum(e_coeff * (w_um**f_coeff))
+                np.sum(a_coeff * (w_col**b_coeff) /
+                       (w_col**2 - c_coeff**d_coeff), axis=-1) +\
+                np.sum(e_coeff * (w_col**f_coeff), axis=-1)
             return np.sqrt(nsquared)
 
         def dispersion_cauchy(w_um):
             """
             Cauchy
             """
+            w_col = np.asarray(w_um)[..., np.newaxis]
             a_coeff = self.coeff[1::2]
             p_coeff = self.coeff[2::2]
-            n_index = self.coeff[0] + sum(a_coeff * (w_um**p_coeff))
+            n_index = self.coeff[0] +\
+                np.sum(a_coeff * (w_col**p_coeff), axis=-1)
             return n_index
 
         def dispersion_gases(w_um):
             """
             For gases
             """
+            w_col = np.asarray(w_um)[..., np.newaxis]
             b_coeff = self.coeff[1::2]
             c_coeff = self.coeff[2::2]
-            n_index = 1 + self.coeff[0] + sum(b_coeff / (c_coeff - w_um**(-2)))
+            n_index = 1 + self.coeff[0] +\
+                np.sum(b_coeff / (c_coeff - w_col**(-2)), axis=-1)
             return n_index
 
         def dispersion_herzberger(w_um):
             """
             Herzberger
             """
-            denom = w_um**2 - 0.028
+            w_col = np.asarray(w_um)[..., np.newaxis]
+            denom = np.asarray(w_um)**2 - 0.028
             a_coeff = self.coeff[3:]
             p_coeff = 2 * np.arange(len(a_coeff)) + 2
             n_index = self.coeff[0] + self.coeff[1] / denom +\
-                self.coeff[2] / denom**2 + sum(a_coeff * w_um**p_coeff)
+                self.coeff[2] / denom**2 +\
+                np.sum(a_coeff * w_col**p_coeff, axis=-1)
             return n_index
 
         def dispersion_retro(_):
@@ -448,9 +757,9 @@ class IndexFormulaContainer:
 
     def get_optical_index(self, wavelength):
         """
-        :param wavelength: (float)
+        :param wavelength: (float or numpy array of float)
                wavelength in mm
-        :return n: (float)
+        :return n: (float or numpy array of float)
                refractive index real part
 
         The refractiveindex.info database uses units of um
@@ -460,8 +769,10 @@ class IndexFormulaContainer:
         the pyrate wavelength in mm to fit the dispersion formulas.
         """
         wave_um = 1000 * wavelength  # wavelength in um
-        # TODO: this is an if statement in a time-critical place
-        if wave_um < self.waverange[0] or wave_um > self.waverange[1]:
+        # evaluated only once per wavelength due to the index cache of
+        # the materials (see IsotropicMaterial.get_cached_optical_index)
+        if np.any(wave_um < self.waverange[0]) or\
+                np.any(wave_um > self.waverange[1]):
             raise Exception("wavelength out of range")
 
         n_index = self.__dispersion_function(wave_um)
@@ -473,6 +784,9 @@ class CatalogMaterial(IsotropicMaterial):
     Provide isotropic material from database
     (refractiveindex.info)
     """
+
+    homogeneous = True
+
     @classmethod
     def p(cls, lc, ymldict, name="", comment=""):
         """
@@ -511,26 +825,62 @@ class CatalogMaterial(IsotropicMaterial):
         return n_index
 
     def initialize_from_annotations(self):
-        data = self.annotations["yml_dictionary"]["DATA"]
-
-        if len(data) > 2:
-            raise Exception("Max 2 entries for dispersion allowed - n and k.")
-
-        self.nk_table = []
-        for datafield in data:  # i=0 is n  ;  i=1 is k
-            dispersion_dict = datafield
-            typ = dispersion_dict["type"]
-            if dispersion_dict["type"].startswith("tabulated"):
-                coeff = dispersion_dict["data"].split("\n")[:-1]
-                coeff = [c.split() for c in coeff]
-                coeff = np.array(coeff, dtype=float)
-                rang = np.array([np.min(coeff[:, 0]), np.max(coeff[:, 0])])
-            else:
-                coeff = np.array(dispersion_dict["coefficients"].split(),
-                                 dtype=float)
-                rang = np.array(dispersion_dict["wavelength_range"].split(),
-                                dtype=float)
-            self.nk_table.append(IndexFormulaContainer(typ, coeff, rang))
+        self.nk_table = create_nk_table(self.annotations["yml_dictionary"])
+
+
+def create_nk_table(ymldict):
+    """
+    Creates the dispersion formulas of a refractiveindex.info page.
+
+    :param ymldict: (dict) page yml file contents
+
+    :return nk_table: (list of IndexFormulaContainer)
+    """
+    data = ymldict["DATA"]
+
+    if len(data) > 2:
+        raise Exception("Max 2 entries for dispersion allowed - n and k.")
+
+    nk_table = []
+    for datafield in data:  # i=0 is n  ;  i=1 is k
+        dispersion_dict = datafield
+        typ = dispersion_dict["type"]
+        if dispersion_dict["type"].startswith("tabulated"):
+            coeff = dispersion_dict["data"].split("\n")[:-1]
+            coeff = [c.split() for c in coeff]
+            coeff = np.array(coeff, dtype=float)
+            rang = np.array([np.min(coeff[:, 0]), np.max(coeff[:, 0])])
+        else:
+            coeff = np.array(dispersion_dict["coefficients"].split(),
+                             dtype=float)
+            rang = np.array(dispersion_dict["wavelength_range"].split(),
+                            dtype=float)
+        nk_table.append(IndexFormulaContainer(typ, coeff, rang))
+    return nk_table
+
+
+def calc_nd_vd_pgf(ymldict):
+    """
+    Calculates nd, vd and PgF of a refractiveindex.info page.
+
+    :param ymldict: (dict) page yml file contents
+
+    :return (nd, vd, PgF) or None if the page does not provide a real
+            refractive index at the g, F, d and C lines
+    """
+    waves = np.array([gline, Fline, dline, Cline])
+    try:
+        n_index = sum([dispersion_function.get_optical_index(waves)
+                       for dispersion_function in create_nk_table(ymldict)])
+    except Exception:
+        # wavelength out of range, unsupported or broken formula
+        return None
+    (ng_index, nF_index, nd_index, nC_index) = np.real(
+        np.broadcast_to(n_index, (4,)))
+    if not np.all(np.isfinite(n_index)) or nF_index == nC_index:
+        return None
+    return (nd_index, (nd_index - 1.)/(nF_index - nC_index),
+            (ng_index - nF_index)/(nF_index - nC_index))
 
 
 if __name__ == "__main__":
@@ -33,23 +33,45 @@ from ..globalconstants import standard_wavelength
 from .material_isotropic import IsotropicMaterial
 
 
+# coefficients of the 4th order symplectic Forest-Ruth integrator
+forest_ruth_c = [1.0/(2.0*(2.0 - 2.0**(1./3.))),
+                 (1.0-2.0**(1./3.))/(2.0*(2.0 - 2.0**(1./3.))),
+                 (1.0-2.0**(1./3.))/(2.0*(2.0 - 2.0**(1./3.))),
+                 1.0/(2.0*(2.0 - 2.0**(1./3.)))]
+forest_ruth_d = [1.0/(2.0 - 2.0**(1./3.)),
+                 (-2.0**(1./3.))/((2.0 - 2.0**(1./3.))),
+                 1.0/(2.0 - 2.0**(1./3.)),
+                 0.0]
+
+
 class IsotropicGrinMaterial(IsotropicMaterial):
     """
     Implements a material with GRIN properties. They are
-    provided as Python functions
+    provided as Python functions.
+
+    The gradient of the refractive index is obtained from
+    a fused function returning (n, grad n) (ngrad_name), from
+    the three partial derivatives (dndx_name, dndy_name, dndz_name)
+    or, if none of them is given, by complex step differentiation
+    of the refractive index function. For the latter the refractive
+    index function has to be analytic, i.e. it must accept complex
+    positions and must not use abs, comparisons or conjugation.
     """
 
+    # step width of the complex step differentiation
+    complex_step = 1e-20
+
     @classmethod
     def p(cls, lc, mysource, nfun_name,
-          dndx_name, dndy_name, dndz_name, bnd_name,
-          parameterlist=None, name="", comment=""):
+          dndx_name=None, dndy_name=None, dndz_name=None, bnd_name=None,
+          parameterlist=None, name="", comment="", ngrad_name=None):
         # TODO: fun,dfdx, dfdy, dfdz functionobjects
         if parameterlist is None:
             parameterlist = []
         params = {}
-        for (name, value) in parameterlist:
-            params[name] = FloatOptimizableVariable(
-                FixedState(value), name=name)
+        for (param_name, value) in parameterlist:
+            params[param_name] = FloatOptimizableVariable(
+                FixedState(value), name=param_name)
 
         mygrinobj = cls({"comment": comment,
                          "ds": 0.1,
@@ -58,6 +80,7 @@ class IsotropicGrinMaterial(IsotropicMaterial):
                          "dfdx_name": dndx_name,
                          "dfdy_name": dndy_name,
                          "dfdz_name": dndz_name,
+                         "fgrad_name": ngrad_name,
                          "bnd_name": bnd_name,
                          "source": mysource
                          },
@@ -67,31 +90,58 @@ class IsotropicGrinMaterial(IsotropicMaterial):
         return mygrinobj
 
     def initialize_from_annotations(self):
-        (fname, dfdxname, dfdyname, dfdzname, bndname, mysource) =\
+        (fname, dfdxname, dfdyname, dfdzname, fgradname, bndname,
+         mysource) =\
         (self.annotations["f_name"],
          self.annotations["dfdx_name"],
          self.annotations["dfdy_name"],
          self.annotations["dfdz_name"],
+         self.annotations.get("fgrad_name", None),
          self.annotations["bnd_name"],
          self.annotations["source"])
 
         f_obj = FunctionObject(mysource)
         f_obj.generate_functions_from_source(
-            [fname, dfdxname, dfdyname, dfdzname, bndname])
+            [function_name for function_name in
+             [fname, dfdxname, dfdyname, dfdzname, fgradname, bndname]
+             if function_name is not None])
         self.nfunc = f_obj.functions[fname]
-        self.dndx = f_obj.functions[dfdxname]
-        self.dndy = f_obj.functions[dfdyname]
-        self.dndz = f_obj.functions[dfdzname]
-        self.boundaryfunction = f_obj.functions[bndname]
+        self.dndx = f_obj.functions.get(dfdxname, None)
+        self.dndy = f_obj.functions.get(dfdyname, None)
+        self.dndz = f_obj.functions.get(dfdzname, None)
+        self.nfunc_and_gradient = f_obj.functions.get(fgradname, None)
+        self.boundaryfunction = f_obj.functions.get(bndname, None)
 
-    def get_epsilon_tensor(self, x, wave=standard_wavelength):
-        (num_dims, num_pts) = np.shape(x)
-        mat = np.zeros((num_dims, num_dims, num_pts))
-        mat[0, 0, :] = 1.
-        mat[1, 1, :] = 1.
-        mat[2, 2, :] = 1.
+    def get_optical_index_and_gradient(self, x):
+        """
+        Returns refractive index and its gradient at positions x.
+
+        :param x: (3xN numpy array of float) positions
 
-        return mat*self.nfunc(x, **self.params)**2
+        :return (n, grad n): (N numpy array of float,
+                              3xN numpy array of float)
+        """
+        if self.nfunc_and_gradient is not None:
+            return self.nfunc_and_gradient(x, **self.params)
+        if self.dndx is not None and self.dndy is not None and\
+                self.dndz is not None:
+            return (self.nfunc(x, **self.params),
+                    np.array([self.dndx(x, **self.params),
+                              self.dndy(x, **self.params),
+                              self.dndz(x, **self.params)]))
+
+        # complex step differentiation: n(x + i h e_j) = n(x) + i h d_j n;
+        # all three directions are evaluated in one call
+        num_pts = np.shape(x)[1]
+        xcomplex = np.tile(x, 3).astype(complex)
+        for j in range(3):
+            xcomplex[j, j*num_pts:(j + 1)*num_pts] += 1j*self.complex_step
+        ncomplex = np.broadcast_to(self.nfunc(xcomplex, **self.params),
+                                   (3*num_pts,)).reshape((3, num_pts))
+        return (ncomplex[0].real, ncomplex.imag/self.complex_step)
+
+    def get_epsilon_tensor(self, x, wave=standard_wavelength):
+        return np.eye(3)[:, :, np.newaxis]*self.nfunc(x, **self.params)**2
 
     def get_optical_index(self, x, wave=standard_wavelength):
         return self.nfunc(x, **self.params)
@@ -100,120 +150,481 @@ class IsotropicGrinMaterial(IsotropicMaterial):
         """
         Returns True if boundary is hit
         """
+        if self.boundaryfunction is None:
+            return np.ones(np.shape(pos)[1], dtype=bool)
         return self.boundaryfunction(pos)
 
+    def symplectic_step(self, pos, vel, tau):
+        """
+        One 4th order symplectic (Forest-Ruth) step of the ray equations
+        dx/ds = 2 v, dv/ds = 2 n grad n with v = n dx/|dx|.
+
+        :param pos: (3xN numpy array of float) positions
+        :param vel: (3xN numpy array of float) optical direction cosines
+        :param tau: (N numpy array of float) step widths per ray
+
+        :return (pos, vel, optind) after the step; optind is the optical
+                index at the new positions
+        """
+        for (cvalue, dvalue) in zip(forest_ruth_c, forest_ruth_d):
+            pos = pos + tau*cvalue*2.0*vel
+            if dvalue != 0.0:
+                (optind, gradient) = self.get_optical_index_and_gradient(pos)
+                vel = vel + tau*dvalue*2.0*optind*gradient
+            else:
+                optind = self.nfunc(pos, **self.params)
+        return (pos, vel, optind*np.ones(np.shape(pos)[1]))
+
+    def distance_to_surface(self, pos, next_surface):
+        """
+        Signed z distance in the coordinate system of next_surface
+        between positions (in local material coordinates) and the
+        surface sag. Positive if the surface has been passed.
+        """
+        xshape = next_surface.shape.lc.returnGlobalToLocalPoints(
+            self.lc.returnLocalToGlobalPoints(pos))
+        return xshape[2] - next_surface.shape.getSag(xshape[0], xshape[1])
+
+    def refine_surface_crossing(self, pos, vel, tau, distance_start,
+                                distance_end, next_surface,
+                                step_function=None):
+        """
+        Locates the crossing of next_surface within one integration step
+        by a regula falsi (Illinois) iteration on the step width.
+
+        :param pos: (3xN numpy array of float) positions before the step
+        :param vel: (3xN numpy array of float) velocities before the step
+        :param tau: (N numpy array of float) step widths
+        :param distance_start: (N numpy array of float) distances to
+               surface before the step (negative)
+        :param distance_end: (N numpy array of float) distances to
+               surface after the step (positive)
+        :param step_function: (function) step_function(pos, vel, tau)
+               -> (pos, vel, optind); if None -> symplectic_step
+
+        :return (pos, vel, optind, distance) at the surface crossing
+        """
+        if step_function is None:
+            step_function = self.symplectic_step
+        tolerance = self.annotations.get("surfacetolerance", 1e-10)
+        max_iterations = self.annotations.get("maxrefinementsteps", 50)
+
+        (s_lo, f_lo) = (np.zeros_like(tau), 1.*distance_start)
+        (s_hi, f_hi) = (np.ones_like(tau), 1.*distance_end)
+        side = np.zeros(len(tau), dtype=int)
+
+        (pos_cross, vel_cross, optind_cross, distance_cross) =\
+            (np.zeros_like(pos), np.zeros_like(vel),
+             np.zeros_like(tau), np.zeros_like(tau))
+        todo = np.arange(len(tau))
+        for _ in range(max_iterations):
+            s_new = np.clip((s_lo[todo]*f_hi[todo] - s_hi[todo]*f_lo[todo]) /
+                            (f_hi[todo] - f_lo[todo]), 0., 1.)
+            (pos_new, vel_new, optind_new) = step_function(
+                pos[:, todo], vel[:, todo], s_new*tau[todo])
+            distance_new = self.distance_to_surface(pos_new, next_surface)
+
+            pos_cross[:, todo] = pos_new
+            vel_cross[:, todo] = vel_new
+            optind_cross[todo] = optind_new
+            distance_cross[todo] = distance_new
+
+            passed = distance_new > 0
+            # Illinois modification: halve the function value of the
+            # bracket end which was retained twice
+            upper = todo[passed]
+            f_lo[upper[side[upper] == 1]] *= 0.5
+            (s_hi[upper], f_hi[upper], side[upper]) =\
+                (s_new[passed], distance_new[passed], 1)
+            lower = todo[True ^ passed]
+            f_hi[lower[side[lower] == -1]] *= 0.5
+            (s_lo[lower], f_lo[lower], side[lower]) =\
+                (s_new[True ^ passed], distance_new[True ^ passed], -1)
+
+            todo = todo[np.abs(distance_new) > tolerance]
+            if len(todo) == 0:
+                break
+        return (pos_cross, vel_cross, optind_cross, distance_cross)
+
+    def append_steps(self, raybundle, pos, vel, optind, valid):
+        """
+        Appends integration positions to the ray bundle.
+        """
+        k0_value = 1.  # 2.*math.pi/raybundle.wave
+        newk = k0_value*vel/optind
+        efield_app = self.lc.returnLocalToGlobalDirections(
+            self.calc_e_field(pos, None, newk, wave=raybundle.wave))
+        kapp = self.lc.returnLocalToGlobalDirections(newk)
+        xapp = self.lc.returnLocalToGlobalPoints(pos)
+        raybundle.append(xapp, kapp, efield_app, np.copy(valid))
+
     def symplecticintegrator(self, raybundle, next_surface, tau):
         """
         Takes starting raybundle and integrates to next_surface
-        with step tau.
+        with initial step tau.
+
+        Only rays which did not reach next_surface are integrated.
+        The step width of every ray is controlled by its energy error
+        per step (annotations "energytolerance", "ds_min", "ds_max").
+        Rays are invalidated if their accumulated energy error
+        exceeds "energyviolation", if they leave the boundary or if
+        they need more than "maxsteps" steps. The crossing with
+        next_surface is located by root refinement within the last
+        step. If annotation "store_steps" is False, only the final
+        positions are appended to the raybundle.
         """
+        annotations = self.annotations
+        energyviolation = annotations["energyviolation"]
+        energy_tolerance = annotations.get("energytolerance",
+                                           1e-3*energyviolation)
+        tau_min = annotations.get("ds_min", 1e-3*tau)
+        tau_max = annotations.get("ds_max", 10.*tau)
+        max_steps = annotations.get("maxsteps", 100000)
+        store_steps = annotations.get("store_steps", True)
 
         startpoint = self.lc.returnGlobalToLocalPoints(raybundle.x[-1])
         startdirection = self.lc.returnGlobalToLocalDirections(
             raybundle.returnKtoD()[-1])
+        num_rays = startpoint.shape[1]
 
-        clist = [1.0/(2.0*(2.0 - 2.0**(1./3.))),
-                 (1.0-2.0**(1./3.))/(2.0*(2.0 - 2.0**(1./3.))),
-                 (1.0-2.0**(1./3.))/(2.0*(2.0 - 2.0**(1./3.))),
-                 1.0/(2.0*(2.0 - 2.0**(1./3.)))]
-        dlist = [1.0/(2.0 - 2.0**(1./3.)),
-                 (-2.0**(1./3.))/((2.0 - 2.0**(1./3.))),
-                 1.0/(2.0 - 2.0**(1./3.)),
-                 0.0]
+        pos = 1.*startpoint
+        optind = self.nfunc(pos, **self.params)*np.ones(num_rays)
+        vel = optind*startdirection
+        taus = tau*np.ones(num_rays)
+        energy = np.zeros(num_rays)
+        distance = self.distance_to_surface(pos, next_surface)
 
-        optindstart = self.nfunc(startpoint, **self.params)
-        positions = [1.*startpoint]
-        velocities = [1.*optindstart*startdirection]
+        valid = np.array(raybundle.valid[-1], dtype=bool)
+        final = (True ^ valid) | (distance >= 0)
 
+        positions = [1.*pos]
+        velocities = [1.*vel]
         energies = []
 
         loopcount = 0
+        while not np.all(final):
+            loopcount += 1
+            active = np.flatnonzero(True ^ final)
+            if loopcount > max_steps:
+                self.warning("integration aborted after %d steps for %d rays"
+                             % (max_steps, len(active)))
+                valid[active] = False
+                break
+
+            steptaus = taus[active]
+            (newpos, newvel, newoptind) = self.symplectic_step(
+                pos[:, active], vel[:, active], steptaus)
+            newenergy = np.sum(newvel**2, axis=0) - newoptind**2
+            steperror = np.abs(newenergy - energy[active])
+
+            # step width control; steps with too large energy error are
+            # repeated with smaller step width
+            factor = np.clip(0.9*(energy_tolerance /
+                                  np.maximum(steperror, 1e-300))**0.2,
+                             0.2, 2.0)
+            taus[active] = np.clip(steptaus*factor, tau_min, tau_max)
+            accepted = (steperror <= energy_tolerance) | (steptaus <= tau_min)
+            if not np.any(accepted):
+                continue
+
+            active = active[accepted]
+            (newpos, newvel, newoptind, newenergy, steptaus) =\
+                (newpos[:, accepted], newvel[:, accepted],
+                 newoptind[accepted], newenergy[accepted], steptaus[accepted])
+            newdistance = self.distance_to_surface(newpos, next_surface)
+
+            passed = newdistance > 0
+            # has ray reached next surface? if yes: locate crossing
+            # and mark as final
+            if np.any(passed):
+                (newpos[:, passed], newvel[:, passed], newoptind[passed],
+                 newdistance[passed]) = self.refine_surface_crossing(
+                     pos[:, active[passed]], vel[:, active[passed]],
+                     steptaus[passed], distance[active[passed]],
+                     newdistance[passed], next_surface)
+                newenergy[passed] = np.sum(newvel[:, passed]**2, axis=0) -\
+                    newoptind[passed]**2
+                final[active[passed]] = True
+
+            pos[:, active] = newpos
+            vel[:, active] = newvel
+            optind[active] = newoptind
+            energy[active] = newenergy
+            distance[active] = newdistance
+
+            # testing for some critical energyviolation;
+            # rays with energy violation are not useful due to
+            # integration errors
+            violated = np.abs(newenergy) > energyviolation
+            if np.any(violated):
+                self.warning("%d rays invalidated due to energy violation > "
+                             % (np.sum(violated),) + str(energyviolation))
+                self.warning('Please reduce integration step size.')
 
-        valid = np.ones_like(startpoint[0], dtype=bool)
-        final = np.zeros_like(startpoint[0], dtype=bool)
+            # has ray hit boundary? mark as invalid
+            invalid = active[violated | (True ^ self.in_boundary(newpos))]
+            valid[invalid] = False
+            final[invalid] = True
 
-        updatedpos = startpoint
-        updatedvel = velocities[-1]
+            self.debug("step(" + str(loopcount) + ") -> " +
+                       "active rays: " + str(len(active)) +
+                       " max energy conservation violation: " +
+                       str(np.max(np.abs(newenergy))))
 
-        while not np.all(final):
+            energies.append(1.*energy)
+            if store_steps:
+                positions.append(1.*pos)
+                velocities.append(1.*vel)
+                self.append_steps(raybundle, pos, vel, optind, valid)
 
-            loopcount += 1
-            lastpos = positions[-1]
-            lastvel = velocities[-1]
+        if not store_steps:
+            positions.append(1.*pos)
+            velocities.append(1.*vel)
+            self.append_steps(raybundle, pos, vel, optind, valid)
 
-            for (cvalue, dvalue) in zip(clist, dlist):
-                newpos = lastpos + tau*cvalue*2.0*lastvel
-                newvel = lastvel
+        return (positions, velocities, energies, valid)
 
-                optin = self.nfunc(newpos, **self.params)
+    def propagate(self, raybundle, next_surface):
 
-                newvel = newvel + tau*dvalue*2.0*optin*np.array( \
-                 [self.dndx(newpos, **self.params),
-                  self.dndy(newpos, **self.params),
-                  self.dndz(newpos, **self.params)])
+        self.symplecticintegrator(raybundle, next_surface,
+                                  self.annotations["ds"])
 
-                lastpos = newpos
-                lastvel = newvel
+        next_surface.intersect(raybundle)
 
-            positions.append(newpos)
-            velocities.append(newvel)
 
-            # validity and finalization check
+class AnalyticGrinMaterial(IsotropicGrinMaterial):
+    """
+    Base class for GRIN profiles with closed-form ray paths.
+    propagate jumps along the analytic path to the next surface
+    and only solves for the surface crossing. If annotation
+    "analytic" is False, the symplectic integrator of
+    IsotropicGrinMaterial is used instead, e.g. for validation.
+
+    Derived classes provide the profile as source code (nfunc,
+    ngrad) and the closed-form solution in analytic_step.
+    """
 
-            totalenergy = np.sum(newvel**2) - np.sum(optin**2)
+    profile_source = ""
 
-            # testing for some critical energyviolation
-            # and invalidate all rays
+    @classmethod
+    def p(cls, lc, parameterlist, radius=None, name="", comment=""):
+        """
+        :param lc: (LocalCoordinates) the profile axis is the local z axis
+        :param parameterlist: (list of (str, float)) profile parameters
+        :param radius: (float or None) radius of the rod; rays outside
+                       are invalid
+        """
+        if radius is None:
+            boundary_source = """
 
-            if abs(totalenergy) > self.annotations["energyviolation"]:
-                self.warning('integration aborted due to energy violation: ' +
-                             'abs(' + str(totalenergy) + ') > ' +
-                             str(self.annotations["energyviolation"]))
-                self.warning('Please reduce integration step size.')
-                valid[:] = False
-                # all rays with energy violation are not useful due to
-                # integration errors
+def bnd(x):
+    return np.ones(np.shape(x)[1], dtype=bool)
+"""
+        else:
+            boundary_source = """
+
+def bnd(x):
+    return x[0]**2 + x[1]**2 < %r**2
+""" % (float(radius),)
+        mygrinobj = super(AnalyticGrinMaterial, cls).p(
+            lc, cls.profile_source + boundary_source, "nfunc",
+            bnd_name="bnd", parameterlist=parameterlist, name=name,
+            comment=comment, ngrad_name="ngrad")
+        mygrinobj.annotations["analytic"] = True
+        return mygrinobj
 
-            self.debug("step(" + str(loopcount) + ") -> " +
-                       "energy conservation violation: " + str(totalenergy))
+    def analytic_step(self, pos, vel, tau):
+        """
+        Closed-form solution of the ray equations
+        dx/ds = 2 v, dv/ds = 2 n grad n for parameter widths tau.
+        Same signature as symplectic_step.
+        """
+        raise NotImplementedError()
 
-            xglobalnewpos = self.lc.returnLocalToGlobalPoints(newpos)
-            xshape = next_surface.shape.lc.returnGlobalToLocalPoints(
-                xglobalnewpos)
+    def get_path_step(self, vel, distance):
+        """
+        Parameter widths per ray for the search of the surface
+        crossing. Rays advance by 2 v_z tau along the axis, so the
+        estimate is somewhat larger than the distance to the surface.
+        """
+        return np.maximum(1.2*np.maximum(-distance, 0.) /
+                          (2.*np.abs(vel[2]) + 1e-300),
+                          self.annotations["ds"])
 
-            final = (xshape[2] - next_surface.shape.getSag(
-                xshape[0], xshape[1]) > 0)
-            # has ray reached next surface? if yes: mark as final
+    def analyticpropagation(self, raybundle, next_surface):
+        """
+        Propagates raybundle along the closed-form ray paths to
+        next_surface. The path parameter is advanced by get_path_step
+        until the surface has been passed; then the crossing is
+        located by root refinement. Returns valid.
+        """
+        max_steps = self.annotations.get("maxsteps", 100000)
+        store_steps = self.annotations.get("store_steps", True)
 
-            valid[True ^ self.in_boundary(newpos)] = False
-            # has ray hit boundary? mark as invalid
+        startpoint = self.lc.returnGlobalToLocalPoints(raybundle.x[-1])
+        startdirection = self.lc.returnGlobalToLocalDirections(
+            raybundle.returnKtoD()[-1])
+        num_rays = startpoint.shape[1]
 
-            final[True ^ valid] += True
-            # all non valid rays are also final
+        pos = 1.*startpoint
+        optind = self.nfunc(pos, **self.params)*np.ones(num_rays)
+        vel = optind*startdirection
+        distance = self.distance_to_surface(pos, next_surface)
 
-            updatedpos[:, True ^ final] = newpos[:, True ^ final]
-            updatedvel[:, True ^ final] = newvel[:, True ^ final]
+        valid = np.array(raybundle.valid[-1], dtype=bool)
+        final = (True ^ valid) | (distance >= 0)
 
-            k0_value = 1.  # 2.*math.pi/raybundle.wave
-            newk = k0_value*updatedvel/self.nfunc(updatedpos, **self.params)
-            efield_app = self.lc.returnLocalToGlobalDirections(
-                self.calc_e_field(newpos, None, newk, wave=raybundle.wave))
-            kapp = self.lc.returnLocalToGlobalDirections(newk)
-            xapp = self.lc.returnLocalToGlobalPoints(updatedpos)
+        loopcount = 0
+        while not np.all(final):
+            loopcount += 1
+            active = np.flatnonzero(True ^ final)
+            if loopcount > max_steps:
+                self.warning("propagation aborted after %d steps for %d rays"
+                             % (max_steps, len(active)))
+                valid[active] = False
+                break
+
+            steptaus = self.get_path_step(vel[:, active], distance[active])
+            (newpos, newvel, newoptind) = self.analytic_step(
+                pos[:, active], vel[:, active], steptaus)
+            newdistance = self.distance_to_surface(newpos, next_surface)
+
+            passed = newdistance > 0
+            if np.any(passed):
+                (newpos[:, passed], newvel[:, passed], newoptind[passed],
+                 newdistance[passed]) = self.refine_surface_crossing(
+                     pos[:, active[passed]], vel[:, active[passed]],
+                     steptaus[passed], distance[active[passed]],
+                     newdistance[passed], next_surface,
+                     step_function=self.analytic_step)
+                final[active[passed]] = True
+
+            pos[:, active] = newpos
+            vel[:, active] = newvel
+            optind[active] = newoptind
+            distance[active] = newdistance
+
+            invalid = active[True ^ self.in_boundary(newpos)]
+            valid[invalid] = False
+            final[invalid] = True
+
+            if store_steps:
+                self.append_steps(raybundle, pos, vel, optind, valid)
+
+        if not store_steps or loopcount == 0:
+            self.append_steps(raybundle, pos, vel, optind, valid)
+
+        return valid
 
-            raybundle.append(xapp, kapp, efield_app, valid)
-            # TODO: if pathlength of a certain ray is too long,
-            # mark as invalid and final
+    def propagate(self, raybundle, next_surface):
+        if self.annotations.get("analytic", True):
+            self.analyticpropagation(raybundle, next_surface)
+            next_surface.intersect(raybundle)
+        else:
+            super(AnalyticGrinMaterial, self).propagate(raybundle,
+                                                        next_surface)
 
-            # for energy and phase space analysis
 
-            energies.append(totalenergy)
+class SelfocGrinMaterial(AnalyticGrinMaterial):
+    """
+    Radial GRIN rod (Selfoc type) with
+    n(r)**2 = n0**2 (1 - g**2 r**2), r**2 = x**2 + y**2.
+    The ray paths are sinusoidal with pitch length 2 pi/g along
+    the axis for paraxial rays.
+    """
 
-        return (positions, velocities, energies, valid)
+    profile_source = """
+import numpy as np
 
-    def propagate(self, raybundle, next_surface):
 
-        self.symplecticintegrator(raybundle, next_surface,
-                                  self.annotations["ds"])
+def nfunc(x, n0, g, **kw):
+    return n0()*np.sqrt(1. - g()**2*(x[0]**2 + x[1]**2))
 
-        next_surface.intersect(raybundle)
+
+def ngrad(x, n0, g, **kw):
+    optind = nfunc(x, n0, g)
+    gradient = np.zeros_like(x)
+    gradient[0] = -n0()**2*g()**2*x[0]/optind
+    gradient[1] = -n0()**2*g()**2*x[1]/optind
+    return (optind, gradient)
+"""
+
+    @classmethod
+    def p(cls, lc, n0=1.6, g=0.3, radius=None, name="", comment=""):
+        """
+        :param n0: (float) index on axis
+        :param g: (float) gradient constant in 1/mm
+        """
+        return super(SelfocGrinMaterial, cls).p(
+            lc, [("n0", n0), ("g", g)], radius=radius, name=name,
+            comment=comment)
+
+    def analytic_step(self, pos, vel, tau):
+        # harmonic oscillator d^2 x/ds^2 = -omega**2 x in x and y
+        omega = 2.*self.params["n0"]()*self.params["g"]()
+        cos_omega_tau = np.cos(omega*tau)
+        sin_omega_tau = np.sin(omega*tau)
+        newpos = np.zeros_like(pos)
+        newvel = np.zeros_like(vel)
+        newpos[:2] = pos[:2]*cos_omega_tau + 2.*vel[:2]/omega*sin_omega_tau
+        newvel[:2] = vel[:2]*cos_omega_tau - 0.5*omega*pos[:2]*sin_omega_tau
+        newpos[2] = pos[2] + 2.*vel[2]*tau
+        newvel[2] = vel[2]
+        return (newpos, newvel, self.nfunc(newpos, **self.params))
+
+    def get_path_step(self, vel, distance):
+        # at most a quarter period to see every surface crossing
+        omega = 2.*self.params["n0"]()*self.params["g"]()
+        return np.minimum(
+            super(SelfocGrinMaterial, self).get_path_step(vel, distance),
+            0.5*np.pi/omega)
+
+
+class AxialLinearGrinMaterial(AnalyticGrinMaterial):
+    """
+    Axial GRIN with n(z) = n0 + a z.
+    The ray paths are hyperbolic functions of the path parameter.
+    """
+
+    profile_source = """
+import numpy as np
+
+
+def nfunc(x, n0, a, **kw):
+    return n0() + a()*x[2]
+
+
+def ngrad(x, n0, a, **kw):
+    gradient = np.zeros_like(x)
+    gradient[2] = a()
+    return (nfunc(x, n0, a), gradient)
+"""
+
+    @classmethod
+    def p(cls, lc, n0=1.6, a=-0.01, radius=None, name="", comment=""):
+        """
+        :param n0: (float) index at z = 0
+        :param a: (float) index gradient in 1/mm
+        """
+        return super(AxialLinearGrinMaterial, cls).p(
+            lc, [("n0", n0), ("a", a)], radius=radius, name=name,
+            comment=comment)
+
+    def analytic_step(self, pos, vel, tau):
+        # u = n(z) obeys d^2 u/ds^2 = 4 a**2 u
+        n0_value = self.params["n0"]()
+        a_value = self.params["a"]()
+        optind = n0_value + a_value*pos[2]
+        w_value = 2.*a_value*tau
+        small = np.abs(w_value) < 1e-6
+        w_safe = np.where(small, 1., w_value)
+        # (cosh(w) - 1)/w and sinh(w)/w without cancellation for small w
+        coshm1_w = np.where(small, 0.5*w_value, (np.cosh(w_safe) - 1.)/w_safe)
+        sinh_w = np.where(small, 1. + w_value**2/6., np.sinh(w_safe)/w_safe)
+        newpos = np.zeros_like(pos)
+        newvel = np.zeros_like(vel)
+        newpos[:2] = pos[:2] + 2.*vel[:2]*tau
+        newvel[:2] = vel[:2]
+        newpos[2] = pos[2] + 2.*tau*(optind*coshm1_w + vel[2]*sinh_w)
+        newvel[2] = optind*np.sinh(w_value) + vel[2]*np.cosh(w_value)
+        return (newpos, newvel, self.nfunc(newpos, **self.params))
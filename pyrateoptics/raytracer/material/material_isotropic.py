@@ -24,11 +24,14 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
+from collections import OrderedDict
+
 import numpy as np
 
-from ...core.optimizable_variable import FloatOptimizableVariable, FixedState
+from ...core.optimizable_variable import OptimizableVariable,\
+    FloatOptimizableVariable, FixedState
 
-from ..ray import RayBundle
+from ..ray import RayBundle, selectWave, selectWaveGroups
 from ..helpers_math import checkfinite
 from ..globalconstants import standard_wavelength
 
@@ -41,25 +44,31 @@ class IsotropicMaterial(MaxwellMaterial):
     to the Kronecker delta.
     """
 
+    # True if the optical index does not depend on the position
+    homogeneous = False
+
+    # maximal number of wavelengths in the optical index cache
+    # of homogeneous materials
+    index_cache_size = 16
+
     def setKind(self):
         self.kind = "isotropicmaterial"
 
     def get_epsilon_tensor(self, xpos, wave=standard_wavelength):
         """
         Get epsilon tensor proportional to Kronecker delta.
+        Constant (3x3x1) for homogeneous materials at one wavelength.
         """
-        (num_dims, num_pts) = np.shape(xpos)
-        mat = np.zeros((num_dims, num_dims, num_pts))
-        mat[0, 0, :] = 1.
-        mat[1, 1, :] = 1.
-        mat[2, 2, :] = 1.
-        return mat*self.get_isotropic_epsilon(xpos, wave=wave)
+        return np.eye(3)[:, :, np.newaxis] *\
+            self.get_isotropic_epsilon(xpos, wave=wave)
 
-    def get_isotropic_epsilon(self, xpos, wave=standard_wavelength):
+    def get_isotropic_epsilon(self, xpos, wave=standard_wavelength,
+                              wave_groups=None):
         """
         Epsilon = optical_index**2
         """
-        return self.get_optical_index(xpos, wave=wave)**2
+        return self.get_optical_index_per_ray(xpos, wave=wave,
+                                              wave_groups=wave_groups)**2
 
     def get_optical_index(self, xpos, wave):
         """
@@ -68,6 +77,100 @@ class IsotropicMaterial(MaxwellMaterial):
         """
         raise NotImplementedError()
 
+    def get_optical_index_per_ray(self, xpos, wave, wave_groups=None):
+        """
+        Get optical index for a scalar wavelength or for one wavelength
+        per ray (polychromatic raybundle). The dispersion is evaluated
+        once per unique wavelength and broadcast to the rays.
+
+        :param wave_groups (tuple or None) unique wavelengths and index
+               of the wavelength of each ray (see RayBundle.getWaveGroups);
+               if None -> evaluated from wave
+        """
+        # per ray wavelengths are always numpy arrays (see RayBundle);
+        # isinstance is much cheaper than np.ndim for scalars
+        per_ray = isinstance(wave, np.ndarray) and wave.ndim > 0
+        if per_ray and wave_groups is None:
+            wave_groups = np.unique(wave, return_inverse=True)
+        if self.homogeneous:
+            if not per_ray:
+                return self.get_cached_optical_index(wave)
+            (waves, inverse) = wave_groups
+            return self.get_cached_optical_indices(waves)[inverse]
+        if not per_ray:
+            return self.get_optical_index(xpos, wave)
+        (waves, inverse) = wave_groups
+        # wavelengths of removed rays may be left in wave_groups
+        masks = [inverse == num for num in range(len(waves))]
+        indices = [(mask, self.get_optical_index(xpos[:, mask], unique_wave))
+                   for (mask, unique_wave) in zip(masks, waves)
+                   if np.any(mask)]
+        result = np.zeros(len(inverse), dtype=np.result_type(
+            float, *[index for (_, index) in indices]))
+        for (mask, index) in indices:
+            result[mask] = index
+        return result
+
+    def get_index_parameters(self):
+        """
+        Values of the optimizable variables of this material,
+        e.g. the coefficients of a ModelGlass.
+        """
+        return tuple(sorted((key, value())
+                            for (key, value) in self.__dict__.items()
+                            if isinstance(value, OptimizableVariable)))
+
+    def get_index_cache(self):
+        """
+        Dict of optical indices per wavelength of a homogeneous material.
+        The cache is cleared whenever one of the optimizable variables of
+        the material changed (see get_index_parameters), e.g. during an
+        optimization. Changes of other objects keep the cache.
+        """
+        parameters = self.get_index_parameters()
+        # stored as tuple which is not part of the serialized structure
+        (cached_parameters, cache) = getattr(self, "_index_cache",
+                                             (None, None))
+        if cached_parameters != parameters:
+            cache = OrderedDict()
+            self._index_cache = (parameters, cache)
+        return cache
+
+    def get_cached_optical_index(self, wave):
+        """
+        Optical index of a homogeneous material for a scalar wavelength,
+        evaluated only once per wavelength.
+        """
+        cache = self.get_index_cache()
+        # float key: wave may also be a 0d numpy array (not hashable)
+        key = float(wave)
+        if key not in cache:
+            if len(cache) >= self.index_cache_size:
+                cache.popitem(last=False)
+            cache[key] = self.get_optical_index(None, wave)
+        return cache[key]
+
+    def get_cached_optical_indices(self, waves):
+        """
+        Optical indices of a homogeneous material for a 1d array of
+        wavelengths. Wavelengths which are not in the cache are
+        evaluated in one vectorized call of get_optical_index.
+        """
+        cache = self.get_index_cache()
+        waves = [float(wave) for wave in waves]
+        indices = dict([(wave, cache[wave]) for wave in waves
+                        if wave in cache])
+        missing = [wave for wave in waves if wave not in indices]
+        if missing:
+            indices.update(zip(missing, np.broadcast_to(
+                self.get_optical_index(None, np.array(missing)),
+                (len(missing),))))
+            for wave in missing:
+                if len(cache) >= self.index_cache_size:
+                    cache.popitem(last=False)
+                cache[wave] = indices[wave]
+        return np.array([indices[wave] for wave in waves])
+
     def calc_e_field(self, xpos, nvector, kvector,
                      wave=standard_wavelength):
         """
@@ -76,9 +179,53 @@ class IsotropicMaterial(MaxwellMaterial):
         # FIXME: Efield calculation wrong!
         # For polarization
         # you have to calc it correctly!
-        ey_vector = np.zeros_like(kvector)
-        ey_vector[1, :] = 1.
-        return np.cross(kvector, ey_vector, axisa=0, axisb=0).T
+        # k x e_y without the overhead of np.cross for small bundles
+        efield = np.zeros_like(kvector)
+        efield[0] = -kvector[2]
+        efield[2] = kvector[0]
+        return efield
+
+    def sortKnormUnitEField(self, x, kd, e, wave=standard_wavelength):
+        """
+        Isotropic specialization of
+        MaxwellMaterial.sortKnormUnitEField without eigenvalue problem:
+        k_norm = +-n kd/|kd| and two orthonormal E fields perpendicular
+        to k. The solutions are sorted ascending by <S, e> like in the
+        general case, i.e. the last two solutions fulfill <k, e> > 0.
+
+        :param x (3xN numpy array of float)
+        :param kd (3xN numpy array of complex) direction vector
+        :param e (3xN numpy array of float) sorting direction
+
+        :return (k_norm_4, Efield_4) (4x3xN arrays of complex)
+        """
+        num_pts = np.shape(kd)[1]
+        # <kd, kd> = 1 without conjugation like in the general case
+        kd = kd/np.sqrt(np.sum(kd*kd, axis=0))
+        optical_index = self.get_optical_index_per_ray(x, wave=wave) *\
+            np.ones(num_pts)
+        # <S, e> ~ <Re(k), e> for <k, E> = 0
+        forward = np.where(
+            np.sum(np.real(optical_index*kd)*np.real(e), axis=0) < 0.,
+            -1., 1.)
+
+        # E1 = ey x kd, or ex x kd for kd nearly parallel to ey
+        # E2 = kd x E1
+        efield_1 = np.zeros((3, num_pts), dtype=kd.dtype)
+        near_ey = np.abs(kd[1]) > 0.9
+        efield_1[0] = np.where(near_ey, 0., kd[2])
+        efield_1[1] = np.where(near_ey, -kd[2], 0.)
+        efield_1[2] = np.where(near_ey, kd[1], -kd[0])
+        efield_1 /= np.sqrt(np.sum(np.abs(efield_1)**2, axis=0))
+        efield_2 = np.cross(kd, efield_1, axis=0)
+        efield_2 /= np.sqrt(np.sum(np.abs(efield_2)**2, axis=0))
+
+        k_norm = forward*optical_index*kd
+        k_norm_4 = np.array([-k_norm, -k_norm, k_norm, k_norm],
+                            dtype=complex)
+        efield_4 = np.array([efield_1, efield_2, efield_1, efield_2],
+                            dtype=complex)
+        return (k_norm_4, efield_4)
 
     def calc_xi(self, xpos, normal, k_inplane,
                 wave=standard_wavelength):
@@ -87,7 +234,8 @@ class IsotropicMaterial(MaxwellMaterial):
         """
         return self.calc_xi_isotropic(xpos, normal, k_inplane, wave=wave)
 
-    def calc_xi_isotropic(self, x, n, k_inplane, wave=standard_wavelength):
+    def calc_xi_isotropic(self, x, n, k_inplane, wave=standard_wavelength,
+                          wave_groups=None):
         """
         Calculate normal component of k after refraction
         in isotropic materials.
@@ -96,13 +244,15 @@ class IsotropicMaterial(MaxwellMaterial):
                 normal of surface in local coordinates
         :param k_inplane (3xN numpy array of float)
                 incoming wave vector inplane component in local coordinates
+        :param wave_groups see get_optical_index_per_ray
 
         :return (xi, valid) tuple of (3x1 numpy array of complex,
                 3x1 numpy array of bool)
         """
 
         # k2_squared = 4.*math.pi**2 / wave**2 * self.get_isotropic_epsilon(x, wave=wave)
-        k2_squared = self.get_isotropic_epsilon(x, wave=wave)
+        k2_squared = self.get_isotropic_epsilon(x, wave=wave,
+                                                wave_groups=wave_groups)
 
         square = k2_squared - np.sum(k_inplane * k_inplane, axis=0)
 
@@ -127,10 +277,10 @@ class IsotropicMaterial(MaxwellMaterial):
 
         k_inplane = k1 - np.sum(k1 * normal, axis=0) * normal
 
-        (xi, valid_refraction) = self.calc_xi_isotropic(xlocal,
-                                                        normal,
-                                                        k_inplane,
-                                                        wave=raybundle.wave)
+        wave_groups = raybundle.getWaveGroups()
+        (xi, valid_refraction) = self.calc_xi_isotropic(
+            xlocal, normal, k_inplane, wave=raybundle.wave,
+            wave_groups=wave_groups)
 
         valid = raybundle.valid[-1] * valid_refraction * valid_normals
 
@@ -146,7 +296,9 @@ class IsotropicMaterial(MaxwellMaterial):
         Efield = self.calc_e_field(xlocal, normal, newk, wave=raybundle.wave)
 
         return (RayBundle(orig, newk, Efield, raybundle.rayID[valid],
-                          raybundle.wave),)
+                          selectWave(raybundle.wave, valid),
+                          power=raybundle.power[valid],
+                          wave_groups=selectWaveGroups(wave_groups, valid)),)
 
     def reflect(self, raybundle, actualSurface, splitup=False):
         """
@@ -164,10 +316,10 @@ class IsotropicMaterial(MaxwellMaterial):
 
         k_inplane = k1 - np.sum(k1 * normal, axis=0) * normal
 
-        (xi, valid_refraction) = self.calc_xi_isotropic(xlocal,
-                                                        normal,
-                                                        k_inplane,
-                                                        wave=raybundle.wave)
+        wave_groups = raybundle.getWaveGroups()
+        (xi, valid_refraction) = self.calc_xi_isotropic(
+            xlocal, normal, k_inplane, wave=raybundle.wave,
+            wave_groups=wave_groups)
 
         valid = raybundle.valid[-1] * valid_refraction * valid_normals
 
@@ -183,7 +335,9 @@ class IsotropicMaterial(MaxwellMaterial):
         Efield = self.calc_e_field(xlocal, normal, newk, wave=raybundle.wave)
 
         return (RayBundle(orig, newk, Efield, raybundle.rayID[valid],
-                          raybundle.wave),)
+                          selectWave(raybundle.wave, valid),
+                          power=raybundle.power[valid],
+                          wave_groups=selectWaveGroups(wave_groups, valid)),)
 
     def propagate(self, raybundle, nextSurface):
 
@@ -201,6 +355,9 @@ class ConstantIndexGlass(IsotropicMaterial):
     """
     A simple glass defined by a single refractive index.
     """
+
+    homogeneous = True
+
     def setKind(self):
         self.kind = "constantindexglass"
 
@@ -222,6 +379,8 @@ class ModelGlass(IsotropicMaterial):
     could be matched to a glass catalog.
     """
 
+    homogeneous = True
+
     def setKind(self):
         self.kind = "modelglass"
 
@@ -28,7 +28,7 @@ import numpy as np
 
 from ...core.optimizable_variable import FloatOptimizableVariable, FixedState
 
-from ..ray import RayBundle
+from ..ray import RayBundle, selectWave, selectWaveGroups
 from .material_isotropic import IsotropicMaterial
 
 
@@ -52,10 +52,11 @@ class IsotropicMaterialTIR(IsotropicMaterial):
             raybundle.k[0, :, :]**2.0, axis=0))[None, ...])
 
         index_before = normk
+        wave_groups = raybundle.getWaveGroups()
         index_after = np.real(
-            self.get_optical_index(
-                np.zeros((3, 1)),
-                wave=raybundle.wave)) \
+            self.get_optical_index_per_ray(
+                np.zeros((3, normk.shape[1])),
+                wave=raybundle.wave, wave_groups=wave_groups)) \
             * np.ones(normk.shape)  # FIXME: 0 is not valid xposition!
 
         # positive, need ray pointing away from surface
@@ -115,13 +116,18 @@ class IsotropicMaterialTIR(IsotropicMaterial):
         Efield = self.calc_e_field(xlocal, normal, newk, wave=raybundle.wave)
 
         return (RayBundle(orig, newk, Efield, raybundle.rayID[valid],
-                          raybundle.wave), )
+                          selectWave(raybundle.wave, valid),
+                          power=raybundle.power[valid],
+                          wave_groups=selectWaveGroups(wave_groups, valid)), )
 
 
 class ConstantIndexGlassTIR(IsotropicMaterialTIR):
     """
     A simple glass defined by a single refractive index.
     """
+
+    homogeneous = True
+
     def setKind(self):
         self.kind = "constantindexglass"
 
@@ -28,8 +28,8 @@ from .localcoordinatestreebase import LocalCoordinatesTreeBase
 from .localcoordinates import LocalCoordinates
 from .ray import RayPath, RayBundle
 from .globalconstants import numerical_tolerance
+from ..core.optimizable_variable import notify_modification
 
-from copy import deepcopy
 
 import numpy as np
 
@@ -75,12 +75,14 @@ class OpticalElement(LocalCoordinatesTreeBase):
             raise Exception("surface coordinate system should be connected to OpticalElement root coordinate system")
         self.annotations["surf_mat_connection"][key] = (minusNmat_key,
                                                         plusNmat_key)
+        notify_modification()
 
     def changeMaterialsForSurface(self, key, materialkeys):
         (minusNmat_key, plusNmat_key) = materialkeys
         if key in self.annotations["surf_mat_connection"]:
             self.annotations["surf_mat_connection"][key] = (minusNmat_key,
                                                             plusNmat_key)
+            notify_modification()
 
     def getSurfaces(self):
         return self.surfaces
@@ -100,6 +102,7 @@ class OpticalElement(LocalCoordinatesTreeBase):
             if key not in self.materials:
                 self.materials[key] = material_object
                 self.materials[key].comment = comment
+                notify_modification()
             else:
                 self.warning("Material key " + str(key) + " already taken. Material will not be added.")
         else:
@@ -320,13 +323,33 @@ class OpticalElement(LocalCoordinatesTreeBase):
 
         return (pilotraypath, XYUVmatrices)
 
-    def seqtrace(self, raybundle, sequence, background_medium, splitup=False):
+    def seqtrace(self, raybundle, sequence, background_medium, splitup=False,
+                 keep_history=True, record=None, compaction_threshold=None):
+        """
+        Sequential trace of raybundle through the surfaces in sequence.
+
+        :param keep_history (bool) if False, the returned raypaths only
+                contain the final raybundle
+        :param record (collection of surface keys) raybundles leaving
+                these surfaces are kept in the recorded list of the
+                raypaths also if keep_history is False
+        :param compaction_threshold (float or None) if not None, rays
+                which became invalid at a surface are removed from the
+                raybundle before refraction as soon as their fraction
+                exceeds the threshold (see RayBundle.compact)
+
+        :return list of RayPath objects (more than one for splitting
+                materials)
+        """
 
         # FIXME: should depend on a list of RayPath
 
         current_material = background_medium
 
-        rpath = RayPath(raybundle)
+        if record is None:
+            record = ()
+
+        rpath = RayPath(raybundle, keep_history=keep_history)
         rpaths = [rpath]
 
         # surfoptions is intended to be a comma separated list
@@ -346,8 +369,10 @@ class OpticalElement(LocalCoordinatesTreeBase):
 
             # finalize current_bundles
             for rp in rpaths:
-                current_bundle = rp.raybundles[-1]
+                current_bundle = rp.getLastRayBundle()
                 current_material.propagate(current_bundle, current_surface)
+                if compaction_threshold is not None:
+                    current_bundle.compact(compaction_threshold)
 
             if refract_flag:
                 current_material = self.findoutWhichMaterial(mnmat,
@@ -360,18 +385,23 @@ class OpticalElement(LocalCoordinatesTreeBase):
                                            False: current_material.reflect}
 
             for rp in rpaths:
-                current_bundle = rp.raybundles[-1]
+                current_bundle = rp.getLastRayBundle()
                 raybundles = current_material_deflection[refract_flag](
                         current_bundle,
                         current_surface,
                         splitup=splitup)
 
                 for rb in raybundles[1:]:
-                    # if there are more than one return value, copy path
-                    rpathprime = deepcopy(rp)
+                    # if there are more than one return value, fork path
+                    # (shares the raybundles up to now)
+                    rpathprime = rp.fork()
                     rpathprime.appendRayBundle(rb)
+                    if surfkey in record:
+                        rpathprime.recordRayBundle(surfkey, rb)
                     rpaths_new.append(rpathprime)
                 rp.appendRayBundle(raybundles[0])
+                if surfkey in record:
+                    rp.recordRayBundle(surfkey, raybundles[0])
 
             rpaths = rpaths + rpaths_new
 
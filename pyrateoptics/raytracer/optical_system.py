@@ -34,6 +34,8 @@ from .localcoordinates import LocalCoordinates
 from .localcoordinatestreebase import LocalCoordinatesTreeBase
 
 from .ray import RayPath
+from .trace_plan import TracePlan
+from ..core.optimizable_variable import notify_modification
 
 
 class OpticalSystem(LocalCoordinatesTreeBase):
@@ -69,22 +71,80 @@ class OpticalSystem(LocalCoordinatesTreeBase):
     def setKind(self):
         self.kind = "opticalsystem"
 
-    def seqtrace(self, initialbundle, elementsequence, splitup=False): # [("elem1", [1, 3, 4]), ("elem2", [1,4,4]), ("elem1", [4, 3, 1])]
-        rpath = RayPath(deepcopy(initialbundle))
+    def getTracePlan(self, elementsequence):
+        """
+        Returns compiled trace plan for elementsequence. The plan of the
+        last call is cached and reused if the sequence is the same.
+
+        :param elementsequence (list of (elementkey, surface sequence))
+
+        :return TracePlan object
+        """
+        plan = getattr(self, "_trace_plan", None)
+        if plan is None or plan.elementsequence != elementsequence:
+            plan = TracePlan(self, elementsequence,
+                             name=self.name + "_traceplan")
+            self._trace_plan = plan
+        return plan
+
+    def seqtrace(self, initialbundle, elementsequence, splitup=False,
+                 keep_history=True, record=None, use_trace_plan=False,
+                 compaction_threshold=None):
+        """
+        Sequential trace of initialbundle through the elements.
+
+        :param initialbundle (RayBundle object), not modified
+        :param elementsequence (list of (elementkey, surface sequence)),
+               e.g. [("elem1", [1, 3, 4]), ("elem2", [1,4,4]),
+                     ("elem1", [4, 3, 1])]
+        :param splitup (bool)
+        :param keep_history (bool) if False only the final raybundle is
+               kept in the raypaths, which keeps the memory consumption
+               independent of the number of surfaces (e.g. for merit
+               functions which only need the image surface)
+        :param record (collection of (elementkey, surfacekey)) raybundles
+               leaving these surfaces are always kept and can be
+               obtained by raypath.getRecordedRayBundles((elem, surf))
+        :param use_trace_plan (bool) trace with the cached compiled
+               plan (see getTracePlan) which reduces the overhead per
+               call for repeated traces of small raybundles
+        :param compaction_threshold (float or None) if not None, invalid
+               rays are removed as soon as their fraction in a raybundle
+               exceeds the threshold; rayID of the remaining rays refers
+               to initialbundle (see RayBundle.compact)
+
+        :return list of RayPath objects
+        """
+        if use_trace_plan:
+            return self.getTracePlan(elementsequence).seqtrace(
+                initialbundle, splitup=splitup, keep_history=keep_history,
+                record=record, compaction_threshold=compaction_threshold)
+
+        rpath = RayPath(deepcopy(initialbundle), keep_history=keep_history)
         # use copy of initialbundle to initialize rpath,
         # do not modify initialbundle
         rpaths = [rpath]
+        if record is None:
+            record = ()
         for (elem, subseq) in elementsequence:
             rpaths_new = []
+            record_elem = [surf for (e, surf) in record if e == elem]
 
             for rp in rpaths:
                 raypaths_to_append =\
-                    self.elements[elem].seqtrace(rp.raybundles[-1],
+                    self.elements[elem].seqtrace(rp.getLastRayBundle(),
                                                  subseq,
                                                  self.material_background,
-                                                 splitup=splitup)
+                                                 splitup=splitup,
+                                                 keep_history=keep_history,
+                                                 record=record_elem,
+                                                 compaction_threshold=(
+                                                     compaction_threshold))
+                for rp_append in raypaths_to_append:
+                    rp_append.recorded = [((elem, surf), rb) for (surf, rb)
+                                          in rp_append.recorded]
                 for rp_append in raypaths_to_append[1:]:
-                    rpathprime = deepcopy(rp)
+                    rpathprime = rp.fork()
                     rpathprime.appendRayPath(rp_append)
                     rpaths_new.append(rpathprime)
                 rp.appendRayPath(raypaths_to_append[0])
@@ -222,6 +282,7 @@ class OpticalSystem(LocalCoordinatesTreeBase):
         """
         if self.checkForRootConnection(element.rootcoordinatesystem):
             self.elements[key] = element
+            notify_modification()
         else:
             raise Exception("OpticalElement root should be connected to root of OpticalSystem")
 
@@ -234,6 +295,7 @@ class OpticalSystem(LocalCoordinatesTreeBase):
         # TODO: update of local coordinate references missing
         if key in self.elements:
             self.elements.pop(key)
+            notify_modification()
 
     def draw2d(self, ax, vertices=50, color="grey", inyzplane=True,
                do_not_draw_surfaces=[], **kwargs):
@@ -0,0 +1,337 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import multiprocessing
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, see ParallelTraceExecutor
+    shared_memory_import_failed = True
+else:
+    shared_memory_import_failed = False
+
+import numpy as np
+
+from ..core.log import BaseLogger
+from ..core.optimizable_variable import get_modification_count
+
+from .ray import RayBundle
+
+
+# optical system of the worker process; set once per process by
+# init_worker such that it is not transferred again for every shard
+_worker_opticalsystem = None
+
+
+def init_worker(opticalsystem):
+    """
+    Initializer of the worker processes.
+    """
+    global _worker_opticalsystem
+    _worker_opticalsystem = opticalsystem
+
+
+def fork_available():
+    """
+    True if worker processes can be started with the "fork" method,
+    which is not available e.g. on Windows.
+    """
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def trace_rays(opticalsystem, arrays, start, stop, elementsequence, wave,
+               use_trace_plan, compaction_threshold):
+    """
+    Traces the rays start:stop of the input arrays (x0, k0, Efield0,
+    power0, wave0) and writes their final state into the output arrays
+    (x, k, Efield, valid, power). If wave is None, the wavelengths of
+    the rays are taken from wave0.
+
+    :return number of rays in the final raybundle (int)
+    """
+    if wave is None:
+        wave = np.copy(arrays["wave0"][start:stop])
+    power = np.copy(arrays["power0"][start:stop])
+    initialbundle = RayBundle(arrays["x0"][:, start:stop],
+                              arrays["k0"][:, start:stop],
+                              arrays["Efield0"][:, start:stop],
+                              rayID=np.arange(start, stop), wave=wave,
+                              power=power)
+    rpath = opticalsystem.seqtrace(
+        initialbundle, elementsequence, keep_history=False,
+        use_trace_plan=use_trace_plan,
+        compaction_threshold=compaction_threshold)[0]
+    final = rpath.getLastRayBundle()
+    columns = final.rayID
+    # the final state is scattered via rayID, which is only unique
+    # if no ray was split (e.g. both modes of a birefringent material
+    # without splitup)
+    if len(np.unique(columns)) != len(columns):
+        raise ValueError("parallel trace does not support split rays: "
+                         "final raybundle contains %d rays for %d "
+                         "rayIDs" % (len(columns),
+                                     len(np.unique(columns))))
+    arrays["x"][:, columns] = final.x[-1]
+    arrays["k"][:, columns] = final.k[-1]
+    arrays["Efield"][:, columns] = final.Efield[-1]
+    arrays["valid"][columns] = final.valid[-1]
+    arrays["power"][columns] = final.power
+    return len(columns)
+
+
+def trace_shard(buffer_spec, start, stop, elementsequence, wave,
+                use_trace_plan, compaction_threshold):
+    """
+    Traces the rays start:stop of the shared input buffers in a worker
+    process and writes their final state into the shared output buffers
+    (see trace_rays).
+
+    :return number of rays in the final raybundle (int)
+    """
+    buffers = SharedRayBuffers(*buffer_spec)
+    try:
+        num_final = trace_rays(_worker_opticalsystem, buffers.arrays,
+                               start, stop, elementsequence, wave,
+                               use_trace_plan, compaction_threshold)
+    finally:
+        buffers.close()
+    return num_final
+
+
+class SharedRayBuffers(object):
+    """
+    Named numpy arrays in multiprocessing.shared_memory blocks, which
+    can be attached by other processes via their block names.
+    """
+
+    def __init__(self, layout, names=None):
+        """
+        :param layout (list of (key, shape, dtype string))
+        :param names (list of str) names of existing blocks to attach;
+               if None -> create new blocks
+        """
+        self.layout = layout
+        self.blocks = []
+        self.arrays = {}
+        for (num, (key, shape, dtype)) in enumerate(layout):
+            if names is None:
+                nbytes = int(np.prod(shape))*np.dtype(dtype).itemsize
+                block = shared_memory.SharedMemory(create=True,
+                                                   size=max(nbytes, 1))
+            else:
+                block = shared_memory.SharedMemory(name=names[num])
+            self.blocks.append(block)
+            self.arrays[key] = np.ndarray(shape, dtype=dtype,
+                                          buffer=block.buf)
+
+    def getSpec(self):
+        """
+        Picklable description to attach the blocks in another process.
+        """
+        return (self.layout, [block.name for block in self.blocks])
+
+    def close(self):
+        """
+        Releases the arrays and detaches from the blocks.
+        """
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+
+    def unlink(self):
+        """
+        Closes and frees the blocks. Only call in the creating process.
+        """
+        self.close()
+        for block in self.blocks:
+            block.unlink()
+        self.blocks = []
+
+
+class ParallelTraceExecutor(BaseLogger):
+    """
+    Sequential raytracing of large raybundles distributed over several
+    processes.
+
+    The initial raybundle is split into shards of consecutive rays which
+    are traced by a pool of worker processes. Rays and final states are
+    exchanged via shared memory, so only the shard boundaries are sent
+    to the workers. Each worker holds its own copy of the optical
+    system, which is transferred once at the start of the pool (and
+    again after the system was changed, see notify_modification), and
+    keeps its trace plan between calls.
+
+    The pool is started with the "fork" method, where the system is
+    inherited by the workers. Optical systems are in general not
+    picklable, so without "fork" (e.g. on Windows) the rays are traced
+    serially in the calling process with the same result.
+
+    Requires Python 3.8 or later (multiprocessing.shared_memory).
+    """
+
+    def __init__(self, opticalsystem, num_workers=None, num_shards=None,
+                 name=""):
+        """
+        :param opticalsystem (OpticalSystem object)
+        :param num_workers (int) number of processes;
+               if None -> number of CPUs
+        :param num_shards (int) number of shards per trace;
+               if None -> num_workers
+        """
+        super(ParallelTraceExecutor, self).__init__(name=name)
+        if shared_memory_import_failed:
+            raise RuntimeError("ParallelTraceExecutor requires Python 3.8 "
+                               "or later (multiprocessing.shared_memory)")
+        self.opticalsystem = opticalsystem
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        self.num_workers = num_workers
+        if num_shards is None:
+            num_shards = num_workers
+        self.num_shards = num_shards
+        self.pool = None
+        self.modification_count = None
+
+    def setKind(self):
+        self.kind = "parallel_trace_executor"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def startPool(self):
+        """
+        Starts worker processes with a copy of the current system.
+        """
+        self.shutdown()
+        # the system is inherited by the workers, see class docstring
+        context = multiprocessing.get_context("fork")
+        self.debug("starting %d worker processes" % (self.num_workers,))
+        self.pool = ProcessPoolExecutor(max_workers=self.num_workers,
+                                        mp_context=context,
+                                        initializer=init_worker,
+                                        initargs=(self.opticalsystem,))
+        self.modification_count = get_modification_count()
+
+    def shutdown(self):
+        """
+        Stops the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def seqtrace(self, initialbundle, elementsequence, use_trace_plan=False,
+                 compaction_threshold=None):
+        """
+        Sequential trace of initialbundle through the elements without
+        splitting. Raises ValueError if rays were split on the way (more
+        than one final ray per rayID, e.g. birefringent materials).
+        The final state is the same as the one of
+        opticalsystem.seqtrace(initialbundle, elementsequence,
+        keep_history=False, use_trace_plan=use_trace_plan).
+
+        :param initialbundle (RayBundle object), not modified
+        :param elementsequence (list of (elementkey, surface sequence))
+        :param use_trace_plan (bool) see OpticalSystem.seqtrace
+        :param compaction_threshold (float or None)
+               see OpticalSystem.seqtrace
+
+        :return final raybundle (RayBundle object) with one point per
+                ray of initialbundle in the same order. Rays which were
+                removed during the trace are invalid with nan values.
+        """
+        parallel = fork_available()
+        if parallel and (self.pool is None or
+                         self.modification_count != get_modification_count()):
+            self.startPool()
+
+        num_rays = len(initialbundle.rayID)
+        layout = [("x0", (3, num_rays), "float64"),
+                  ("k0", (3, num_rays), initialbundle.k.dtype.str),
+                  ("Efield0", (3, num_rays), initialbundle.Efield.dtype.str),
+                  ("power0", (num_rays,), "float64"),
+                  ("wave0", (num_rays,), "float64"),
+                  ("x", (3, num_rays), "float64"),
+                  ("k", (3, num_rays), "complex128"),
+                  ("Efield", (3, num_rays), "complex128"),
+                  ("valid", (num_rays,), "bool"),
+                  ("power", (num_rays,), "float64")]
+        if parallel:
+            buffers = SharedRayBuffers(layout)
+            arrays = buffers.arrays
+        else:
+            self.debug("fork not available: tracing serially")
+            buffers = None
+            arrays = dict([(key, np.empty(shape, dtype=dtype))
+                           for (key, shape, dtype) in layout])
+        try:
+            arrays["x0"][:] = initialbundle.x[-1]
+            arrays["k0"][:] = initialbundle.k[-1]
+            arrays["Efield0"][:] = initialbundle.Efield[-1]
+            arrays["power0"][:] = initialbundle.power
+            arrays["wave0"][:] = initialbundle.wave
+            # scalar wavelengths are sent directly to the workers
+            wave = initialbundle.wave if np.ndim(initialbundle.wave) == 0\
+                else None
+            for key in ("x", "k", "Efield", "power"):
+                arrays[key][:] = np.nan
+            arrays["valid"][:] = False
+
+            if parallel:
+                bounds = np.linspace(
+                    0, num_rays, min(self.num_shards, max(num_rays, 1)) + 1)
+                bounds = bounds.astype(int)
+                futures = [self.pool.submit(trace_shard, buffers.getSpec(),
+                                            start, stop, elementsequence,
+                                            wave, use_trace_plan,
+                                            compaction_threshold)
+                           for (start, stop)
+                           in zip(bounds[:-1], bounds[1:])]
+                num_final = sum([future.result() for future in futures])
+            else:
+                num_final = trace_rays(self.opticalsystem, arrays, 0,
+                                       num_rays, elementsequence, wave,
+                                       use_trace_plan, compaction_threshold)
+            self.debug("%d of %d rays traced to the end" %
+                       (num_final, num_rays))
+
+            (k, Efield) = [arrays[key] if np.any(arrays[key].imag)
+                           else arrays[key].real
+                           for key in ("k", "Efield")]
+            final = RayBundle(arrays["x"], k, Efield,
+                              rayID=np.copy(initialbundle.rayID),
+                              wave=initialbundle.wave,
+                              power=np.copy(arrays["power"]))
+            final.valid = np.copy(arrays["valid"])[np.newaxis]
+            del arrays, k, Efield
+        finally:
+            if buffers is not None:
+                buffers.unlink()
+        return final
@@ -30,9 +30,78 @@ import math
 from .globalconstants import standard_wavelength, canonical_ex, canonical_ey
 
 
+class RayHistory(object):
+    """
+    Preallocated storage for the history of one ray quantity
+    (positions, wave vectors, E-fields or validity).
+
+    The entries live in one (capacity, ...) block which is doubled
+    whenever it runs full. Appending is therefore amortized O(N)
+    instead of copying the whole history like np.vstack does.
+    """
+
+    def __init__(self, first, capacity=2):
+        """
+        :param first (numpy array) first entry of the history
+        :param capacity (int) number of preallocated entries
+        """
+        first = np.asarray(first)
+        self.data = np.empty((max(capacity, 1),) + np.shape(first),
+                             dtype=first.dtype)
+        self.data[0] = first
+        self.length = 1
+
+    def view(self):
+        """
+        Returns the used part of the storage as (length, ...) view.
+        Modifications of the view change the history.
+        """
+        return self.data[:self.length]
+
+    def assign(self, history):
+        """
+        Replaces the whole history by an array of shape (length, ...).
+        """
+        self.data = np.asarray(history)
+        self.length = np.shape(self.data)[0]
+
+    def reserve(self, capacity, dtype=None):
+        """
+        Reallocates the storage such that capacity entries fit in.
+        """
+        if dtype is None:
+            dtype = self.data.dtype
+        newdata = np.empty((capacity,) + self.data.shape[1:], dtype=dtype)
+        newdata[:self.length] = self.data[:self.length]
+        self.data = newdata
+
+    def append(self, new):
+        """
+        Appends one entry. Grows the storage by doubling if necessary
+        and promotes the dtype (e.g. float to complex) if required.
+        """
+        new = np.asarray(new)
+        dtype = np.result_type(self.data.dtype, new.dtype)
+        capacity = self.data.shape[0]
+        if self.length == capacity or dtype != self.data.dtype:
+            if self.length == capacity:
+                capacity *= 2
+            self.reserve(capacity, dtype=dtype)
+        self.data[self.length] = new
+        self.length += 1
+
+    def compress(self, mask):
+        """
+        Keeps only the rays (last axis) for which mask is True.
+
+        :param mask (1d numpy array of bool)
+        """
+        self.data = self.data[..., mask]
+
+
 class RayBundle(object):
     def __init__(self, x0, k0, Efield0, rayID=None, wave=standard_wavelength,
-                 splitted=False):
+                 splitted=False, capacity=2, power=None, wave_groups=None):
         """
         Class representing a bundle of rays.
 
@@ -45,8 +114,23 @@ class RayBundle(object):
         :param rayID: (1d numpy array of int)
                     Set an ID number for each ray in the bundle;
                     if empty -> generate arange
-        :param wave: (float)
-                    Wavelength of the radiation in millimeters.
+        :param wave: (float or 1d numpy array of float)
+                    Wavelength of the radiation in millimeters;
+                    either one for all rays or one per ray
+                    (polychromatic raybundle).
+        :param capacity: (int)
+                    Number of history points preallocated. Start point
+                    and intersection with the next surface fit into the
+                    default; longer histories (e.g. GRIN) grow by doubling.
+        :param power: (1d numpy array of float)
+                    Power of each ray relative to its initial power;
+                    if None -> ones. Decreases at splitting surfaces.
+        :param wave_groups: (tuple of 1d numpy arrays or None)
+                    Unique wavelengths and the index of the wavelength
+                    of each ray for one wavelength per ray, e.g. taken
+                    over from the raybundle this one was created from
+                    (see selectWaveGroups); if None -> evaluated on
+                    first use (see getWaveGroups).
         """
         self.splitted = splitted
         numray = np.shape(x0)[1]
@@ -54,24 +138,68 @@ class RayBundle(object):
             rayID = np.arange(numray)
         self.rayID = rayID
 
-        newshape = self.newshape(np.shape(x0))
-
-        self.x = x0.reshape(newshape)
-        # First index counting index: x[0] == x0
         # shape(x): axis=0: counting axis
         # axis=1: vector components (xyz)
         # axis=2: ray number
+        # First index counting index: x[0] == x0
 
-        self.k = k0.reshape(newshape)
-
-        self.valid = np.ones((1, numray), dtype=bool)
+        self._x = RayHistory(x0, capacity)
+        self._k = RayHistory(k0, capacity)
+        self._valid = RayHistory(np.ones(numray, dtype=bool), capacity)
 
+        if np.ndim(wave) > 0:
+            wave = np.asarray(wave, dtype=float)
         self.wave = wave
+        self.wave_groups = wave_groups
         if Efield0 is None or len(Efield0) == 0:
-            self.Efield = np.zeros(newshape)
-            self.Efield[:, 1, :] = 1.
-        else:
-            self.Efield = Efield0.reshape(newshape)
+            Efield0 = np.zeros(np.shape(x0))
+            Efield0[1, :] = 1.
+        self._Efield = RayHistory(Efield0, capacity)
+
+        if power is None:
+            power = np.ones(numray)
+        self.power = np.asarray(power, dtype=float)
+
+        # geometry of the last intersection (see Shape.intersect)
+        self.intersection = None
+
+        # statistics about rays and branches which were pruned
+        # at the creation of this bundle due to low power
+        self.pruned_rays = 0
+        self.pruned_power = 0.
+        self.pruned_branches = 0
+
+    def getX(self):
+        return self._x.view()
+
+    def setX(self, x):
+        self._x.assign(x)
+
+    x = property(getX, setX)
+
+    def getK(self):
+        return self._k.view()
+
+    def setK(self, k):
+        self._k.assign(k)
+
+    k = property(getK, setK)
+
+    def getEfield(self):
+        return self._Efield.view()
+
+    def setEfield(self, Efield):
+        self._Efield.assign(Efield)
+
+    Efield = property(getEfield, setEfield)
+
+    def getValid(self):
+        return self._valid.view()
+
+    def setValid(self, valid):
+        self._valid.assign(valid)
+
+    valid = property(getValid, setValid)
 
     def newshape(self, shape2d):
         """
@@ -90,21 +218,81 @@ class RayBundle(object):
         :param Validnew (1d numpy array of bool)
 
         """
-        newshape = self.newshape(np.shape(xnew))
-        newshapev = (1, np.shape(Validnew)[0])
+        self._x.append(xnew)
+        self._k.append(knew)
+        self._Efield.append(Enew)
+        self._valid.append(self.valid[-1]*Validnew)
 
-        txnew = np.reshape(xnew, newshape)
-        tknew = np.reshape(knew, newshape)
-        tEnew = np.reshape(Enew, newshape)
-        tValidnew = np.reshape(self.valid[-1]*Validnew, newshapev)
+    def getInvalidFraction(self):
+        """
+        Fraction of rays which are invalid at the last point.
+        """
+        numray = len(self.rayID)
+        if numray == 0:
+            return 0.
+        return 1. - np.count_nonzero(self.valid[-1])/float(numray)
 
-        self.x      = np.vstack((self.x, txnew))
-        self.k      = np.vstack((self.k, tknew))
-        self.Efield = np.vstack((self.Efield, tEnew))
-        self.valid  = np.vstack((self.valid, tValidnew))
+    def compact(self, threshold=0.):
+        """
+        Removes rays which are invalid at the last point from the whole
+        history if their fraction exceeds threshold. Changes raybundle!
+        The remaining rays keep their rayID, such that results can be
+        mapped back to the initial rays (see scatterToInitialRays).
+
+        :param threshold (float) fraction of invalid rays in [0, 1)
+
+        :return number of removed rays (int)
+        """
+        if self.getInvalidFraction() <= threshold:
+            return 0
+        keep = np.copy(self.valid[-1])
+        for history in (self._x, self._k, self._Efield, self._valid):
+            history.compress(keep)
+        self.rayID = self.rayID[keep]
+        self.wave = selectWave(self.wave, keep)
+        self.wave_groups = selectWaveGroups(self.wave_groups, keep)
+        self.power = self.power[keep]
+        return len(keep) - np.count_nonzero(keep)
+
+    def getWaveGroups(self):
+        """
+        Unique wavelengths and the index of the wavelength of each ray,
+        such that wave == waves[inverse]. They are evaluated once and
+        passed on to the raybundles created from this one, so dispersion
+        is evaluated per unique wavelength without sorting the
+        wavelengths of all rays at every surface.
+
+        :return (waves, inverse) tuple of 1d numpy arrays or None for
+                one wavelength for all rays
+        """
+        if np.ndim(self.wave) == 0:
+            return None
+        if self.wave_groups is None:
+            self.wave_groups = np.unique(self.wave, return_inverse=True)
+        return self.wave_groups
+
+    def scatterToInitialRays(self, values, num_rays, fill_value=np.nan):
+        """
+        Maps values of the rays in this bundle back to the positions
+        of the rays in the initial raybundle via rayID, e.g. to obtain
+        results on the initial sampling grid after compaction.
+
+        :param values (numpy array) last axis belongs to the rays
+        :param num_rays (int) number of rays in the initial raybundle
+        :param fill_value value for rays which are not in this bundle
+
+        :return numpy array with last axis of length num_rays
+        """
+        values = np.asarray(values)
+        result = np.full(values.shape[:-1] + (num_rays,), fill_value,
+                         dtype=np.result_type(values.dtype,
+                                              np.asarray(fill_value).dtype))
+        result[..., self.rayID] = values
+        return result
 
     def clone(self):
-        result = RayBundle(self.x[0], self.k[0], self.Efield[0], self.rayID, self.wave)
+        result = RayBundle(self.x[0], self.k[0], self.Efield[0], self.rayID,
+                           self.wave, power=np.copy(self.power))
 
         result.x = np.copy(self.x)
         result.k = np.copy(self.k)
@@ -152,9 +340,43 @@ class RayBundle(object):
 
 
 
+    def setIntersectionRecord(self, record):
+        """
+        Attaches the intersection record of the last point.
+
+        :param record (IntersectionRecord object)
+        """
+        self.intersection = record
+
+    def getIntersectionRecord(self, shape, xglob=None):
+        """
+        Returns the attached intersection record if it was obtained for
+        shape at the last point of this raybundle (and at xglob, if given),
+        otherwise None.
+
+        :param shape (Shape object)
+        :param xglob (2d numpy 3xN array of float)
+
+        :return record (IntersectionRecord object or None)
+        """
+        record = self.intersection
+        if record is None or record.shape is not shape or\
+                record.num_points != len(self.x):
+            return None
+        if xglob is None:
+            xglob = self.x[-1]
+        if np.shape(record.xglobal) != np.shape(xglob) or\
+                not np.array_equal(record.xglobal, xglob):
+            return None
+        return record
+
     def getLocalSurfaceNormal(self, surface, material, xglob):
-        xlocshape = surface.shape.lc.returnGlobalToLocalPoints(xglob)
-        nlocshape = surface.shape.getNormal(xlocshape[0], xlocshape[1])
+        record = self.getIntersectionRecord(surface.shape, xglob)
+        if record is None:
+            xlocshape = surface.shape.lc.returnGlobalToLocalPoints(xglob)
+            nlocshape = surface.shape.getNormal(xlocshape[0], xlocshape[1])
+        else:
+            nlocshape = record.normal
         nlocmat = material.lc.returnOtherToActualDirections(nlocshape,
                                                             surface.shape.lc)
         return nlocmat
@@ -202,17 +424,108 @@ class RayBundle(object):
 
 class RayPath(object):
 
-    def __init__(self, initialraybundle=None):
+    def __init__(self, initialraybundle=None, keep_history=True):
+        """
+        Sequence of raybundles along the traced surfaces.
+
+        Raypaths obtained by fork() share the raybundles up to the fork
+        with their parent instead of copying them. Therefore the shared
+        raybundles must not be changed after forking. The flat list
+        of all raybundles is available via raybundles.
+
+        :param initialraybundle (RayBundle object)
+        :param keep_history (bool)
+                If False only the current raybundle is kept in
+                raybundles and earlier ones are released as soon as
+                the next one is appended. Raybundles explicitly recorded
+                via recordRayBundle are kept in the recorded list.
+        """
+        # shared prefix: None or (prefix of parent, list of parent, length)
+        self._prefix = None
         if initialraybundle is None:
-            self.raybundles = []
+            self._own_raybundles = []
         else:
-            self.raybundles = [initialraybundle]
+            self._own_raybundles = [initialraybundle]
+        self.keep_history = keep_history
+        self.recorded = []
+
+    def getRayBundles(self):
+        """
+        Returns flat list of all raybundles including the shared ones.
+        """
+        segments = [self._own_raybundles]
+        prefix = self._prefix
+        while prefix is not None:
+            (prefix, raybundles, length) = prefix
+            segments.append(raybundles[:length])
+        result = []
+        for segment in reversed(segments):
+            result += segment
+        return result
+
+    def setRayBundles(self, raybundles):
+        self._prefix = None
+        self._own_raybundles = list(raybundles)
+
+    raybundles = property(fget=getRayBundles, fset=setRayBundles)
+
+    def getLastRayBundle(self):
+        """
+        Returns the current raybundle without building the flat list.
+        """
+        if self._own_raybundles:
+            return self._own_raybundles[-1]
+        prefix = self._prefix
+        while prefix is not None:
+            (prefix, raybundles, length) = prefix
+            if length > 0:
+                return raybundles[length - 1]
+        raise IndexError("raypath contains no raybundles")
+
+    def fork(self):
+        """
+        Returns a new raypath which continues this one. The raybundles
+        up to now are shared and not copied, i.e. memory and time
+        for forking do not depend on the number of raybundles.
+        """
+        child = RayPath(keep_history=self.keep_history)
+        if self.keep_history:
+            child._prefix = (self._prefix, self._own_raybundles,
+                             len(self._own_raybundles))
+        else:
+            child._own_raybundles = list(self._own_raybundles)
+        child.recorded = list(self.recorded)
+        return child
 
     def appendRayBundle(self, raybundle):
-        self.raybundles.append(raybundle)
+        if self.keep_history or len(self._own_raybundles) == 0:
+            self._own_raybundles.append(raybundle)
+        else:
+            self._own_raybundles[-1] = raybundle
 
     def appendRayPath(self, raypath):
-        self.raybundles += raypath.raybundles
+        if self.keep_history:
+            self._own_raybundles += raypath.raybundles
+        elif len(raypath.raybundles) > 0:
+            self.raybundles = [raypath.getLastRayBundle()]
+        self.recorded += raypath.recorded
+
+    def recordRayBundle(self, key, raybundle):
+        """
+        Keeps raybundle under key, also if no history is kept.
+
+        :param key (hashable), e.g. surface key
+        :param raybundle (RayBundle object)
+        """
+        self.recorded.append((key, raybundle))
+
+    def getRecordedRayBundles(self, key):
+        """
+        Returns all raybundles recorded under key in trace order.
+        (A surface may be hit several times within a sequence.)
+        """
+        return [raybundle for (reckey, raybundle) in self.recorded
+                if reckey == key]
 
     def draw2d(self, ax, color="blue",
                plane_normal=canonical_ex, up=canonical_ey,
@@ -255,6 +568,65 @@ class RayPath(object):
     def containsSplitted(self):
         return any([r.splitted for r in self.raybundles])
 
+    def getPruningStatistics(self):
+        """
+        Returns how much was pruned along this raypath due to low power.
+
+        :return dict with number of pruned rays, their summed relative
+                power and the number of dropped branches
+        """
+        raybundles = self.raybundles
+        return {"pruned_rays": sum([r.pruned_rays for r in raybundles]),
+                "pruned_power": sum([r.pruned_power for r in raybundles]),
+                "pruned_branches": sum([r.pruned_branches
+                                        for r in raybundles])}
+
+
+def selectWave(wave, selection):
+    """
+    Wavelengths of the rays chosen by selection (bool mask or indices)
+    for the creation of a new raybundle. A scalar wavelength belongs
+    to all rays and is returned unchanged.
+    """
+    if np.ndim(wave) == 0:
+        return wave
+    return wave[selection]
+
+
+def selectWaveGroups(wave_groups, selection):
+    """
+    Wave groups (see RayBundle.getWaveGroups) of the rays chosen by
+    selection. The unique wavelengths are kept even if no selected ray
+    has them.
+    """
+    if wave_groups is None:
+        return None
+    (waves, inverse) = wave_groups
+    return (waves, inverse[selection])
+
+
+def concatenateRayBundles(raybundles):
+    """
+    Combines the initial points of several raybundles (e.g. for different
+    wavelengths or field points) into one raybundle with one wavelength
+    per ray, which is traced in a single pass. The rays keep their order;
+    rayID counts the rays of the combined raybundle.
+
+    :param raybundles (list of RayBundle objects)
+
+    :return RayBundle object
+    """
+    waves = np.hstack([np.broadcast_to(raybundle.wave,
+                                       (len(raybundle.rayID),))
+                       for raybundle in raybundles])
+    return RayBundle(np.hstack([raybundle.x[0] for raybundle in raybundles]),
+                     np.hstack([raybundle.k[0] for raybundle in raybundles]),
+                     np.hstack([raybundle.Efield[0]
+                                for raybundle in raybundles]),
+                     wave=waves,
+                     power=np.hstack([raybundle.power
+                                      for raybundle in raybundles]))
+
 
 def returnDtoK(direction):
     # TODO: this is a fake implementation
@@ -29,6 +29,7 @@ from .aperture import BaseAperture, create_aperture
 from .localcoordinatestreebase import LocalCoordinatesTreeBase
 import numpy as np
 from .globalconstants import canonical_ex, canonical_ey
+from ..core.optimizable_variable import notify_modification
 
 
 class Surface(LocalCoordinatesTreeBase):
@@ -84,6 +85,7 @@ class Surface(LocalCoordinatesTreeBase):
         """
         if self.checkForRootConnection(apert.lc):
             self.__aperture = apert
+            notify_modification()
         else:
             raise Exception("Aperture coordinate system should " +
                             "be connected to surface coordinate system")
@@ -103,6 +105,7 @@ class Surface(LocalCoordinatesTreeBase):
         """
         if self.checkForRootConnection(shape.lc):
             self.__shape = shape
+            notify_modification()
         else:
             raise Exception("Shape coordinate system should " +
                             "be connected to surface coordinate system")
@@ -118,9 +121,11 @@ class Surface(LocalCoordinatesTreeBase):
         can remove rays due to aperture.
 
         :param raybundle (RayBundle object), gets changed!
+
+        :return record (IntersectionRecord object) of the shape
         """
 
-        self.shape.intersect(raybundle)
+        record = self.shape.intersect(raybundle)
 
         if remove_rays_outside_aperture:
             globalintersection = raybundle.x[-1]
@@ -133,6 +138,8 @@ class Surface(LocalCoordinatesTreeBase):
 
             raybundle.valid[-1] = raybundle.valid[-1]*valid
 
+        return record
+
     def draw2d(self, ax, vertices=50,
                inyzplane=True,
                color="grey",
@@ -34,7 +34,10 @@ from scipy.optimize import fsolve
 from scipy.interpolate import RectBivariateSpline
 from scipy.special import jacobi
 from ..core.base import ClassWithOptimizableVariables
-from ..core.optimizable_variable import FloatOptimizableVariable, FixedState
+from ..core.optimizable_variable import FloatOptimizableVariable, FixedState,\
+    get_modification_count
+from .helpers_math import horner_with_derivatives, reshape_points
+from .zernike_evaluator import ZernikeEvaluator
 
 if StrictVersion(scipy.__version__) < StrictVersion("1.0.0"):
     from scipy.misc import factorial
@@ -42,6 +45,49 @@ else:
     from scipy.special import factorial
 
 
+class IntersectionRecord(object):
+    """
+    Geometry of the intersection of a raybundle with a shape as obtained
+    by Shape.intersect. It is attached to the raybundle (see
+    RayBundle.getIntersectionRecord) such that refraction and reflection
+    do not have to transform the intersection points back into the
+    coordinate system of the shape and to recompute the normals.
+    """
+
+    def __init__(self, shape, xlocal, t, valid, num_points, xglobal,
+                 normal=None):
+        """
+        :param shape: (Shape object) intersected shape
+        :param xlocal: (2d numpy 3xN array of float) intersection points
+                       in local coordinates of the shape
+        :param t: (1d numpy array of float or None) path parameter
+                  along the ray directions
+        :param valid: (1d numpy array of bool) rays hitting the shape
+        :param num_points: (int) length of the ray history including
+                           the intersection points
+        :param xglobal: (2d numpy 3xN array of float) intersection points
+                        in global coordinates
+        :param normal: (2d numpy 3xN array of float or None) normals in
+                       local coordinates of the shape; calculated when
+                       first needed if None
+        """
+        self.shape = shape
+        self.xlocal = xlocal
+        self.t = t
+        self.valid = valid
+        self.num_points = num_points
+        self.xglobal = xglobal
+        self._normal = normal
+
+    def getNormal(self):
+        if self._normal is None:
+            self._normal = self.shape.getNormal(self.xlocal[0],
+                                                self.xlocal[1])
+        return self._normal
+
+    normal = property(getNormal)
+
+
 class Shape(ClassWithOptimizableVariables):
     """
     Virtual Class for all surface shapes.
@@ -54,18 +100,38 @@ class Shape(ClassWithOptimizableVariables):
 
     def intersect(self, raybundle):
         """
-        Intersection routine returning intersection point
-        with ray and normal vector of the surface.
+        Intersection routine appending the intersection points
+        to the raybundle (see appendIntersection).
         :param raybundle: RayBundle that shall intersect the surface.
                             (RayBundle Object)
-        :return t: geometrical path length to the next surface
-                            (1d numpy array of float)
-        :return normal: surface normal vectors (2d numpy 3xN array of float)
-        :return validIndices: whether indices hit the surface
-                            (1d numpy array of bool)
+        :return record: local intersection points, path parameters,
+                        normals and validity (IntersectionRecord object)
         """
         raise NotImplementedError()
 
+    def appendIntersection(self, raybundle, xlocal, t, valid, normal=None):
+        """
+        Appends intersection points given in local coordinates to the
+        raybundle and attaches the corresponding intersection record.
+
+        :param raybundle: (RayBundle object), gets changed!
+        :param xlocal: (2d numpy 3xN array of float) local intersections
+        :param t: (1d numpy array of float or None) path parameters
+        :param valid: (1d numpy array of bool) rays hitting the shape
+        :param normal: (2d numpy 3xN array of float or None) local normals
+                       if already known
+
+        :return record: (IntersectionRecord object)
+        """
+        globalinter = self.lc.returnLocalToGlobalPoints(xlocal)
+        raybundle.append(globalinter, raybundle.k[-1], raybundle.Efield[-1],
+                         valid)
+        record = IntersectionRecord(self, xlocal, t, valid,
+                                    len(raybundle.x), globalinter,
+                                    normal=normal)
+        raybundle.setIntersectionRecord(record)
+        return record
+
     def getSag(self, x, y):
         """
         Returns the sag of the surface for given coordinates - mostly used
@@ -290,6 +356,8 @@ class Conic(Shape):
         Calculates intersection from raybundle.
 
         :param raybundle (RayBundle object), gets changed!
+
+        :return record (IntersectionRecord object)
         """
 
         (r0, rayDir) = self.getLocalRayBundleForIntersect(raybundle)
@@ -319,9 +387,8 @@ class Conic(Shape):
         # find indices of rays that don't intersect with the sphere
         validIndices = square >= 0 #*(True - F_nearly_zero)
 
-        globalinter = self.lc.returnLocalToGlobalPoints(intersection)
-
-        raybundle.append(globalinter, raybundle.k[-1], raybundle.Efield[-1], validIndices)
+        return self.appendIntersection(raybundle, intersection, t,
+                                       validIndices)
 
 
 class Cylinder(Conic):
@@ -378,13 +445,12 @@ class Cylinder(Conic):
 
         t = G / (F + np.sqrt(square))
 
-        intersection = r0 + raybundle.rayDir * t
+        intersection = r0 + rayDir * t
 
         validIndices = (square > 0) # TODO: damping criterion
 
-        globalinter = self.lc.returnLocalToGlobalPoints(intersection)
-
-        raybundle.append(globalinter, raybundle.k[-1], raybundle.Efield[-1], validIndices)
+        return self.appendIntersection(raybundle, intersection, t,
+                                       validIndices)
 
 
 class FreeShape(Shape):
@@ -442,26 +508,146 @@ class ExplicitShape(FreeShape):
     """
 
     def getSag(self, x, y):
-        return self.F(x, y)
+        (sag,) = self.getSagGradHessian(x, y, order=0)
+        return sag.copy()
+
+    def getGrad(self, x, y):
+        (_, gradient) = self.getSagGradHessian(x, y, order=1)
+        return gradient.copy()
+
+    def getHessian(self, x, y):
+        (_, _, hessian) = self.getSagGradHessian(x, y, order=2)
+        return hessian.copy()
+
+    def evaluateSagGradHessian(self, x, y, order):
+        """
+        Sag F(x, y), gradient gradF and Hessian hessF of z - F(x, y).
+        Shapes which can share intermediate results between the three
+        override this function.
+
+        :param x: (1d numpy array of float)
+        :param y: (1d numpy array of float)
+        :param order: (int) highest derivative order (0, 1 or 2)
+
+        :return tuple of length order + 1: sag (1d numpy array of float),
+                gradient (3xN numpy array of float),
+                Hessian (3x3xN numpy array of float)
+        """
+        sag = self.F(x, y)
+        result = (sag,)
+        if order >= 1:
+            result += (self.gradF(x, y, sag),)
+        if order >= 2:
+            result += (self.hessF(x, y, sag),)
+        return result
+
+    def getSagGradHessian(self, x, y, order=2):
+        """
+        Cached version of evaluateSagGradHessian. The result of the last
+        call is reused if points and parameters did not change, e.g. for
+        getSag, getGrad and getNormal at the intersection points. Besides
+        the own parameters the global modification counter is compared,
+        which covers shapes depending on other objects
+        (see LinearCombination). The returned arrays belong to the cache
+        and must not be modified; getSag, getGrad and getHessian return
+        copies.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        parameters = (get_modification_count(),
+                      tuple(sorted((key, variable())
+                                   for (key, variable) in self.params.items())))
+        # stored as tuple which is not part of the serialized structure
+        (cached_parameters, cached_x, cached_y, cached_result) =\
+            getattr(self, "_sag_cache", (None, None, None, ()))
+        if len(cached_result) > order and cached_parameters == parameters\
+                and cached_x.shape == x.shape\
+                and np.array_equal(cached_x, x)\
+                and np.array_equal(cached_y, y):
+            return cached_result[:order + 1]
+        result = self.evaluateSagGradHessian(x, y, order)
+        self._sag_cache = (parameters, x.copy(), y.copy(), result)
+        return result
+
+    def getStartingParameters(self, r0, rayDir):
+        """
+        Starting values for the intersection parameter t. They are
+        obtained by intersecting with the sphere of central curvature
+        or with the vertex plane if no central curvature is available.
+
+        :param r0: local ray start points (2d 3xN numpy array of float)
+        :param rayDir: local ray directions (2d 3xN numpy array of float)
+        :return t: (1d numpy array of float)
+        """
+        try:
+            curv = self.getCentralCurvature()
+        except NotImplementedError:
+            curv = 0.
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tplane = -r0[2]/rayDir[2]
+
+            F = rayDir[2] - curv*np.sum(rayDir*r0, axis=0)
+            G = curv*np.sum(r0**2, axis=0) - 2.*r0[2]
+            H = -curv*np.ones_like(F)
+            square = F**2 + H*G
+            t = G/(F + np.sqrt(square))
+
+        t = np.where(np.isfinite(t), t, tplane)
+        t[~np.isfinite(t)] = 0.
+        return t
 
     def intersect(self, raybundle):
+        """
+        Calculates intersection from raybundle by an element-wise Newton
+        iteration for z0 + t*dz - F(x0 + t*dx, y0 + t*dy) = 0.
+        Every ray is iterated until its parameter update is smaller than
+        annotations["tol"], but at most annotations["iterations"] times.
+        Rays which did not converge are marked as invalid.
+
+        :param raybundle (RayBundle object), gets changed!
+
+        :return record (IntersectionRecord object)
+        """
         (r0, rayDir) = self.getLocalRayBundleForIntersect(raybundle)
 
-        t = np.zeros_like(r0[0])
+        tol = self.annotations["tol"]
+        iterations = self.annotations["iterations"]
 
-        def Fwrapper(t, r0, rayDir):
-            return r0[2] + t*rayDir[2] - self.F(r0[0] + t*rayDir[0],
-                                                r0[1] + t*rayDir[1])
+        t = self.getStartingParameters(r0, rayDir)
+        active = np.ones_like(t, dtype=bool)
+        converged = np.zeros_like(t, dtype=bool)
 
-        t = fsolve(Fwrapper, t, args=(r0, rayDir),
-                   xtol=self.annotations["tol"])
+        for _ in range(iterations):
+            indices = np.flatnonzero(active)
+            if len(indices) == 0:
+                break
+            ta = t[indices]
+            r0a = r0[:, indices]
+            da = rayDir[:, indices]
+            xa = r0a + ta*da
 
-        globalinter = self.lc.returnLocalToGlobalPoints(r0 + rayDir * t)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # gradient is the gradient of z - F(x, y)
+                (sag, gradient) = self.evaluateSagGradHessian(
+                    xa[0], xa[1], order=1)
+                residual = xa[2] - sag
+                derivative = np.sum(gradient*da, axis=0)
+                delta = residual/derivative
 
-        validIndices = np.ones_like(r0[0], dtype=bool)
+            finite = np.isfinite(delta)
+            ta = ta - np.where(finite, delta, 0.)
+            t[indices] = ta
 
-        raybundle.append(globalinter, raybundle.k[-1], raybundle.Efield[-1],
-                         validIndices)
+            done = finite & (np.abs(delta) <= tol)
+            converged[indices[done]] = True
+            active[indices[done | ~finite]] = False
+
+        self.debug("%d of %d rays did not converge" %
+                   (np.sum(~converged), len(converged)))
+
+        return self.appendIntersection(raybundle, r0 + rayDir * t, t,
+                                       converged)
 
 
 class ImplicitShape(FreeShape):
@@ -526,53 +712,55 @@ class Asphere(ExplicitShape):
         return np.sqrt(1 - curv**2*(1+cc)*r2)
 
     def F(self, x, y):
-        (curv, cc, acoeffs) = self.getAsphereParameters()
-
-        r2 = x**2 + y**2
-
-        res = curv*r2/(1 + self.sqrtfun(r2))
-        for (n, an) in enumerate(acoeffs):
-            res += an*r2**(n+1)
-        return res
+        (sag,) = self.evaluateSagGradHessian(x, y, order=0)
+        return sag
 
     def gradF(self, x, y, z):
         """gradient for implicit function z - af(x, y) = 0"""
-        res = np.zeros((3, len(x)))
-        (curv, cc, acoeffs) = self.getAsphereParameters()
-
-        r2 = x**2 + y**2
-        sq = self.sqrtfun(r2)
-
-        res[2] = np.ones_like(x)  # z-component always 1
-        res[0] = -curv*x/sq
-        res[1] = -curv*y/sq
-
-        for (n, an) in enumerate(acoeffs):
-            res[0] += -2.*x*(n+1)*an*r2**n
-            res[1] += -2.*y*(n+1)*an*r2**n
-
-        return res
+        (_, gradient) = self.evaluateSagGradHessian(x, y, order=1)
+        return gradient
 
     def hessF(self, x, y, z):
-        res = np.zeros((3, 3, len(x)))
+        (_, _, hessian) = self.evaluateSagGradHessian(x, y, order=2)
+        return hessian
 
+    def evaluateSagGradHessian(self, x, y, order):
+        """
+        The sag f(r2) = curv r2/(1 + sqrt(1 - curv^2 (1 + cc) r2))
+        + sum_n A_(2n+2) r2^(n+1) and its derivatives with respect to
+        r2 = x^2 + y^2 share the square root and one Horner scheme for
+        the polynomial part. Gradient and Hessian follow from
+        df/dx = 2 x f', d^2f/dxdy = 4 x y f'' + 2 delta_xy f'.
+        Points x, y of any shape are evaluated flattened.
+        """
         (curv, cc, acoeffs) = self.getAsphereParameters()
 
+        shape = np.shape(x)
+        (x, y) = (np.ravel(x), np.ravel(y))
         r2 = x**2 + y**2
         sq = self.sqrtfun(r2)
 
-        maindev = -curv/(2.*sq)
-        maindev2 = -curv**3*(1+cc)/(4.*sq)
-
-        for (n, an) in enumerate(acoeffs):
-            maindev += -an*(n+1)*r2**n
-            maindev2 += -an*(n+1)*n*r2**(n-1)
-
-        res[0, 0] = 2*(2*maindev2*x*x + maindev)
-        res[1, 1] = 2*(2*maindev2*y*y + maindev)
-        res[0, 1] = res[1, 0] = 4*maindev2*x*y
-
-        return res
+        polynomial = horner_with_derivatives([0.] + list(acoeffs), r2, order)
+        result = (curv*r2/(1 + sq) + polynomial[0],)
+        if order == 0:
+            return reshape_points(result, shape)
+
+        # derivatives with respect to r2
+        dfdr2 = curv/(2.*sq) + polynomial[1]
+        gradient = np.zeros((3, len(x)))
+        gradient[0] = -2.*x*dfdr2
+        gradient[1] = -2.*y*dfdr2
+        gradient[2] = 1.
+        result += (gradient,)
+        if order == 1:
+            return reshape_points(result, shape)
+
+        d2fdr22 = curv**3*(1 + cc)/(4.*sq**3) + polynomial[2]
+        hessian = np.zeros((3, 3, len(x)))
+        hessian[0, 0] = -(4.*x**2*d2fdr22 + 2.*dfdr2)
+        hessian[1, 1] = -(4.*y**2*d2fdr22 + 2.*dfdr2)
+        hessian[0, 1] = hessian[1, 0] = -4.*x*y*d2fdr22
+        return reshape_points(result + (hessian,), shape)
 
     @classmethod
     def p(cls, lc, curv=0, cc=0, coefficients=None, name=""):
@@ -782,48 +970,67 @@ class XYPolynomials(ExplicitShape):
     """
 
     def F(self, x, y):
-        (normradius, coeffs) = self.getXYParameters()
-
-        res = np.zeros_like(x)
-
-        for (xpow, ypow, coefficient) in coeffs:
-            normalization = 1./normradius**(xpow+ypow)
-            res += x**xpow*y**ypow*coefficient*normalization
-        return res
+        (sag,) = self.evaluateSagGradHessian(x, y, order=0)
+        return sag
 
     def gradF(self, x, y, z):  # gradient for implicit function z - f(x, y) = 0
-        res = np.zeros((3, len(x)))
-        (normradius, coeffs) = self.getXYParameters()
-
-        for (xpow, ypow, coefficient) in coeffs:
-            normalization = 1./normradius**(xpow+ypow)
-            xpm1 = np.where(xpow >= 1, x**(xpow-1), np.zeros_like(x))
-            ypm1 = np.where(ypow >= 1, y**(ypow-1), np.zeros_like(x))
-            res[0, :] += -xpow*xpm1*y**ypow*coefficient*normalization
-            res[1, :] += -ypow*x**xpow*ypm1*coefficient*normalization
-        res[2, :] = 1.
-
-        return res
+        (_, gradient) = self.evaluateSagGradHessian(x, y, order=1)
+        return gradient
 
     def hessF(self, x, y, z):
-        res = np.zeros((3, 3, len(x)))
+        (_, _, hessian) = self.evaluateSagGradHessian(x, y, order=2)
+        return hessian
 
+    def evaluateSagGradHessian(self, x, y, order):
+        """
+        The coefficients are collected in a matrix C_ij. For every
+        power i of x the polynomial P_i(y) = sum_j C_ij y^j is evaluated
+        by a Horner scheme, f = sum_i x^i P_i(y) is then summed up with
+        precomputed powers of x (all in normalized coordinates).
+        Points x, y of any shape are evaluated flattened.
+        """
         (normradius, coeffs) = self.getXYParameters()
 
+        max_xpow = max([xpow for (xpow, _, _) in coeffs] + [0])
+        max_ypow = max([ypow for (_, ypow, _) in coeffs] + [0])
+        coefficient_matrix = np.zeros((max_xpow + 1, max_ypow + 1))
         for (xpow, ypow, coefficient) in coeffs:
-            normalization = 1./normradius**(xpow+ypow)
-            xpm1 = np.where(xpow >= 1, x**(xpow-1), np.zeros_like(x))
-            ypm1 = np.where(ypow >= 1, y**(ypow-1), np.zeros_like(x))
-            xpm2 = np.where(xpow >= 2, x**(xpow-2), np.zeros_like(x))
-            ypm2 = np.where(ypow >= 2, y**(ypow-2), np.zeros_like(x))
-
-            res[0, 0] += -xpow*(xpow-1)*xpm2*y**ypow*coefficient*normalization
-            res[0, 1] += -xpow*ypow*xpm1*ypm1*coefficient*normalization
-            res[1, 1] += -ypow*(ypow-1)*x**xpow*ypm2*coefficient*normalization
-
-        res[1, 0] = res[0, 1]
-
-        return res
+            coefficient_matrix[xpow, ypow] = coefficient
+
+        shape = np.shape(x)
+        xn = np.ravel(x)/normradius
+        yn = np.ravel(y)/normradius
+
+        # x^i, i x^(i-1), i (i-1) x^(i-2)
+        xpowers = np.ones((max_xpow + 1, len(xn)))
+        for xpow in range(1, max_xpow + 1):
+            xpowers[xpow] = xpowers[xpow - 1]*xn
+        xpow_column = np.arange(max_xpow + 1, dtype=float)[:, np.newaxis]
+        xpowers_1 = np.zeros_like(xpowers)
+        xpowers_1[1:] = xpow_column[1:]*xpowers[:-1]
+        xpowers_2 = np.zeros_like(xpowers)
+        xpowers_2[2:] = xpow_column[2:]*(xpow_column[2:] - 1.)*xpowers[:-2]
+
+        polynomials = horner_with_derivatives(coefficient_matrix, yn, order)
+
+        result = (np.sum(xpowers*polynomials[0], axis=0),)
+        if order == 0:
+            return reshape_points(result, shape)
+
+        gradient = np.zeros((3, len(xn)))
+        gradient[0] = -np.sum(xpowers_1*polynomials[0], axis=0)/normradius
+        gradient[1] = -np.sum(xpowers*polynomials[1], axis=0)/normradius
+        gradient[2] = 1.
+        result += (gradient,)
+        if order == 1:
+            return reshape_points(result, shape)
+
+        hessian = np.zeros((3, 3, len(xn)))
+        hessian[0, 0] = -np.sum(xpowers_2*polynomials[0], axis=0)
+        hessian[0, 1] = -np.sum(xpowers_1*polynomials[1], axis=0)
+        hessian[1, 1] = -np.sum(xpowers*polynomials[2], axis=0)
+        hessian[1, 0] = hessian[0, 1]
+        return reshape_points(result + (hessian/normradius**2,), shape)
 
     @classmethod
     def p(cls, lc, normradius=1.0, coefficients=None, name=""):
@@ -929,30 +1136,48 @@ class Zernike(ExplicitShape):
     """
 
     def F(self, x, y):
-        (normradius, zcoefficients) = self.getZernikeParameters()
-        res = np.zeros_like(x)
-        for (num, val) in enumerate(zcoefficients):
-            res += val*self.zernike_norm_j(num + 1, x/normradius, y/normradius)
-
-        return res
+        (sag,) = self.evaluateSagGradHessian(x, y, order=0)
+        return sag
 
     def gradF(self, x, y, z):
-        (normradius, zcoefficients) = self.getZernikeParameters()
-        res = np.zeros((3, len(x)))
-        xp = x/normradius
-        yp = y/normradius
-
-        for (num, val) in enumerate(zcoefficients):
-            (dZdxp, dZdyp) = self.gradzernike_norm_j(num + 1, xp, yp)
-            res[0] += -val*dZdxp/normradius
-            res[1] += -val*dZdyp/normradius
+        (_, gradient) = self.evaluateSagGradHessian(x, y, order=1)
+        return gradient
 
-        res[2] = 1.
+    def hessF(self, x, y, z):
+        (_, _, hessian) = self.evaluateSagGradHessian(x, y, order=2)
+        return hessian
 
-        return res
+    def evaluateSagGradHessian(self, x, y, order):
+        (normradius, zcoefficients) = self.getZernikeParameters()
+        derivatives = self.getZernikeEvaluator().evaluate(
+            zcoefficients, x/normradius, y/normradius, order=order)
+
+        result = (derivatives[0],)
+        if order >= 1:
+            gradient = np.zeros((3,) + np.shape(x))
+            gradient[0:2] = -derivatives[1]/normradius
+            gradient[2] = 1.
+            result += (gradient,)
+        if order >= 2:
+            hessian = np.zeros((3, 3) + np.shape(x))
+            hessian[0:2, 0:2] = -derivatives[2]/normradius**2
+            result += (hessian,)
+        return result
 
-    def hessF(self, x, y, z):
-        return np.zeros((3, 3, len(x)))
+    def getZernikeEvaluator(self):
+        """
+        Evaluation engine for all terms of this surface. It is set up
+        once per number of coefficients and reused afterwards.
+        (Stored as tuple to keep it out of the serialization.)
+        """
+        numcoefficients = self.annotations["numcoefficients"]
+        (cached_number, evaluator) = getattr(self, "_zernike_evaluator",
+                                             (None, None))
+        if cached_number != numcoefficients:
+            evaluator = ZernikeEvaluator(
+                [self.jtonm(j + 1) for j in range(numcoefficients)])
+            self._zernike_evaluator = (numcoefficients, evaluator)
+        return evaluator
 
     @classmethod
     def p(cls, lc, normradius=1., coefficients=None, name=""):
@@ -1089,8 +1314,8 @@ class Zernike(ExplicitShape):
         rad = self.radialfunction_norm(n, m, xp, yp)
         ang = self.angularfunction_norm(n, m, xp, yp)
         rho = np.sqrt(xp**2 + yp**2)
-        dZdxp = (radder*ang*xp + rad*angder*(-yp))/rho
-        dZdyp = (radder*ang*yp + rad*angder*xp)/rho
+        dZdxp = (radder*ang*xp + rad*angder*(-yp)/rho)/rho
+        dZdyp = (radder*ang*yp + rad*angder*xp/rho)/rho
 
         return (dZdxp, dZdyp)
 
@@ -1143,19 +1368,32 @@ class ZernikeANSI(Zernike):
 
 
 class ZernikeStandard(Zernike):
-
-    # TODO: Implement Noll index structure
+    """
+    Zernike polynomials in Noll ordering (even j: cos terms,
+    odd j: sin terms).
+    """
 
     def setKind(self):
         self.kind = "shape_ZernikeStandard"
 
     @staticmethod
     def jtonm(j):
-        raise NotImplementedError()
+        n = int(math.floor(math.sqrt(2*j - 1) + 0.5)) - 1
+        if n % 2 == 0:
+            omega = 2*((2*j + 1 - n*(n + 1))//4)
+        else:
+            omega = 2*((2*(j + 1) - n*(n + 1))//4) - 1
+        m = omega if j % 2 == 0 else -omega
+        return (n, m)
 
     @staticmethod
     def nmtoj(n_m_pair):
-        raise NotImplementedError()
+        (n, m) = n_m_pair
+        j = n*(n + 1)//2 + abs(m)
+        if m == 0 or (m > 0 and n % 4 in (2, 3)) or\
+                (m < 0 and n % 4 in (0, 1)):
+            j += 1
+        return j
 
 
 if __name__ == "__main__":
@@ -374,10 +374,8 @@ class ZMXDLLShape(Conic):
             intersection[1, ind] = user_data.y
             intersection[2, ind] = user_data.z
 
-        globalinter = self.lc.returnLocalToGlobalPoints(intersection)
-
-        raybundle.append(globalinter, raybundle.k[-1], raybundle.Efield[-1],
-                         raybundle.valid[-1])
+        return self.appendIntersection(raybundle, intersection, None,
+                                       raybundle.valid[-1])
 
     def getSag(self, x, y):
         user_data = USER_DATA()
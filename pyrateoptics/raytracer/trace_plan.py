@@ -0,0 +1,530 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+
+from copy import deepcopy
+
+import numpy as np
+
+from ..core.log import BaseLogger
+from ..core.optimizable_variable import get_modification_count
+
+from .material.material_isotropic import IsotropicMaterial
+from .surface_shape import Conic
+from .ray import RayPath, RayBundle, selectWave, selectWaveGroups
+
+
+def is_standard_homogeneous_material(material):
+    """
+    Checks whether material is a homogeneous isotropic material which
+    uses the standard propagate, refract and reflect implementations.
+    Only for those the trace plan may use its own kernels.
+    """
+    if not isinstance(material, IsotropicMaterial) or\
+            not material.homogeneous:
+        return False
+    return all([getattr(type(material), method) is
+                getattr(IsotropicMaterial, method)
+                for method in ("propagate", "refract", "reflect",
+                               "calc_e_field")])
+
+
+def relative_transform(lc_from, lc_to):
+    """
+    Precomposed transformation between two coordinate systems.
+
+    :return (rotation, translation) such that
+            x_to = rotation x_from + translation
+            (3x3 and 3x1 numpy arrays of float)
+    """
+    rotation = np.dot(lc_to.localbasis.T, lc_from.localbasis)
+    translation = np.dot(lc_to.localbasis.T,
+                         np.asarray(lc_from.globalcoordinates, dtype=float) -
+                         np.asarray(lc_to.globalcoordinates, dtype=float))
+    return (rotation, translation.reshape((3, 1)))
+
+
+class TraceStep(object):
+    """
+    Resolved surface hit within a trace plan.
+
+    :param key (tuple) (elementkey, surfacekey)
+    :param surface (Surface object)
+    :param propagation_material (Material object) material before surface
+    :param material (Material object) material used for refract/reflect
+    :param refract_flag (bool)
+    """
+    def __init__(self, key, surface, propagation_material, material,
+                 refract_flag):
+        self.key = key
+        self.surface = surface
+        self.propagation_material = propagation_material
+        self.material = material
+        self.refract_flag = refract_flag
+
+        # kernel parameters (basis, origin, curvature, conic constant)
+        # of the shape or None if generic material methods are used
+        self.propagation_kernel = None
+        self.kernel = None
+        # transformations for tracing in local coordinates:
+        # (rotation, translation) from previous step or None,
+        # (rotation, translation) from shape to aperture,
+        # global y unit vector in shape coordinates
+        self.local_kernel = None
+
+
+class TracePlan(BaseLogger):
+    """
+    Compiled form of an element sequence of an optical system for
+    repeated sequential raytracing (e.g. in merit functions).
+
+    The plan holds a flat list of steps with already resolved surfaces,
+    materials and deflection types. For conic surfaces between
+    homogeneous isotropic materials the intersection and deflection are
+    performed by kernels working with the transformation and shape
+    parameters stored in the plan and with cached optical indices per
+    wavelength. All other steps use the generic material methods.
+
+    If no history is kept, consecutive kernel steps are traced in the
+    local coordinates of the respective shapes, which are connected
+    by precomposed relative transformations. Global coordinates are
+    only calculated for recorded surfaces and at the end of such a run.
+
+    The plan is compiled again automatically if any optimizable
+    variable, coordinate system or the structure of the system was
+    changed after compilation (see notify_modification).
+    Changes of dicts (e.g. surf_mat_connection annotations) by
+    direct access are not detected; call compile() in this case.
+    """
+
+    def __init__(self, opticalsystem, elementsequence, name=""):
+        """
+        :param opticalsystem (OpticalSystem object)
+        :param elementsequence (list of (elementkey, surface sequence))
+               see OpticalSystem.seqtrace
+        """
+        super(TracePlan, self).__init__(name=name)
+        self.opticalsystem = opticalsystem
+        self.elementsequence = deepcopy(elementsequence)
+        self.compile()
+
+    def setKind(self):
+        self.kind = "traceplan"
+
+    def compile(self):
+        """
+        Resolves element sequence into flat list of steps per element.
+        """
+        self.modification_count = get_modification_count()
+        self.optical_indices = {}
+
+        background_medium = self.opticalsystem.material_background
+        self.elementsteps = []
+        for (elemkey, subseq) in self.elementsequence:
+            element = self.opticalsystem.elements[elemkey]
+            current_material = background_medium
+            steps = []
+            for (surfkey, surfoptions) in subseq:
+                refract_flag = not surfoptions.get("is_mirror", False)
+                surface = element.surfaces[surfkey]
+
+                (mnmat, pnmat) = element.getConnection(surfkey)
+                mnmat = element.materials.get(mnmat, background_medium)
+                pnmat = element.materials.get(pnmat, background_medium)
+
+                propagation_material = current_material
+                if refract_flag:
+                    current_material = element.findoutWhichMaterial(
+                        mnmat, pnmat, current_material)
+
+                step = TraceStep((elemkey, surfkey), surface,
+                                 propagation_material, current_material,
+                                 refract_flag)
+                step.propagation_kernel = self.compileKernel(
+                    surface, propagation_material)
+                step.kernel = self.compileKernel(surface, current_material)
+                if step.propagation_kernel is not None and\
+                        step.kernel is not None:
+                    previous = None
+                    if steps and steps[-1].local_kernel is not None:
+                        previous = relative_transform(
+                            steps[-1].surface.shape.lc, surface.shape.lc)
+                    step.local_kernel = (
+                        previous,
+                        relative_transform(surface.shape.lc,
+                                           surface.aperture.lc),
+                        np.copy(surface.shape.lc.localbasis[1]))
+                steps.append(step)
+            self.elementsteps.append(steps)
+
+        self.debug("compiled %d steps" %
+                   (sum([len(steps) for steps in self.elementsteps]),))
+
+    def compileKernel(self, surface, material):
+        """
+        Returns parameters for the conic kernels or None if the generic
+        material methods have to be used.
+        """
+        shape = surface.shape
+        if type(shape) is not Conic or\
+                not is_standard_homogeneous_material(material):
+            return None
+        return (np.copy(shape.lc.localbasis),
+                np.array(shape.lc.globalcoordinates,
+                         dtype=float).reshape((3, 1)),
+                shape.curvature(), shape.conic())
+
+    def isUpToDate(self):
+        return self.modification_count == get_modification_count()
+
+    def getOpticalIndex(self, material, wave, wave_groups=None):
+        """
+        Optical index of homogeneous material, cached per wavelength.
+        For one wavelength per ray the indices of the unique
+        wavelengths (see RayBundle.getWaveGroups) are broadcast
+        to the rays.
+        """
+        if np.ndim(wave) > 0:
+            if wave_groups is None:
+                wave_groups = np.unique(wave, return_inverse=True)
+            (waves, inverse) = wave_groups
+            return np.array([self.getOpticalIndex(material, unique_wave)
+                             for unique_wave in waves])[inverse]
+        key = (id(material), wave)
+        if key not in self.optical_indices:
+            self.optical_indices[key] = material.get_optical_index(None,
+                                                                   wave)
+        return self.optical_indices[key]
+
+    def calcRayDirection(self, k, efield):
+        """
+        Ray direction from Poynting vector (see RayBundle.returnKtoD).
+        """
+        poynting = np.real(
+            (np.conj(efield)*efield).sum(axis=0)*k -
+            (efield*k).sum(axis=0)*np.conj(efield))
+        return poynting/np.sqrt((poynting**2).sum(axis=0))
+
+    def calcEField(self, k, ey):
+        """
+        E = k x e_y (see IsotropicMaterial.calc_e_field) where ey is
+        the global y unit vector in the coordinates of k.
+        """
+        efield = np.zeros_like(k)
+        efield[0] = k[1]*ey[2] - k[2]*ey[1]
+        efield[1] = k[2]*ey[0] - k[0]*ey[2]
+        efield[2] = k[0]*ey[1] - k[1]*ey[0]
+        return efield
+
+    def intersectConicLocal(self, r0, raydir, curv, cc):
+        """
+        Intersection with conic in its local coordinates
+        (see Conic.intersect).
+
+        :return (intersection, valid)
+        """
+        F = raydir[2] - curv*(raydir[0]*r0[0] + raydir[1]*r0[1] +
+                              raydir[2]*r0[2]*(1 + cc))
+        G = curv*(r0[0]**2 + r0[1]**2 + r0[2]**2*(1 + cc)) - 2*r0[2]
+        H = -curv - cc*curv*raydir[2]**2
+
+        square = F**2 + H*G
+        t = G/(F + np.sqrt(square))
+
+        return (r0 + raydir*t, square >= 0)
+
+    def deflectConicLocal(self, xlocal, k1, material, refract_flag,
+                          curv, cc, wave, wave_groups=None):
+        """
+        Refraction or reflection at conic in its local coordinates
+        (see IsotropicMaterial.refract).
+
+        :return (k2, valid)
+        """
+        # normal of conic (see Conic.getGrad)
+        rsquared = xlocal[0]**2 + xlocal[1]**2
+        sqrtterm = 1 - (1 + cc)*curv**2*rsquared
+        rsquared[sqrtterm <= 0.] = 0.
+        sqrtterm[sqrtterm <= 0.] = 0.
+        z = curv*rsquared/(1 + np.sqrt(sqrtterm))
+        normal = np.vstack((-curv*xlocal[0], -curv*xlocal[1],
+                            1. - curv*z*(1 + cc)))
+        normal = normal/np.sqrt((normal**2).sum(axis=0))
+
+        valid_normals = np.isfinite(normal).all(axis=0)
+
+        k_inplane = k1 - (k1*normal).sum(axis=0)*normal
+
+        square = self.getOpticalIndex(material, wave, wave_groups)**2 -\
+            (k_inplane*k_inplane).sum(axis=0)
+        xi = np.sqrt(square)
+
+        if refract_flag:
+            k2 = k_inplane + xi*normal
+        else:
+            k2 = -k_inplane + xi*normal
+
+        return (k2, (square > 0)*valid_normals)
+
+    def intersectConic(self, raybundle, surface, kernel):
+        """
+        Same as surface.intersect(raybundle) for conic shapes.
+
+        :return intersection points in local coordinates of the shape
+        """
+        (basis, origin, curv, cc) = kernel
+
+        (intersection, valid) = self.intersectConicLocal(
+            np.dot(basis.T, raybundle.x[-1] - origin),
+            np.dot(basis.T, self.calcRayDirection(raybundle.k[-1],
+                                                  raybundle.Efield[-1])),
+            curv, cc)
+
+        raybundle.append(np.dot(basis, intersection) + origin,
+                         raybundle.k[-1], raybundle.Efield[-1], valid)
+
+        local_ap_intersection =\
+            surface.aperture.lc.returnGlobalToLocalPoints(raybundle.x[-1])
+        valid = surface.aperture.are_points_in_aperture(
+            local_ap_intersection[0], local_ap_intersection[1])
+        raybundle.valid[-1] = raybundle.valid[-1]*valid
+
+        return intersection
+
+    def deflectConic(self, raybundle, material, refract_flag, kernel,
+                     xlocal=None):
+        """
+        Same as material.refract or material.reflect for conic shapes
+        and homogeneous isotropic materials.
+
+        :param xlocal (3xN numpy array of float) current points in local
+               coordinates of the shape if already known (from
+               intersectConic), otherwise None
+        """
+        (basis, origin, curv, cc) = kernel
+
+        x = raybundle.x[-1]
+        if xlocal is None:
+            xlocal = np.dot(basis.T, x - origin)
+
+        (k2, valid_deflection) = self.deflectConicLocal(
+            xlocal, np.dot(basis.T, raybundle.k[-1]), material,
+            refract_flag, curv, cc, raybundle.wave,
+            raybundle.getWaveGroups())
+
+        valid = raybundle.valid[-1]*valid_deflection
+
+        newk = np.dot(basis, k2[:, valid])
+        efield = material.calc_e_field(xlocal, None, newk,
+                                       wave=raybundle.wave)
+
+        return (RayBundle(x[:, valid], newk, efield, raybundle.rayID[valid],
+                          selectWave(raybundle.wave, valid),
+                          power=raybundle.power[valid],
+                          wave_groups=selectWaveGroups(
+                              raybundle.getWaveGroups(), valid)),)
+
+    def traceLocalFrames(self, rpath, steps, record):
+        """
+        Traces last raybundle of rpath through consecutive kernel steps
+        in the local coordinates of the shapes and appends the resulting
+        raybundle to rpath. Only for traces without history.
+
+        After the first deflection E is perpendicular to k. Then the ray
+        direction is the direction of Re(k) and E is only calculated
+        for raybundles which are created (recorded ones and the last).
+        """
+        # the raybundle which gets the next intersection appended
+        pending = rpath.getLastRayBundle()
+        wave = pending.wave
+        wave_groups = pending.getWaveGroups()
+        rayid = pending.rayID
+        power = pending.power
+        valid = pending.valid[-1]
+        (x, k, efield) = (pending.x[-1], pending.k[-1], pending.Efield[-1])
+        raybundle = None
+
+        for step in steps:
+            (basis, origin, curv, cc) = step.kernel
+            (previous, (ap_rotation, ap_translation), ey_local) =\
+                step.local_kernel
+
+            if previous is None:
+                x = np.dot(basis.T, x - origin)
+                raydir = np.dot(basis.T, self.calcRayDirection(k, efield))
+                k = np.dot(basis.T, k)
+            else:
+                (rotation, translation) = previous
+                x = np.dot(rotation, x) + translation
+                k = np.dot(rotation, k)
+                kreal = np.real(k)
+                raydir = kreal/np.sqrt((kreal**2).sum(axis=0))
+
+            (x, valid_intersection) = self.intersectConicLocal(
+                x, raydir, curv, cc)
+            ap_intersection = np.dot(ap_rotation, x) + ap_translation
+            valid_intersection = valid_intersection *\
+                step.surface.aperture.are_points_in_aperture(
+                    ap_intersection[0], ap_intersection[1])
+
+            if pending is not None:
+                pending.append(np.dot(basis, x) + origin,
+                               pending.k[-1], pending.Efield[-1],
+                               valid_intersection)
+                pending = None
+
+            (k, valid_deflection) = self.deflectConicLocal(
+                x, k, step.material, step.refract_flag, curv, cc, wave,
+                wave_groups)
+            valid = valid*valid_intersection*valid_deflection
+
+            x = x[:, valid]
+            k = k[:, valid]
+            rayid = rayid[valid]
+            wave = selectWave(wave, valid)
+            wave_groups = selectWaveGroups(wave_groups, valid)
+            power = power[valid]
+            valid = np.ones_like(rayid, dtype=bool)
+
+            raybundle = None
+            if step.key in record:
+                raybundle = RayBundle(np.dot(basis, x) + origin,
+                                      np.dot(basis, k),
+                                      np.dot(basis,
+                                             self.calcEField(k, ey_local)),
+                                      rayid, wave, power=power,
+                                      wave_groups=wave_groups)
+                rpath.recordRayBundle(step.key, raybundle)
+                pending = raybundle
+
+        if raybundle is None:
+            raybundle = RayBundle(np.dot(basis, x) + origin,
+                                  np.dot(basis, k),
+                                  np.dot(basis, self.calcEField(k, ey_local)),
+                                  rayid, wave, power=power,
+                                  wave_groups=wave_groups)
+        rpath.appendRayBundle(raybundle)
+
+    def traceElement(self, raybundle, steps, splitup, keep_history, record,
+                     compaction_threshold=None):
+        """
+        Sequential trace through the steps of one element.
+        (see OpticalElement.seqtrace)
+        """
+        rpaths = [RayPath(raybundle, keep_history=keep_history)]
+
+        index = 0
+        while index < len(steps):
+            if not keep_history and steps[index].local_kernel is not None:
+                end = index + 1
+                while end < len(steps) and\
+                        steps[end].local_kernel is not None:
+                    end += 1
+                for rp in rpaths:
+                    self.traceLocalFrames(rp, steps[index:end], record)
+                index = end
+                continue
+
+            step = steps[index]
+            index += 1
+
+            rpaths_new = []
+            local_intersections = []
+
+            for rp in rpaths:
+                current_bundle = rp.getLastRayBundle()
+                if step.propagation_kernel is None:
+                    step.propagation_material.propagate(current_bundle,
+                                                        step.surface)
+                    if compaction_threshold is not None:
+                        current_bundle.compact(compaction_threshold)
+                    local_intersections.append(None)
+                else:
+                    local_intersections.append(
+                        self.intersectConic(current_bundle, step.surface,
+                                            step.propagation_kernel))
+
+            for (rp, xlocal) in zip(rpaths, local_intersections):
+                current_bundle = rp.getLastRayBundle()
+                if step.kernel is not None:
+                    raybundles = self.deflectConic(current_bundle,
+                                                   step.material,
+                                                   step.refract_flag,
+                                                   step.kernel,
+                                                   xlocal=xlocal)
+                elif step.refract_flag:
+                    raybundles = step.material.refract(current_bundle,
+                                                       step.surface,
+                                                       splitup=splitup)
+                else:
+                    raybundles = step.material.reflect(current_bundle,
+                                                       step.surface,
+                                                       splitup=splitup)
+
+                for rb in raybundles[1:]:
+                    rpathprime = rp.fork()
+                    rpathprime.appendRayBundle(rb)
+                    if step.key in record:
+                        rpathprime.recordRayBundle(step.key, rb)
+                    rpaths_new.append(rpathprime)
+                rp.appendRayBundle(raybundles[0])
+                if step.key in record:
+                    rp.recordRayBundle(step.key, raybundles[0])
+
+            rpaths = rpaths + rpaths_new
+
+        return rpaths
+
+    def seqtrace(self, initialbundle, splitup=False, keep_history=True,
+                 record=None, compaction_threshold=None):
+        """
+        Sequential trace of initialbundle. Parameters and results
+        are the same as for OpticalSystem.seqtrace. The compaction
+        threshold only applies to generic steps since the kernels
+        remove invalid rays at every deflection anyway.
+        """
+        if not self.isUpToDate():
+            self.debug("system changed: compiling trace plan again")
+            self.compile()
+
+        if record is None:
+            record = ()
+
+        rpaths = [RayPath(deepcopy(initialbundle), keep_history=keep_history)]
+        for steps in self.elementsteps:
+            rpaths_new = []
+            for rp in rpaths:
+                raypaths_to_append = self.traceElement(rp.getLastRayBundle(),
+                                                       steps, splitup,
+                                                       keep_history, record,
+                                                       compaction_threshold)
+                for rp_append in raypaths_to_append[1:]:
+                    rpathprime = rp.fork()
+                    rpathprime.appendRayPath(rp_append)
+                    rpaths_new.append(rpathprime)
+                rp.appendRayPath(raypaths_to_append[0])
+            rpaths = rpaths + rpaths_new
+        return rpaths
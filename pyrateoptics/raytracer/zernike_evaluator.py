@@ -0,0 +1,178 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import math
+
+import numpy as np
+
+from .helpers_math import horner_with_derivatives, reshape_points
+
+
+def radial_coefficients(n, m):
+    """
+    Coefficients c_l of the radial polynomial
+    R_n^|m|(rho) = sum_l c_l rho**(n - 2 l), l = 0 ... (n - |m|)/2.
+    They are obtained by the recurrence
+    c_(l+1) = -c_l ((n+|m|)/2 - l) ((n-|m|)/2 - l)/((l + 1) (n - l))
+    in exact integer arithmetic.
+
+    :param n: (int) radial order
+    :param m: (int) azimuthal order with n - |m| even and >= 0
+
+    :return coefficients: (list of int)
+    """
+    omega = abs(m)
+    if n < omega or (n - omega) % 2 != 0:
+        raise ValueError("invalid Zernike indices (n, m) = (%d, %d)" % (n, m))
+    coefficient = math.factorial(n)//(math.factorial((n + omega)//2) *
+                                      math.factorial((n - omega)//2))
+    coefficients = [coefficient]
+    for l in range((n - omega)//2):
+        coefficient = -coefficient*((n + omega)//2 - l) *\
+            ((n - omega)//2 - l)//((l + 1)*(n - l))
+        coefficients.append(coefficient)
+    return coefficients
+
+
+class ZernikeEvaluator(object):
+    """
+    Evaluates a linear combination of the Zernike polynomials
+    Z_n^m = R_n^|m|(rho) cos(m phi) for m >= 0 and
+    Z_n^m = R_n^|m|(rho) sin(|m| phi) for m < 0
+    together with its gradient and Hessian for all terms at once.
+
+    The radial polynomials are written as R_n^k(rho) = rho**k Q(rho**2).
+    The coefficient tables of Q are set up once per term set; the
+    coefficients of all terms with the same angular function are
+    combined into one polynomial in rho**2 which is evaluated with its
+    derivatives by Horner's scheme. The angular functions
+    rho**k cos(k phi) and rho**k sin(k phi) are the real and imaginary
+    parts of (x + i y)**k and are obtained by the (Chebyshev type)
+    recurrence (x + i y)**k = (x + i y)**(k-1) (x + i y), so neither
+    arctan2 nor division by rho is needed.
+    """
+
+    def __init__(self, nm_pairs):
+        """
+        :param nm_pairs: (list of (int, int)) (n, m) for every term
+        """
+        self.nm_pairs = list(nm_pairs)
+        self.max_k = max([abs(m) for (_, m) in self.nm_pairs] + [0])
+        max_degree = max([(n - abs(m))//2 for (n, m) in self.nm_pairs] + [0])
+
+        # one row per angular function: (k, True for sin)
+        self.rows = sorted(set([(abs(m), m < 0) for (_, m) in self.nm_pairs]))
+        row_index = dict([(row, num) for (num, row) in enumerate(self.rows)])
+
+        # qtable[t, p]: coefficient of s**p in Q of term t, s = rho**2
+        self.qtable = np.zeros((len(self.nm_pairs), max_degree + 1))
+        self.selection = np.zeros((len(self.rows), len(self.nm_pairs)))
+        for (num, (n, m)) in enumerate(self.nm_pairs):
+            coefficients = radial_coefficients(n, m)
+            degree = len(coefficients) - 1
+            for (l, coefficient) in enumerate(coefficients):
+                self.qtable[num, degree - l] = coefficient
+            self.selection[row_index[(abs(m), m < 0)], num] = 1.
+
+        self.row_k = np.array([k for (k, _) in self.rows], dtype=int)
+        self.row_sin = np.array([is_sin for (_, is_sin) in self.rows],
+                                dtype=bool)
+
+    def evaluate(self, coefficients, x, y, order=0):
+        """
+        Evaluates sum_t coefficients[t] Z_t(x, y).
+
+        :param coefficients: (list of float) one per term
+        :param x: (numpy array of float, any shape S) normalized x
+                  coordinates
+        :param y: (numpy array of float, shape S) normalized y coordinates
+        :param order: (int) 0, 1 or 2; highest derivative order
+
+        :return tuple of length order + 1: value (array of shape S),
+                gradient (2xS array: d/dx, d/dy),
+                Hessian (2x2xS array)
+        """
+        shape = np.shape(x)
+        x = np.ravel(np.asarray(x, dtype=float))
+        y = np.ravel(np.asarray(y, dtype=float))
+        weights = np.dot(self.selection*np.asarray(coefficients,
+                                                   dtype=float)[np.newaxis, :],
+                         self.qtable)
+
+        # Q, Q' and Q'' of all rows at once
+        s = x**2 + y**2
+        q_derivatives = horner_with_derivatives(weights, s, order)
+        q = q_derivatives[0]
+
+        # real and imaginary parts of (x + i y)**k
+        re_powers = np.zeros((self.max_k + 1, len(s)))
+        im_powers = np.zeros((self.max_k + 1, len(s)))
+        re_powers[0] = 1.
+        for k in range(1, self.max_k + 1):
+            re_powers[k] = re_powers[k - 1]*x - im_powers[k - 1]*y
+            im_powers[k] = re_powers[k - 1]*y + im_powers[k - 1]*x
+
+        def angular(shift):
+            # same and other part of (x + i y)**(k - shift) per row
+            k_shifted = np.maximum(self.row_k - shift, 0)
+            same = np.where(self.row_sin[:, np.newaxis],
+                            im_powers[k_shifted], re_powers[k_shifted])
+            other = np.where(self.row_sin[:, np.newaxis],
+                             re_powers[k_shifted], -im_powers[k_shifted])
+            return (same, other)
+
+        (angle, _) = angular(0)
+        value = np.sum(q*angle, axis=0)
+        if order == 0:
+            return reshape_points((value,), shape)
+
+        # d/dx (x + i y)**k = k (x + i y)**(k-1),
+        # d/dy (x + i y)**k = i k (x + i y)**(k-1)
+        dq = q_derivatives[1]
+        k_column = self.row_k[:, np.newaxis].astype(float)
+        (same_1, other_1) = angular(1)
+        angle_x = k_column*same_1
+        angle_y = k_column*other_1
+        gradient = np.zeros((2, len(s)))
+        gradient[0] = np.sum(2.*x*dq*angle + q*angle_x, axis=0)
+        gradient[1] = np.sum(2.*y*dq*angle + q*angle_y, axis=0)
+        if order == 1:
+            return reshape_points((value, gradient), shape)
+
+        ddq = q_derivatives[2]
+        (same_2, other_2) = angular(2)
+        k_k_minus_1 = k_column*(k_column - 1.)
+        angle_xx = k_k_minus_1*same_2
+        angle_xy = k_k_minus_1*other_2
+        hessian = np.zeros((2, 2, len(s)))
+        hessian[0, 0] = np.sum(4.*x**2*ddq*angle + 2.*dq*angle +
+                               4.*x*dq*angle_x + q*angle_xx, axis=0)
+        hessian[0, 1] = np.sum(4.*x*y*ddq*angle + 2.*x*dq*angle_y +
+                               2.*y*dq*angle_x + q*angle_xy, axis=0)
+        hessian[1, 1] = np.sum(4.*y**2*ddq*angle + 2.*dq*angle +
+                               4.*y*dq*angle_y - q*angle_xx, axis=0)
+        hessian[1, 0] = hessian[0, 1]
+        return reshape_points((value, gradient, hessian), shape)
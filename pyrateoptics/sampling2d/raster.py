@@ -58,6 +58,68 @@ class RectGrid(object):
 
         return (xpup[ind], ypup[ind])
 
+    def getGridRows(self, nray):
+        """
+        Generator for the points of getGrid in the same order, split into
+        consecutive parts (e.g. rows of the raster) whose size grows
+        slower than nray.
+
+        :param nray: desired number of rays (int)
+
+        :return generator of (xpup, ypup) (1d numpy arrays of float)
+        """
+        nPerDim = int( round( math.sqrt( nray * 4.0 / math.pi ) ) )
+        dx = 1. / nPerDim
+        x1d = np.linspace(-1+.25*dx,1-.25*dx,nPerDim)
+
+        return self.getRowsOfMeshgrid(x1d, x1d)
+
+    def getGridInOneRow(self, nray, **kwargs):
+        """
+        getGridRows for rasters without row structure: yields the
+        whole grid at once.
+        """
+        yield self.getGrid(nray, **kwargs)
+
+    def getGridChunks(self, nray, chunk_size, **kwargs):
+        """
+        Generator for the grid of getGrid in chunks of consecutive points.
+        The points are generated row by row (see getGridRows), such that
+        at most one chunk and one row are kept in memory.
+
+        :param nray: desired number of rays (int)
+        :param chunk_size: maximal number of points per chunk (int)
+        :param kwargs: further arguments of getGrid
+
+        :return generator of (xpup, ypup) (1d numpy arrays of float)
+        """
+        (buffer_x, buffer_y, num_buffered) = ([], [], 0)
+        for (xrow, yrow) in self.getGridRows(nray, **kwargs):
+            buffer_x.append(xrow)
+            buffer_y.append(yrow)
+            num_buffered += len(xrow)
+            if num_buffered < chunk_size:
+                continue
+            xpup = np.concatenate(buffer_x)
+            ypup = np.concatenate(buffer_y)
+            num_full = (num_buffered//chunk_size)*chunk_size
+            for start in range(0, num_full, chunk_size):
+                yield (xpup[start:start + chunk_size],
+                       ypup[start:start + chunk_size])
+            (buffer_x, buffer_y) = ([xpup[num_full:]], [ypup[num_full:]])
+            num_buffered -= num_full
+        if num_buffered > 0:
+            yield (np.concatenate(buffer_x), np.concatenate(buffer_y))
+
+    def getRowsOfMeshgrid(self, x1d, y1d):
+        """
+        Generator for the rows of meshgrid(x1d, y1d) (same order as the
+        flattened meshgrid) restricted to the unit disk.
+        """
+        for yvalue in y1d:
+            ind = x1d**2 + yvalue**2 <= 1
+            yield (x1d[ind], np.full(np.count_nonzero(ind), yvalue))
+
 class HexGrid(RectGrid):
     def getGrid(self,nray):
         # the hex grid is split up into two rect grids (Bravais grid + base)
@@ -89,7 +151,23 @@ class HexGrid(RectGrid):
 
         return (xpup, ypup)
 
+    def getGridRows(self, nray):
+        # first all rows of the Bravais grid, then all rows of the base
+        nx = int(round(math.sqrt(2*math.sqrt(3)*nray/math.pi) + 1))
+        x1d = np.linspace(-1,1,nx)
+        y1d = x1d * math.sqrt(3)
+        dx = x1d[1] - x1d[0]
+        dy = y1d[1] - y1d[0]
+
+        for row in self.getRowsOfMeshgrid(x1d, y1d):
+            yield row
+        for row in self.getRowsOfMeshgrid(x1d + 0.5*dx, y1d + 0.5*dy):
+            yield row
+
 class RandomGrid(RectGrid):
+    # number of points per row of getGridRows
+    row_size = 1024
+
     def getGrid(self,nray):
 
         nraycircle = int( round( nray * 4.0 / math.pi ) )
@@ -102,6 +180,11 @@ class RandomGrid(RectGrid):
 
         return (xpup[ind], ypup[ind])
 
+    def getGridRows(self, nray):
+        # independent random points, generated in parts of row_size
+        for start in range(0, nray, self.row_size):
+            yield self.getGrid(min(self.row_size, nray - start))
+
 class PoissonDiskSampling(RectGrid):
     def getGrid(self,nray):
         nPerDim = int( round( math.sqrt( nray * 4.0 / math.pi ) ) )
@@ -123,7 +206,13 @@ class PoissonDiskSampling(RectGrid):
 
         return (xpup, ypup)
 
+    def getGridRows(self, nray):
+        return self.getGridInOneRow(nray)
+
 class MeridionalFan(RectGrid):
+    # number of points per row of getGridRows
+    row_size = 1024
+
     def getGrid(self,nray, phi=0.):
         xlin = np.linspace(-1, 1, nray)
         alpha = phi / 180. * math.pi
@@ -131,10 +220,24 @@ class MeridionalFan(RectGrid):
         ypup = xlin * math.cos(alpha)
         return (xpup, ypup)
 
+    def getGridRows(self, nray, phi=0.):
+        # parts of linspace(-1, 1, nray)
+        alpha = phi / 180. * math.pi
+        step = 2. / max(nray - 1, 1)
+        for start in range(0, nray, self.row_size):
+            stop = min(start + self.row_size, nray)
+            xlin = -1. + step*np.arange(start, stop)
+            if stop == nray and nray > 1:
+                xlin[-1] = 1.
+            yield (xlin * -math.sin(alpha), xlin * math.cos(alpha))
+
 class SagitalFan(RectGrid):
     def getGrid(self,nray, phi =0.):
         return MeridionalFan().getGrid(nray, phi - 90.)
 
+    def getGridRows(self, nray, phi=0.):
+        return MeridionalFan().getGridRows(nray, phi - 90.)
+
 class ChiefAndComa(RectGrid):
     def getGrid(self,nray, phi=0.):
         alpha= phi / 180. * math.pi
@@ -142,10 +245,16 @@ class ChiefAndComa(RectGrid):
         ypup = np.array([0,0,math.cos(alpha),-math.cos(alpha),math.sin(alpha),-math.sin(alpha)],dtype=float)
         return xpup,ypup
 
+    def getGridRows(self, nray, phi=0.):
+        return self.getGridInOneRow(nray, phi=phi)
+
 class Single(RectGrid):
     def getGrid(self, nray, xpup=0.0, ypup=0.0):
         return np.array([xpup]), np.array([ypup])
 
+    def getGridRows(self, nray, xpup=0.0, ypup=0.0):
+        return self.getGridInOneRow(nray, xpup=xpup, ypup=ypup)
+
 class CircularGrid(RectGrid):
     def getGrid(self, nray, requidistant=True):
 
@@ -162,6 +271,17 @@ class CircularGrid(RectGrid):
 
         return (xpup, ypup)
 
+    def getGridRows(self, nray, requidistant=True):
+        # one row per angle (see meshgrid in getGrid)
+        nraysqrt = int(round(math.sqrt(nray)))
+        r = np.linspace(0, 1, num=nraysqrt)
+        if not requidistant:
+            r = np.sqrt(r)
+        phi = np.linspace(0, 2.*math.pi, num=nraysqrt, endpoint=False)
+
+        for phivalue in phi:
+            yield (r*np.cos(phivalue), r*np.sin(phivalue))
+
 
 if __name__=="__main__":
     import matplotlib.pyplot as plt
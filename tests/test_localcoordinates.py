@@ -211,3 +211,24 @@ def inverse_coordinate(dec_x, dec_y, dec_z, tilt_x, tilt_y, tilt_z):
                                                   tiltz=-tilt_z,
                                                   tiltThenDecenter=1))
     assert np.allclose(system4.globalcoordinates, 0)
+
+
+def test_constant_tensor_transformation():
+    """
+    Constant (3x3x1) tensor fields are transformed like every single
+    tensor of a spatially varying field.
+    """
+    system = LocalCoordinates.p(name="1", tiltx=0.1, tilty=0.2, tiltz=0.3)
+    tensor = np.random.RandomState(0).uniform(size=(3, 3))
+    tensor_field = np.repeat(tensor[:, :, np.newaxis], 5, axis=2)
+    for constant_tensor in [tensor, tensor[:, :, np.newaxis]]:
+        global_tensor = system.returnLocalToGlobalTensors(constant_tensor)
+        assert global_tensor.shape == constant_tensor.shape
+        assert np.allclose(
+            np.broadcast_to(global_tensor.reshape((3, 3, -1)), (3, 3, 5)),
+            system.returnLocalToGlobalTensors(tensor_field))
+        assert np.allclose(system.returnGlobalToLocalTensors(global_tensor),
+                           constant_tensor)
+    assert np.allclose(system.returnLocalToGlobalTensors(tensor),
+                       np.dot(system.localbasis,
+                              np.dot(tensor, system.localbasis.T)))
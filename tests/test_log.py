@@ -0,0 +1,74 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import copy
+
+from pyrateoptics.core.log import (BaseLogger,
+                                   deterministic_names,
+                                   with_deterministic_names,
+                                   get_word_pool)
+
+
+def test_random_names():
+    """
+    Objects without names get random names from the word pool
+    which is only loaded once.
+    """
+    (adjectives, nouns) = get_word_pool()
+    assert get_word_pool()[0] is adjectives
+    obj = BaseLogger()
+    assert obj.name.endswith("_" + obj.kind)
+    if adjectives and nouns:
+        assert any(obj.name.startswith(adjective + "_")
+                   for adjective in adjectives)
+
+
+def test_deterministic_names():
+    """
+    Random names may be switched off for bulk construction.
+    """
+    with deterministic_names():
+        names = [BaseLogger().name for _ in range(3)]
+        assert BaseLogger(name="myname").name == "myname"
+    numbers = [int(name.split("_")[-1]) for name in names]
+    assert numbers == sorted(numbers) and len(set(numbers)) == 3
+    assert all(name.startswith("baselogger_") for name in names)
+
+    @with_deterministic_names
+    def create():
+        return BaseLogger()
+    assert create().name.startswith("baselogger_")
+
+
+def test_logger_after_copy():
+    """
+    Copies log via the shared logger with their own names.
+    """
+    obj = BaseLogger(name="original")
+    obj_copy = copy.deepcopy(obj)
+    obj_copy.name = "copy"
+    assert obj_copy.logger.process("message", {})[0] == "copy: message"
+    assert obj.logger.process("message", {})[0] == "original: message"
@@ -27,11 +27,22 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 from hypothesis import given
 from hypothesis.strategies import floats
 from hypothesis.extra.numpy import arrays
+import os
 import numpy as np
 import sympy
 from pyrateoptics.raytracer.localcoordinates import LocalCoordinates
 from pyrateoptics.raytracer.material.material_anisotropic import\
     AnisotropicMaterial
+from pyrateoptics.raytracer.material.material import MaxwellMaterial
+from pyrateoptics.raytracer.material.material_isotropic import ModelGlass,\
+    ConstantIndexGlass
+from pyrateoptics.raytracer.material.material_glasscat import\
+    CatalogMaterial, GlassCatalog
+from pyrateoptics.raytracer.material.material_grin import\
+    IsotropicGrinMaterial, SelfocGrinMaterial, AxialLinearGrinMaterial
+from pyrateoptics.raytracer.ray import RayBundle
+from pyrateoptics.raytracer.surface import Surface
+from pyrateoptics.raytracer.surface_shape import Conic
 
 @given(rnd_data1=arrays(np.float, (3, 3), elements=floats(0, 1)),
        rnd_data2=arrays(np.float, (3, 3), elements=floats(0, 1)),
@@ -302,3 +313,553 @@ def test_anisotropic_xi_eigenvectors(rnd_data1, rnd_data2, rnd_data3,
                  + Cmatrix[:, :, j]*eigenvalues[k, j]
                  + Kmatrix[:, :, j]), eigenvectors[k, :, j])
     assert np.allclose(should_be_zero, 0)
+
+# has a failing test if all random input data equals .0
+@given(rnd_data1=arrays(np.float, (3, 3), elements=floats(0.1, 1)),
+       rnd_data2=arrays(np.float, (3, 3), elements=floats(0.1, 1)),
+       rnd_data3=arrays(np.float, (3, 5), elements=floats(0.1, 1)))
+def test_anisotropic_direction_eigenvectors(rnd_data1, rnd_data2,
+                                            rnd_data3):
+    """
+    Check whether k eigenvalues and eigenvectors for given direction
+    fulfill [k^2 (-delta_ij (e_k e_k) + e_i e_j) + eps_ij] E_j = 0.
+    """
+    lc = LocalCoordinates.p("1")
+    myeps = np.eye(3) + rnd_data1 + complex(0, 1)*rnd_data2
+    m = AnisotropicMaterial.p(lc, myeps)
+    kd = rnd_data3
+    kd = kd/np.sqrt(np.sum(kd*kd, axis=0))
+    x = np.zeros((3, 5))
+    (eigenvalues, eigenvectors) = m.calcKnormEigenvectorsDirection(x, kd)
+    should_be_zero = np.ones((4, 3, 5), dtype=complex)
+    for j in range(5):
+        for k in range(4):
+            should_be_zero[k, :, j] = np.dot(
+                (eigenvalues[k, j]**2*(-np.eye(3) +
+                                       np.outer(kd[:, j], kd[:, j]))
+                 + myeps), eigenvectors[k, :, j])
+    assert np.allclose(should_be_zero, 0)
+
+
+@given(rnd_data1=arrays(np.float, (3,), elements=floats(0.1, 1)),
+       rnd_data2=arrays(np.float, (3, 5), elements=floats(0.1, 1)),
+       rnd_data3=arrays(np.float, (3, 5), elements=floats(-0.5, 0.5)),
+       rnd_data4=floats(-0.5, 0.5))
+def test_anisotropic_uniaxial_closed_form(rnd_data1, rnd_data2, rnd_data3,
+                                          rnd_data4):
+    """
+    Closed form solutions for uniaxial materials agree with the general
+    eigenvalue solver (for propagating waves).
+    """
+    lc = LocalCoordinates.p("1")
+    optical_axis = rnd_data1/np.sqrt(np.sum(rnd_data1**2))
+    eps_o = 2.25
+    eps_e = 2.25 + rnd_data4
+    myeps = eps_o*np.eye(3) + (eps_e - eps_o)*np.outer(optical_axis,
+                                                       optical_axis)
+    m_closed = AnisotropicMaterial.p(lc, myeps)
+    m_general = AnisotropicMaterial.p(lc, myeps)
+    m_general.uniaxial_parameters = None
+    if abs(rnd_data4) < 1e-6:
+        # (almost) isotropic
+        return
+    assert np.allclose(m_closed.uniaxial_parameters[1], eps_e)
+    n = rnd_data2/np.sqrt(np.sum(rnd_data2**2, axis=0))
+    x = np.zeros((3, 5))
+    kpa = rnd_data3 - np.sum(n * rnd_data3, axis=0)*n
+    (k_closed, e_closed) = m_closed.sortKnormEField(x, n, kpa, n)
+    (k_general, _) = m_general.sortKnormEField(x, n, kpa, n)
+    assert np.allclose(k_closed, k_general)
+    (k_closed_unit, e_closed_unit) = m_closed.sortKnormUnitEField(x, n, n)
+    (k_general_unit, _) = m_general.sortKnormUnitEField(x, n, n)
+    assert np.allclose(k_closed_unit, k_general_unit)
+    # E-fields fulfill (-k^2 delta_ij + k_i k_j + eps_ij) E_j = 0
+    # (comparison with general solver not possible for k parallel c)
+    for (k_4, e_4) in ((k_closed, e_closed), (k_closed_unit, e_closed_unit)):
+        should_be_zero = np.einsum("ai...,ai...->a...", k_4, k_4)[
+            :, np.newaxis, :]*e_4 -\
+            k_4*np.einsum("ai...,ai...->a...", k_4, e_4)[:, np.newaxis, :] -\
+            np.einsum("ij,aj...->ai...", myeps, e_4)
+        assert np.allclose(should_be_zero, 0)
+
+
+def test_anisotropic_biaxial_detection():
+    """
+    Biaxial and isotropic epsilon tensors use the general solver.
+    """
+    assert AnisotropicMaterial.find_uniaxial_parameters(
+        np.diag([1.5, 1.6, 1.7])) is None
+    assert AnisotropicMaterial.find_uniaxial_parameters(
+        2.25*np.eye(3)) is None
+    (eps_o, eps_e, optical_axis) = AnisotropicMaterial.find_uniaxial_parameters(
+        np.diag([1.5, 1.7, 1.5]))
+    assert np.allclose((eps_o, eps_e), (1.5, 1.7))
+    assert np.allclose(np.abs(optical_axis), [0, 1, 0])
+
+
+def test_anisotropic_eigensolver_fallback():
+    """
+    Singular epsilon tensors and ill-conditioned shifts are solved by the
+    generalized eigensolver; results agree with the batched solver.
+    """
+    lc = LocalCoordinates.p("1")
+    np.random.seed(1357)
+    kd = np.random.randn(3, 5)
+    kd = kd/np.sqrt(np.sum(kd*kd, axis=0))
+    x = np.zeros((3, 5))
+
+    singular_eps = np.array([[2., 1., 0.], [1., 2., 0.], [0., 0., 0.]])
+    m_singular = AnisotropicMaterial.p(lc, singular_eps)
+    (eigenvalues, eigenvectors) = m_singular.calcKnormEigenvectorsDirection(
+        x, kd)
+    for j in range(5):
+        for k in range(4):
+            should_be_zero = np.dot(
+                eigenvalues[k, j]**2*(-np.eye(3) +
+                                      np.outer(kd[:, j], kd[:, j])) +
+                singular_eps, eigenvectors[k, :, j])
+            assert np.allclose(should_be_zero, 0)
+
+    lossy_eps = np.array([[2.1, 0.2, 0.], [0.2, 2.3, 0.1], [0., 0.1, 2.5]]) +\
+        complex(0, 1)*np.array([[0.3, 0., 0.1], [0., 0.2, 0.], [0.1, 0., 0.4]])
+    m_batched = AnisotropicMaterial.p(lc, lossy_eps)
+    m_fallback = AnisotropicMaterial.p(lc, lossy_eps)
+    m_fallback.eigensolver_condition_limit = 0.
+    n = np.zeros((3, 5))
+    n[2] = 1.
+    kpa = 0.5*np.random.randn(3, 5)
+    kpa[2] = 0.
+    for (method, args) in (("calcXiEigenvectorsNorm", (x, n, kpa)),
+                           ("calcKnormEigenvectorsDirection", (x, kd))):
+        (xi_batched, _) = getattr(m_batched, method)(*args)
+        (xi_fallback, _) = getattr(m_fallback, method)(*args)
+        assert np.allclose(np.sort_complex(xi_batched.T).T,
+                           np.sort_complex(xi_fallback.T).T)
+
+
+def test_anisotropic_branch_pruning():
+    """
+    Power is distributed among the ordinary and extraordinary branch;
+    weak rays and empty branches are pruned.
+    """
+    lc = LocalCoordinates.p("1")
+    optical_axis = np.array([1., 0., 1.])/np.sqrt(2.)
+    myeps = 2.25*np.eye(3) + 0.3*np.outer(optical_axis, optical_axis)
+    m = AnisotropicMaterial.p(lc, myeps, prune_threshold=0.1)
+    n = np.zeros((3, 3))
+    n[2] = 1.
+    x = np.zeros((3, 3))
+    kpa = np.zeros((3, 3))
+    kpa[0] = [0., 0.1, 0.3]
+    (k_4, e_4) = m.sortKnormEField(x, n, kpa, n)
+    # the ordinary E-field is perpendicular to the x-z plane
+    e_in = np.array([[0., 0., 1.], [1., 1., 1.], [0., 0., 0.]])
+    fractions = m.calcBranchPowerFractions(e_in, n, k_4[2:4], e_4[2:4])
+    assert np.allclose(np.sum(fractions, axis=0), 1.)
+    assert np.allclose(np.sort(fractions[:, 0]), [0., 1.])
+    assert np.all(fractions[:, 2] > 0.1)
+
+    raybundle = RayBundle(x, kpa + n, e_in, power=np.array([1., 0.5, 0.5]))
+    (rb_1, rb_2) = m.splitRayBundle(raybundle, n, k_4[2:4], e_4[2:4], True)
+    assert np.allclose(rb_1.power + rb_2.power, raybundle.power)
+    assert rb_1.pruned_rays + rb_2.pruned_rays == 2
+    assert np.sum(rb_1.valid[0]) + np.sum(rb_2.valid[0]) == 4
+
+    # purely ordinary polarization: the extraordinary branch is dropped
+    raybundle = RayBundle(x[:, :2], (kpa + n)[:, :2], e_in[:, :2])
+    raybundles = m.splitRayBundle(raybundle, n[:, :2], k_4[2:4, :, :2],
+                                  e_4[2:4, :, :2], True)
+    assert len(raybundles) == 1
+    assert np.all(raybundles[0].valid[0])
+    assert np.allclose(raybundles[0].power, 1.)
+    assert raybundles[0].pruned_branches == 1
+    assert raybundles[0].pruned_rays == 2
+
+
+def test_optical_index_cache():
+    """
+    Cached and vectorized optical indices equal the direct evaluation
+    and are updated after changes of the dispersion coefficients.
+    """
+    lc = LocalCoordinates.p("1")
+    # N-BK7 (SCHOTT) in refractiveindex.info notation
+    ymldict = {"DATA": [{"type": "formula 2",
+                         "wavelength_range": "0.3 2.5",
+                         "coefficients": "0 1.03961212 0.00600069867 "
+                                         "0.231792344 0.0200179144 "
+                                         "1.01046945 103.560653"}]}
+    bk7 = CatalogMaterial.p(lc, ymldict)
+    modelglass = ModelGlass.p(lc)
+    waves = np.array([0.4861e-3, 0.5876e-3, 0.6563e-3, 0.5876e-3])
+
+    for material in [bk7, modelglass]:
+        direct = np.array([material.get_optical_index(None, wave)
+                           for wave in waves])
+        assert np.allclose(material.get_optical_index(None, waves), direct)
+        assert np.allclose(material.get_optical_index_per_ray(None, waves),
+                           direct)
+        assert np.isclose(material.get_optical_index_per_ray(None, waves[1]),
+                          direct[1])
+        assert np.isclose(material.get_optical_index_per_ray(
+            None, np.array(waves[1])), direct[1])
+        assert len(material.get_index_cache()) == 3
+
+    assert np.isclose(bk7.get_optical_index(None, 0.5876e-3), 1.5168,
+                      atol=1e-4)
+
+    # changes of other objects keep the cache
+    lc.decz.set_value(1.0)
+    assert len(modelglass.get_index_cache()) == 3
+    modelglass.n0.set_value(1.6)
+    assert len(modelglass.get_index_cache()) == 0
+    modelglass.index_cache_size = 2
+    assert np.allclose(modelglass.get_optical_index_per_ray(None, waves),
+                       [modelglass.get_optical_index(None, wave)
+                        for wave in waves])
+    assert len(modelglass.get_index_cache()) == 2
+
+
+def test_glass_catalog_index(tmp_path):
+    """
+    Glass catalog index is created, used by later catalogs and
+    rebuilt or updated if the database changes.
+    """
+    page_template = ("DATA:\n"
+                     "  - type: formula 2\n"
+                     "    wavelength_range: 0.3 2.5\n"
+                     "    coefficients: 0 %f 0.006 0.23 0.02 1.01 103.56\n")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "bk7.yml").write_text(page_template % (1.04,))
+    (tmp_path / "library.yml").write_text(
+        "- SHELF: glass\n"
+        "  name: Glass\n"
+        "  content:\n"
+        "    - DIVIDER: Schott\n"
+        "    - BOOK: BK7\n"
+        "      name: BK7\n"
+        "      content:\n"
+        "        - PAGE: SCHOTT\n"
+        "          name: SCHOTT N-BK7\n"
+        "          data: bk7.yml\n")
+    database = str(tmp_path)
+
+    gcat = GlassCatalog(database)
+    assert os.path.exists(database + "/library_index.pickle")
+    assert gcat.get_dict_of_long_names() ==\
+        {"SCHOTT N-BK7": ("glass", "BK7", "SCHOTT")}
+    matdict = gcat.material_dict_from_long_name("SCHOTT N-BK7")
+    assert matdict["DATA"][0]["type"] == "formula 2"
+
+    class CountingGlassCatalog(GlassCatalog):
+        parsed_files = []
+
+        def read_yml_file(self, ymlfilename):
+            self.parsed_files.append(os.path.basename(ymlfilename))
+            return super(CountingGlassCatalog,
+                         self).read_yml_file(ymlfilename)
+
+    gcat2 = CountingGlassCatalog(database)
+    assert gcat2.material_dict_from_long_name("SCHOTT N-BK7") == matdict
+    assert gcat2.find_pages_with_long_name("BK7") ==\
+        {"SCHOTT N-BK7": ("glass", "BK7", "SCHOTT")}
+    assert CountingGlassCatalog.parsed_files == []
+
+    # changed page file is parsed again
+    (tmp_path / "data" / "bk7.yml").write_text(page_template % (1.1,))
+    mtime = os.path.getmtime(database + "/data/bk7.yml") + 10.
+    os.utime(database + "/data/bk7.yml", (mtime, mtime))
+    matdict = CountingGlassCatalog(database).\
+        material_dict_from_long_name("SCHOTT N-BK7")
+    assert "1.100000" in matdict["DATA"][0]["coefficients"]
+    assert CountingGlassCatalog.parsed_files == ["bk7.yml"]
+
+    # changed library is parsed again
+    mtime = os.path.getmtime(database + "/library.yml") + 10.
+    os.utime(database + "/library.yml", (mtime, mtime))
+    CountingGlassCatalog(database)
+    assert CountingGlassCatalog.parsed_files == ["bk7.yml", "library.yml"]
+
+
+def test_glass_catalog_index_not_writable(tmp_path, monkeypatch):
+    """
+    Index file is written without os.replace (Python 2.7); if it cannot
+    be written, the catalog works without it and leaves no temporary
+    file behind.
+    """
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "bk7.yml").write_text(
+        "DATA:\n"
+        "  - type: formula 2\n"
+        "    wavelength_range: 0.3 2.5\n"
+        "    coefficients: 0 1.04 0.006 0.23 0.02 1.01 103.56\n")
+    (tmp_path / "library.yml").write_text(
+        "- SHELF: glass\n"
+        "  name: Glass\n"
+        "  content:\n"
+        "    - BOOK: BK7\n"
+        "      name: BK7\n"
+        "      content:\n"
+        "        - PAGE: SCHOTT\n"
+        "          name: SCHOTT N-BK7\n"
+        "          data: bk7.yml\n")
+    database = str(tmp_path)
+
+    monkeypatch.delattr(os, "replace")
+    GlassCatalog(database)
+    GlassCatalog(database).get_material_dict("glass", "BK7", "SCHOTT")
+    assert sorted(os.listdir(database)) ==\
+        ["data", "library.yml", "library_index.pickle"]
+    monkeypatch.undo()
+
+    # a directory cannot be replaced by the index file
+    (tmp_path / "index_dir").mkdir()
+    gcat = GlassCatalog(database, index_filename=database + "/index_dir")
+    assert gcat.material_dict_from_long_name("SCHOTT N-BK7")
+    assert sorted(os.listdir(database)) ==\
+        ["data", "index_dir", "library.yml", "library_index.pickle"]
+
+
+def test_glass_catalog_nearest_glass(tmp_path):
+    """
+    Nearest glass searches on nd, vd and PgF.
+    """
+    page_template = ("DATA:\n"
+                     "  - type: formula 2\n"
+                     "    wavelength_range: %s 2.5\n"
+                     "    coefficients: 0 %f 0.006 0.23 0.02 1.01 103.56\n")
+    pages = [("bk7", "0.3", 1.04), ("dense", "0.3", 1.5),
+             ("heavy", "0.3", 1.7), ("infrared", "1.0", 1.2)]
+    library = ("- SHELF: glass\n"
+               "  name: Glass\n"
+               "  content:\n"
+               "    - BOOK: test\n"
+               "      name: Test\n"
+               "      content:\n")
+    (tmp_path / "data").mkdir()
+    for (page, wave_min, coefficient) in pages:
+        (tmp_path / "data" / (page + ".yml")).write_text(
+            page_template % (wave_min, coefficient))
+        library += ("        - PAGE: %s\n"
+                    "          name: %s\n"
+                    "          data: %s.yml\n" % (page, page.upper(), page))
+    (tmp_path / "library.yml").write_text(library)
+    database = str(tmp_path)
+
+    class CountingGlassCatalog(GlassCatalog):
+        num_saves = 0
+
+        def save_index(self):
+            self.num_saves += 1
+            super(CountingGlassCatalog, self).save_index()
+
+    gcat = CountingGlassCatalog(database)
+    table = gcat.get_glass_table()
+    # index file is written by the constructor and once for all pages
+    assert gcat.num_saves == 2
+    # infrared page cannot be evaluated at the g line
+    assert table["pages"] == [("glass", "test", "bk7"),
+                              ("glass", "test", "dense"),
+                              ("glass", "test", "heavy")]
+    (nd_bk7, vd_bk7, pgf_bk7) = table["nd_vd_pgf"][0]
+    assert abs(nd_bk7 - 1.5168) < 1e-3
+    assert abs(vd_bk7 - 64.17) < 0.5
+    assert abs(pgf_bk7 - 0.5349) < 0.01
+
+    for (nd_value, vd_value, pgf_value) in table["nd_vd_pgf"]:
+        [(distance, _, _)] = gcat.find_nearest_glasses(nd_value, vd_value,
+                                                       pgf_value)
+        assert distance < 1e-12
+
+    result = gcat.find_nearest_glasses(1.52, 64., number=5)
+    assert [name for (_, name, _) in result] == ["BK7", "DENSE", "HEAVY"]
+    assert [distance for (distance, _, _) in result] ==\
+        sorted([distance for (distance, _, _) in result])
+    assert [name for (_, name, _) in
+            gcat.find_glasses_in_range(1.52, 64., radius=0.05)] == ["BK7"]
+    assert gcat.get_material_dict_schott_code(517642) ==\
+        gcat.get_material_dict("glass", "test", "bk7")
+    assert gcat.get_material_dict_nd_vd_pgf(*table["nd_vd_pgf"][2]) ==\
+        gcat.get_material_dict("glass", "test", "heavy")
+
+    # table is stored in the index
+    gcat2 = GlassCatalog(database)
+    gcat2.read_yml_file = None
+    assert gcat2.get_glass_table()["pages"] == table["pages"]
+
+
+def test_grin_adaptive_integration():
+    """
+    GRIN integration stops rays at the next surface and only
+    invalidates rays which leave the boundary.
+    """
+    grin_source = """
+import numpy as np
+
+
+def nfunc(x, **kw):
+    return 1.5 + 0.*x[0]
+
+
+def dndx(x, **kw):
+    return np.zeros_like(x[0])
+
+
+def bnd(x):
+    return x[0]**2 + x[1]**2 < 1.5**2
+"""
+    lc_material = LocalCoordinates.p(name="material")
+    lc_surface = lc_material.addChild(
+        LocalCoordinates.p(name="surface", decz=5.))
+    next_surface = Surface.p(lc_surface,
+                             shape=Conic.p(lc_surface, curv=-0.1))
+    grinmaterial = IsotropicGrinMaterial.p(lc_material, grin_source,
+                                           "nfunc", "dndx", "dndx", "dndx",
+                                           "bnd")
+    num_rays = 5
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-1.4, 1.4, num_rays)
+    # tilted rays leave the boundary before reaching the surface
+    k0 = np.zeros((3, num_rays))
+    k0[0] = 0.1*x0[0]
+    k0[2] = 1.
+    k0 = 1.5*k0/np.linalg.norm(k0, axis=0)
+
+    for store_steps in [True, False]:
+        grinmaterial.annotations["store_steps"] = store_steps
+        raybundle = RayBundle(x0, k0, None)
+        (_, _, _, valid) = grinmaterial.symplecticintegrator(
+            raybundle, next_surface, 0.1)
+        assert np.array_equal(valid, [False, True, True, True, False])
+        assert np.array_equal(raybundle.valid[-1], valid)
+        assert (len(raybundle.x) > 2) == store_steps
+        xfinal = raybundle.x[-1][:, valid]
+        assert np.allclose(
+            grinmaterial.distance_to_surface(xfinal, next_surface), 0.,
+            atol=1e-9)
+        # straight rays in homogeneous medium
+        assert np.allclose(xfinal[0],
+                           x0[0, valid] + (k0[0]/k0[2])[valid]*xfinal[2])
+
+
+def test_grin_gradient():
+    """
+    GRIN gradient from derivative functions, a fused function and
+    complex step differentiation agree.
+    """
+    grin_source = """
+import numpy as np
+
+
+def nfunc(x, **kw):
+    return 1.5 + 0.1*np.exp(-x[0]**2 - 4.*x[1]**2) + 0.01*x[2]
+
+
+def dndx(x, **kw):
+    return -0.2*x[0]*np.exp(-x[0]**2 - 4.*x[1]**2)
+
+
+def dndy(x, **kw):
+    return -0.8*x[1]*np.exp(-x[0]**2 - 4.*x[1]**2)
+
+
+def dndz(x, **kw):
+    return 0.01 + 0.*x[2]
+
+
+def ngrad(x, **kw):
+    return (nfunc(x), np.array([dndx(x), dndy(x), dndz(x)]))
+"""
+    lc_material = LocalCoordinates.p(name="material")
+    xpos = np.random.RandomState(0).uniform(-1., 1., (3, 7))
+    gradients = []
+    for (derivative_names, ngrad_name) in [(("dndx", "dndy", "dndz"), None),
+                                           ((None, None, None), "ngrad"),
+                                           ((None, None, None), None)]:
+        grinmaterial = IsotropicGrinMaterial.p(lc_material, grin_source,
+                                               "nfunc", *derivative_names,
+                                               ngrad_name=ngrad_name)
+        (optind, gradient) =\
+            grinmaterial.get_optical_index_and_gradient(xpos)
+        assert np.allclose(optind, grinmaterial.nfunc(xpos))
+        assert gradient.shape == (3, 7)
+        gradients.append(gradient)
+    assert np.allclose(gradients[0], gradients[1])
+    assert np.allclose(gradients[0], gradients[2], atol=1e-14)
+
+
+def test_grin_analytic_profiles():
+    """
+    Closed-form propagation through Selfoc and axial linear GRIN
+    profiles agrees with the symplectic integrator.
+    """
+    lc_material = LocalCoordinates.p(name="material")
+    lc_surface = lc_material.addChild(
+        LocalCoordinates.p(name="surface", decz=12.))
+    next_surface = Surface.p(lc_surface,
+                             shape=Conic.p(lc_surface, curv=-0.05))
+    num_rays = 5
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-0.5, 0.5, num_rays)
+    x0[1] = 0.2
+    k0 = np.zeros((3, num_rays))
+    k0[0] = 0.1
+    k0[2] = 1.
+
+    for grinmaterial in [SelfocGrinMaterial.p(lc_material, n0=1.6, g=0.3,
+                                              radius=1.),
+                         AxialLinearGrinMaterial.p(lc_material, n0=1.6,
+                                                   a=-0.02)]:
+        final_positions = []
+        for analytic in [True, False]:
+            grinmaterial.annotations["analytic"] = analytic
+            grinmaterial.annotations["ds"] = 0.01
+            optind = grinmaterial.get_optical_index(x0)
+            raybundle = RayBundle(
+                x0, optind*k0/np.linalg.norm(k0, axis=0), None)
+            grinmaterial.propagate(raybundle, next_surface)
+            assert np.all(raybundle.valid[-1])
+            xfinal = raybundle.x[-1]
+            assert np.allclose(
+                grinmaterial.distance_to_surface(xfinal, next_surface), 0.,
+                atol=1e-9)
+            final_positions.append(xfinal)
+        assert np.allclose(final_positions[0], final_positions[1],
+                           atol=1e-4)
+
+    # conserved quantity v**2 - n**2 of the closed-form solution
+    grinmaterial = SelfocGrinMaterial.p(lc_material, n0=1.6, g=0.3)
+    vel = grinmaterial.get_optical_index(x0)*k0/np.linalg.norm(k0, axis=0)
+    (pos, vel, optind) = grinmaterial.analytic_step(
+        x0, vel, np.linspace(0.1, 5., num_rays))
+    assert np.allclose(np.sum(vel**2, axis=0), optind**2)
+
+
+def test_isotropic_sort_k_efield():
+    """
+    Isotropic k and E field solutions agree with the general
+    eigenvalue solution.
+    """
+    glass = ConstantIndexGlass.p(LocalCoordinates.p(name="glass"), n=1.5)
+    kd = np.random.RandomState(1).normal(size=(3, 20))
+    kd[:, 0] = (0., 1., 0.)
+    xpos = np.zeros_like(kd)
+    sort_direction = np.ones_like(kd)
+    sort_direction[:, :5] *= -1.
+
+    (k_norm_4, efield_4) = glass.sortKnormUnitEField(xpos, kd,
+                                                      sort_direction)
+    (k_norm_4_general, efield_4_general) =\
+        MaxwellMaterial.sortKnormUnitEField(glass, xpos, kd, sort_direction)
+    assert np.allclose(k_norm_4, k_norm_4_general)
+    assert np.allclose(np.sum(k_norm_4*efield_4, axis=1), 0.)
+    assert np.allclose(np.sum(np.abs(efield_4)**2, axis=1), 1.)
+    assert np.allclose(np.sum(efield_4[2]*efield_4[3], axis=0), 0.)
+
+    # complex directions as used for pilot bundles
+    kd = kd + 0.01j*np.random.RandomState(2).normal(size=(3, 20))
+    (k_norm_4, efield_4) = glass.sortKnormUnitEField(xpos, kd,
+                                                      sort_direction)
+    (k_norm_4_general, efield_4_general) =\
+        MaxwellMaterial.sortKnormUnitEField(glass, xpos, kd, sort_direction)
+    assert np.allclose(k_norm_4, k_norm_4_general)
+    assert np.allclose(np.sum(k_norm_4*efield_4, axis=1), 0.)
@@ -0,0 +1,126 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import numpy as np
+import pytest
+# Python 3.8 or later
+pytest.importorskip("multiprocessing.shared_memory")
+from pyrateoptics import build_rotationally_symmetric_optical_system
+from pyrateoptics.raytracer.ray import RayBundle
+from pyrateoptics.raytracer.aperture import CircularAperture
+from pyrateoptics.raytracer import parallel_trace
+from pyrateoptics.raytracer.parallel_trace import ParallelTraceExecutor
+from pyrateoptics.raytracer.material.material_anisotropic import\
+    AnisotropicMaterial
+
+# without fork (e.g. Windows) ParallelTraceExecutor traces serially
+pytestmark = pytest.mark.skipif(not parallel_trace.fork_available(),
+                                reason="fork start method not available")
+
+
+@pytest.mark.parametrize("fork", [True, False])
+def test_parallel_trace_same_result(fork, monkeypatch):
+    """
+    Parallel trace gives the same final state as a serial trace,
+    also for vignetted rays and after changing the system. Without
+    fork the executor falls back to the serial trace.
+    """
+    if not fork:
+        monkeypatch.setattr(parallel_trace, "fork_available", lambda: False)
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (20.0, -0.5, 2.0, 1.5, "front", {}),
+         (-30.0, 0, 5.0, None, "back", {}),
+         (0, 0, 10.0, None, "image", {})])
+    front = s.elements["stdelem"].surfaces["front"]
+    front.aperture = CircularAperture.p(front.rootcoordinatesystem,
+                                        maxradius=0.8)
+    num_rays = 101
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-1., 1., num_rays)
+    x0[1] = 0.3
+    k0 = np.zeros((3, num_rays))
+    k0[2] = 1.
+    initialbundle = RayBundle(x0, k0, None)
+
+    def assert_same_final(final):
+        serial = s.seqtrace(initialbundle, seq, keep_history=False,
+                            use_trace_plan=use_trace_plan)[0]
+        serial = serial.getLastRayBundle()
+        assert final.x.shape == (1, 3, num_rays)
+        for (values, parallel_values) in [(serial.x[-1], final.x[-1]),
+                                          (serial.k[-1], final.k[-1]),
+                                          (serial.Efield[-1],
+                                           final.Efield[-1]),
+                                          (serial.power, final.power)]:
+            assert np.array_equal(
+                serial.scatterToInitialRays(values, num_rays),
+                parallel_values, equal_nan=True)
+        assert np.array_equal(
+            serial.scatterToInitialRays(serial.valid[-1], num_rays, False),
+            final.valid[-1])
+
+    with ParallelTraceExecutor(s, num_workers=2, num_shards=3) as executor:
+        for use_trace_plan in [False, True]:
+            final = executor.seqtrace(initialbundle, seq,
+                                      use_trace_plan=use_trace_plan)
+            assert np.count_nonzero(final.valid[-1]) < num_rays
+            assert_same_final(final)
+        front.shape.curvature.set_value(0.03)
+        final = executor.seqtrace(initialbundle, seq,
+                                  use_trace_plan=use_trace_plan)
+        assert_same_final(final)
+        assert (executor.pool is not None) == fork
+
+
+def test_parallel_trace_rejects_split_rays():
+    """
+    Split rays (two final rays per rayID) raise an error instead of
+    silently overwriting each other.
+    """
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (0, 0, 2.0, 1.5, "front", {}),
+         (0, 0, 5.0, None, "back", {}),
+         (0, 0, 10.0, None, "image", {})])
+    element = s.elements["stdelem"]
+    front = element.surfaces["front"]
+    element.materials["constantindexglass_1.5"] = AnisotropicMaterial.p(
+        front.rootcoordinatesystem, np.diag([2.25, 2.25, 2.4]))
+    num_rays = 10
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-1., 1., num_rays)
+    k0 = np.zeros((3, num_rays))
+    k0[1] = 0.3
+    k0[2] = 1.
+    initialbundle = RayBundle(x0, k0, None)
+
+    serial = s.seqtrace(initialbundle, seq, keep_history=False)[0]
+    assert len(serial.getLastRayBundle().rayID) > num_rays
+
+    with ParallelTraceExecutor(s, num_workers=1) as executor:
+        with pytest.raises(ValueError):
+            executor.seqtrace(initialbundle, seq)
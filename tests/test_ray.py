@@ -0,0 +1,277 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import numpy as np
+from pyrateoptics import build_rotationally_symmetric_optical_system
+from pyrateoptics.raytracer.ray import RayBundle, RayPath, concatenateRayBundles
+from pyrateoptics.raytracer.material.material_isotropic import ModelGlass
+from pyrateoptics.raytracer.aperture import CircularAperture
+from pyrateoptics.raytracer.localcoordinates import LocalCoordinates
+from pyrateoptics.raytracer.surface import Surface
+from pyrateoptics.raytracer.surface_shape import Conic, Asphere
+
+
+def test_raybundle_history_growth():
+    """
+    Appending many points to the preallocated history storage
+    gives the same arrays as stacking them explicitly.
+    """
+    num_rays = 7
+    num_points = 13
+    x_list = [np.random.random((3, num_rays)) for _ in range(num_points)]
+    k_list = [np.random.random((3, num_rays)) + complex(0, 1)*i
+              for i in range(num_points)]
+    e_list = [np.random.random((3, num_rays)) for _ in range(num_points)]
+    v_list = [np.random.random(num_rays) > 0.1 for _ in range(num_points)]
+    raybundle = RayBundle(x_list[0], k_list[0], e_list[0])
+    for (x, k, efield, valid) in zip(x_list[1:], k_list[1:],
+                                     e_list[1:], v_list[1:]):
+        raybundle.append(x, k, efield, valid)
+    assert raybundle.x.shape == (num_points, 3, num_rays)
+    assert np.allclose(raybundle.x, np.array(x_list))
+    assert np.allclose(raybundle.k, np.array(k_list))
+    assert np.allclose(raybundle.Efield, np.array(e_list))
+    assert np.all(raybundle.valid[-1] == np.all(v_list[1:], axis=0))
+
+
+def test_raybundle_history_view():
+    """
+    Changing the last validity entry changes the stored history.
+    """
+    x0 = np.zeros((3, 4))
+    raybundle = RayBundle(x0, x0, None)
+    raybundle.append(x0 + 1., x0, x0, np.ones(4, dtype=bool))
+    raybundle.valid[-1] = raybundle.valid[-1]*np.array([1, 0, 1, 0],
+                                                       dtype=bool)
+    assert np.all(raybundle.valid[-1] == np.array([1, 0, 1, 0], dtype=bool))
+    assert np.all(raybundle.valid[0])
+    assert np.allclose(raybundle.x[-1], 1.)
+
+
+def test_seqtrace_final_state_only():
+    """
+    Trace without history gives the same final raybundle as the full
+    trace and keeps the recorded surfaces.
+    """
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (100.0, 0, 2.0, 1.5, "front", {}),
+         (-100.0, 0, 1.0, None, "back", {}),
+         (0, 0, 10.0, None, "image", {})])
+    num_rays = 5
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-1., 1., num_rays)
+    k0 = np.zeros((3, num_rays))
+    k0[2] = 2.*np.pi/0.5
+    initialbundle = RayBundle(x0, k0, None)
+    rpath_full = s.seqtrace(initialbundle, seq)[0]
+    rpath_final = s.seqtrace(initialbundle, seq, keep_history=False,
+                             record=[("stdelem", "front")])[0]
+    assert len(rpath_final.raybundles) == 1
+    assert np.allclose(rpath_final.raybundles[-1].x,
+                       rpath_full.raybundles[-1].x)
+    assert np.allclose(rpath_final.raybundles[-1].k,
+                       rpath_full.raybundles[-1].k)
+    [recorded] = rpath_final.getRecordedRayBundles(("stdelem", "front"))
+    assert np.allclose(recorded.x, rpath_full.raybundles[-3].x)
+    assert np.allclose(initialbundle.x, x0[np.newaxis])
+
+
+def test_raypath_fork():
+    """
+    Forked raypaths share the raybundles up to the fork and
+    can be continued independently.
+    """
+    x0 = np.zeros((3, 2))
+    raybundles = [RayBundle(x0 + i, x0, None) for i in range(5)]
+    raypath = RayPath(raybundles[0])
+    raypath.appendRayBundle(raybundles[1])
+    raypath_fork = raypath.fork()
+    raypath.appendRayBundle(raybundles[2])
+    raypath_fork.appendRayBundle(raybundles[3])
+    raypath_fork_fork = raypath_fork.fork()
+    raypath_fork_fork.appendRayBundle(raybundles[4])
+
+    assert raypath.raybundles == raybundles[:3]
+    assert raypath_fork.raybundles == raybundles[:2] + [raybundles[3]]
+    assert raypath_fork_fork.raybundles ==\
+        raybundles[:2] + [raybundles[3], raybundles[4]]
+    # shared, not copied
+    assert raypath_fork.raybundles[0] is raypath.raybundles[0]
+    assert raypath_fork_fork.getLastRayBundle() is raybundles[4]
+
+    # resetting the parent does not change the children
+    raypath.raybundles = [raybundles[4]]
+    assert raypath_fork.raybundles == raybundles[:2] + [raybundles[3]]
+
+
+def test_raybundle_compact():
+    """
+    Compaction removes invalid rays from the whole history and keeps
+    the mapping to the initial rays.
+    """
+    x0 = np.random.random((3, 6))
+    raybundle = RayBundle(x0, x0, None)
+    raybundle.append(x0 + 1., x0, raybundle.Efield[-1],
+                     np.array([True, False, True, True, False, True]))
+    assert np.isclose(raybundle.getInvalidFraction(), 1./3.)
+    assert raybundle.compact(threshold=0.5) == 0
+    assert raybundle.compact() == 2
+    assert raybundle.x.shape == (2, 3, 4)
+    assert np.allclose(raybundle.x[0], x0[:, [0, 2, 3, 5]])
+    assert np.all(raybundle.valid)
+    assert np.array_equal(raybundle.rayID, [0, 2, 3, 5])
+    scattered = raybundle.scatterToInitialRays(raybundle.x[-1], 6)
+    assert np.allclose(scattered[:, raybundle.rayID], raybundle.x[-1])
+    assert np.all(np.isnan(scattered[:, [1, 4]]))
+
+
+def test_seqtrace_compaction():
+    """
+    Trace with compaction of vignetted rays gives the same rays as
+    without compaction.
+    """
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (100.0, 0, 2.0, 1.5, "front", {}),
+         (-100.0, 0, 1.0, None, "back", {}),
+         (0, 0, 10.0, None, "image", {})])
+    front = s.elements["stdelem"].surfaces["front"]
+    front.aperture = CircularAperture.p(front.rootcoordinatesystem,
+                                        maxradius=0.5)
+    num_rays = 11
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-1., 1., num_rays)
+    k0 = np.zeros((3, num_rays))
+    k0[2] = 1.
+    initialbundle = RayBundle(x0, k0, None)
+    final = s.seqtrace(initialbundle, seq)[0].raybundles[-1]
+    final_compacted = s.seqtrace(initialbundle, seq,
+                                 compaction_threshold=0.1)[0].raybundles[-1]
+    assert len(final_compacted.rayID) == 5
+    assert np.allclose(
+        final.scatterToInitialRays(final.x[-1], num_rays),
+        final_compacted.scatterToInitialRays(final_compacted.x[-1],
+                                             num_rays), equal_nan=True)
+
+
+def test_polychromatic_raybundle(monkeypatch):
+    """
+    Trace of one raybundle with one wavelength per ray through a
+    dispersive lens gives the same rays as one trace per wavelength.
+    The unique wavelengths are evaluated only once per trace.
+    """
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (20.0, 0, 2.0, 1.5, "front", {}),
+         (-30.0, 0, 5.0, None, "back", {}),
+         (0, 0, 10.0, None, "image", {})])
+    element = s.elements["stdelem"]
+    glass = element.materials["constantindexglass_1.5"]
+    element.addMaterial("modelglass", ModelGlass.p(glass.lc))
+    element.changeMaterialsForSurface("front", (None, "modelglass"))
+    element.changeMaterialsForSurface("back", ("modelglass", None))
+    waves = [0.4861e-3, 0.5876e-3, 0.6563e-3]
+    num_rays = 5
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-1.5, 1.5, num_rays)
+    k0 = np.zeros((3, num_rays))
+    k0[2] = 1.
+    bundles = [RayBundle(x0, k0, None, wave=wave) for wave in waves]
+    polychromatic = concatenateRayBundles(bundles)
+    assert np.array_equal(polychromatic.wave, np.repeat(waves, num_rays))
+
+    unique = np.unique
+    unique_calls = []
+
+    def counting_unique(*args, **kwargs):
+        unique_calls.append(args)
+        return unique(*args, **kwargs)
+
+    for use_trace_plan in [False, True]:
+        s.seqtrace(polychromatic, seq, use_trace_plan=use_trace_plan)
+        monkeypatch.setattr(np, "unique", counting_unique)
+        final = s.seqtrace(polychromatic, seq,
+                           use_trace_plan=use_trace_plan)[0]
+        monkeypatch.undo()
+        assert len(unique_calls) <= 1
+        del unique_calls[:]
+        final = final.getLastRayBundle()
+        (unique_waves, inverse) = final.getWaveGroups()
+        assert np.array_equal(unique_waves[inverse], final.wave)
+        for (num, bundle) in enumerate(bundles):
+            mono = s.seqtrace(bundle, seq, use_trace_plan=use_trace_plan)[0]
+            mono = mono.getLastRayBundle()
+            rays = slice(num*num_rays, (num + 1)*num_rays)
+            assert np.allclose(final.x[-1][:, rays], mono.x[-1])
+            assert np.allclose(final.k[-1][:, rays], mono.k[-1])
+            assert np.allclose(final.wave[rays], waves[num])
+        # the image positions depend on the wavelength
+        assert not np.allclose(final.x[-1][:, :num_rays],
+                               final.x[-1][:, num_rays:2*num_rays])
+
+
+def test_intersection_record():
+    """
+    Intersection records carry the local geometry of the last
+    intersection and are only used for the shape and point they
+    were obtained for.
+    """
+    lc_root = LocalCoordinates.p(name="root")
+    lc_surface = LocalCoordinates.p(name="surf", decz=5., tiltx=0.1)
+    lc_root.addChild(lc_surface)
+    lc_material = LocalCoordinates.p(name="material", decx=1., tilty=-0.2)
+    lc_root.addChild(lc_material)
+    material = ModelGlass.p(lc_material)
+
+    num_rays = 20
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-2., 2., num_rays)
+    k0 = np.zeros((3, num_rays))
+    k0[2] = 1.
+
+    for shape in (Conic.p(lc_surface, curv=0.05, cc=-0.3),
+                  Asphere.p(lc_surface, curv=0.05,
+                            coefficients=[1e-3, -1e-5])):
+        surface = Surface.p(lc_root, shape=shape)
+        raybundle = RayBundle(x0, k0, None)
+        record = surface.intersect(raybundle)
+        assert raybundle.getIntersectionRecord(shape) is record
+        assert raybundle.getIntersectionRecord(Conic.p(lc_surface)) is None
+        assert np.allclose(
+            lc_surface.returnLocalToGlobalPoints(record.xlocal),
+            raybundle.x[-1])
+        xlocal = lc_surface.returnGlobalToLocalPoints(raybundle.x[-1])
+        normal = shape.getNormal(xlocal[0], xlocal[1])
+        assert np.allclose(record.normal, normal)
+        assert np.allclose(
+            raybundle.getLocalSurfaceNormal(surface, material,
+                                            raybundle.x[-1]),
+            lc_material.returnOtherToActualDirections(normal, lc_surface))
+
+        raybundle.append(raybundle.x[-1] + 1., raybundle.k[-1],
+                         raybundle.Efield[-1], raybundle.valid[-1])
+        assert raybundle.getIntersectionRecord(shape) is None
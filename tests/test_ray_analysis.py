@@ -26,8 +26,14 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import math
 import numpy as np
+import pytest
+from pyrateoptics import build_rotationally_symmetric_optical_system
 from pyrateoptics.raytracer.ray import RayBundle
 from pyrateoptics.raytracer.analysis.ray_analysis import RayBundleAnalysis
+from pyrateoptics.raytracer.analysis.optical_system_analysis import\
+    OpticalSystemAnalysis
+from pyrateoptics.raytracer.analysis.ray_reducers import\
+    SpotStatisticsReducer, HistogramReducer, IrradianceMapReducer
 
 
 def test_centroid():
@@ -109,3 +115,75 @@ def test_rms_angularsize():
     angularsize = rayanalysis.get_rms_angluar_size(
         np.array([math.sin(1.*math.pi/180.0), 0, math.cos(1.*math.pi/180.0)]))
     assert np.isclose(angularsize, (1.*math.pi/180.0))
+
+
+def test_chunked_trace_reducers():
+    """
+    Reducers fed chunk by chunk give the same results as the analysis
+    of one raybundle containing all rays.
+    """
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (20.0, 0, 2.0, 1.5, "front", {}),
+         (-30.0, 0, 5.0, None, "back", {}),
+         (0, 0, 10.0, None, "image", {})])
+    image_lc = s.elements["stdelem"].surfaces["image"].rootcoordinatesystem
+    analysis = OpticalSystemAnalysis(s, seq)
+    rays_dict = {"radius": 2.0, "anglex": 0.02}
+    numrays = 500
+
+    finalbundles = [finalbundle for finalbundles in
+                    analysis.trace_chunks(numrays, 37, rays_dict)
+                    for finalbundle in finalbundles]
+    assert len(finalbundles) > 1
+    ray_ids = np.hstack([rb.rayID for rb in finalbundles])
+    assert np.array_equal(ray_ids, np.arange(len(ray_ids)))
+
+    (x0, k0, e0) = analysis.collimated_bundle(numrays, rays_dict)
+    complete = s.seqtrace(RayBundle(x0, k0, e0), seq)[0].raybundles[-1]
+    complete_analysis = RayBundleAnalysis(complete)
+
+    (spot, histogram, irradiance) = analysis.reduce_chunks(
+        [SpotStatisticsReducer(),
+         HistogramReducer(lambda rb: rb.x[-1, 0], 10, (-2., 2.)),
+         IrradianceMapReducer(image_lc, (8, 8), (-2., 2.), (-2., 2.))],
+        numrays, 37, rays_dict)
+
+    (num_rays, centroid, rms) = spot.get_result()
+    assert num_rays == len(ray_ids)
+    assert np.allclose(centroid, complete_analysis.get_centroid_position())
+    assert np.isclose(rms, complete_analysis.get_rms_spot_size_centroid())
+    (counts, edges) = histogram.get_result()
+    assert np.array_equal(counts,
+                          np.histogram(complete.x[-1, 0], bins=edges)[0])
+    (irradiance_map, xedges, yedges) = irradiance.get_result()
+    assert np.isclose(np.sum(irradiance_map)*(xedges[1] - xedges[0]) *
+                      (yedges[1] - yedges[0]), num_rays)
+
+
+def test_chunked_trace_memory():
+    """
+    Peak memory of a chunked trace is bounded by the chunk size and
+    does not grow with the number of rays.
+    """
+    # Python 3.4 or later
+    tracemalloc = pytest.importorskip("tracemalloc")
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (20.0, 0, 2.0, 1.5, "front", {}),
+         (-30.0, 0, 5.0, None, "back", {}),
+         (0, 0, 10.0, None, "image", {})])
+    analysis = OpticalSystemAnalysis(s, seq)
+    rays_dict = {"radius": 2.0}
+
+    def peak_memory(numrays):
+        tracemalloc.start()
+        (spot,) = analysis.reduce_chunks([SpotStatisticsReducer()],
+                                         numrays, 200, rays_dict)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert spot.get_result()[0] > 0.9*numrays
+        return peak
+
+    peak_memory(2000)  # warm up caches
+    assert peak_memory(40000) < 2*peak_memory(4000)
@@ -32,8 +32,12 @@ import numpy as np
 from pyrateoptics.raytracer.surface_shape import (Conic,
                                                   Asphere,
                                                   Biconic,
-                                                  XYPolynomials)
+                                                  XYPolynomials,
+                                                  ZernikeFringe,
+                                                  ZernikeANSI,
+                                                  ZernikeStandard)
 from pyrateoptics.raytracer.localcoordinates import LocalCoordinates
+from pyrateoptics.raytracer.ray import RayBundle
 
 
 # pylint: disable=no-value-for-parameter
@@ -350,3 +354,181 @@ def xypolynomials_grad(test_vector):
     comparison[2, :] = 1.
 
     assert np.allclose(gradient, comparison)
+
+
+def test_explicit_shape_intersect():
+    """
+    Newton intersection of explicit shapes lies on the surface and
+    rays missing the surface are marked as invalid.
+    """
+    coordinate_system = LocalCoordinates.p(name="root")
+    coordinate_system_surface = LocalCoordinates.p(name="surf",
+                                                   decz=5.0)
+    coordinate_system.addChild(coordinate_system_surface)
+
+    num_rays = 2000
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-12., 12., num_rays)
+    x0[1] = 0.3*x0[0]
+    k0 = np.zeros((3, num_rays))
+    k0[0] = 0.05
+    k0[2] = 1.
+    k0 = k0/np.sqrt(np.sum(k0**2, axis=0))
+
+    shapes = [Asphere.p(coordinate_system_surface, curv=0.1, cc=0.,
+                        coefficients=[1e-3, -1e-6]),
+              Biconic.p(coordinate_system_surface, curvx=0.01, curvy=0.02,
+                        coefficients=[(1e-4, 0.1)]),
+              XYPolynomials.p(coordinate_system_surface, normradius=10.,
+                              coefficients=[(2, 0, 0.5), (0, 2, -0.3),
+                                            (2, 1, 0.1)])]
+    for shape in shapes:
+        raybundle = RayBundle(x0, k0, None)
+        shape.intersect(raybundle)
+        xlocal = coordinate_system_surface.returnGlobalToLocalPoints(
+            raybundle.x[-1])
+        valid = raybundle.valid[-1]
+        assert np.sum(valid) > 0
+        assert np.allclose(xlocal[2, valid],
+                           shape.getSag(xlocal[0, valid], xlocal[1, valid]),
+                           atol=1e-6)
+
+    # conic part of this asphere is only defined for r < 10
+    asphere = shapes[0]
+    raybundle = RayBundle(x0, k0, None)
+    asphere.intersect(raybundle)
+    assert not np.any(raybundle.valid[-1][np.abs(x0[0]) > 11.5])
+    assert np.all(raybundle.valid[-1][np.abs(x0[0]) < 5.])
+
+
+def test_zernike_evaluator():
+    """
+    Batched Zernike evaluation agrees with the per term functions,
+    Hessian agrees with finite differences, Noll indices are consistent.
+    """
+    coordinate_system = LocalCoordinates.p(name="root")
+    np.random.seed(1234)
+    num_coefficients = 37
+    coefficients = np.random.randn(num_coefficients).tolist()
+    normradius = 3.
+    x_coordinate = np.random.uniform(-2., 2., 50)
+    y_coordinate = np.random.uniform(-2., 2., 50)
+    xp = x_coordinate/normradius
+    yp = y_coordinate/normradius
+
+    for zernike_class in (ZernikeFringe, ZernikeANSI, ZernikeStandard):
+        shape = zernike_class.p(coordinate_system, normradius=normradius,
+                                coefficients=coefficients)
+        sag = np.zeros_like(xp)
+        gradient = np.zeros((3, len(xp)))
+        gradient[2] = 1.
+        for (num, val) in enumerate(coefficients):
+            sag += val*shape.zernike_norm_j(num + 1, xp, yp)
+            (dzdxp, dzdyp) = shape.gradzernike_norm_j(num + 1, xp, yp)
+            gradient[0] += -val*dzdxp/normradius
+            gradient[1] += -val*dzdyp/normradius
+        assert np.allclose(shape.getSag(x_coordinate, y_coordinate), sag)
+        assert np.allclose(shape.getGrad(x_coordinate, y_coordinate),
+                           gradient)
+
+        delta = 1e-5
+        hessian = shape.getHessian(x_coordinate, y_coordinate)
+        for (num, (dx, dy)) in enumerate(((delta, 0.), (0., delta))):
+            gradient_plus = shape.getGrad(x_coordinate + dx,
+                                          y_coordinate + dy)
+            gradient_minus = shape.getGrad(x_coordinate - dx,
+                                           y_coordinate - dy)
+            assert np.allclose(hessian[:, num],
+                               (gradient_plus - gradient_minus)/(2.*delta),
+                               atol=1e-5)
+
+        # points of any shape: meshgrid and scalar
+        grid_results = shape.evaluateSagGradHessian(
+            np.reshape(x_coordinate, (5, 10)),
+            np.reshape(y_coordinate, (5, 10)), 2)
+        for (flat, grid) in zip((sag, gradient, hessian), grid_results):
+            assert grid.shape == flat.shape[:-1] + (5, 10)
+            assert np.allclose(np.reshape(grid, flat.shape), flat)
+        assert np.isclose(shape.F(x_coordinate[7], y_coordinate[7]), sag[7])
+        assert np.allclose(shape.hessF(x_coordinate[7], y_coordinate[7], 0.),
+                           hessian[:, :, 7])
+
+    noll_indices = [(0, 0), (1, 1), (1, -1), (2, 0),
+                    (2, -2), (2, 2), (3, -1), (3, 1)]
+    for (j, n_m_pair) in enumerate(noll_indices):
+        assert ZernikeStandard.jtonm(j + 1) == n_m_pair
+    for j in range(1, 67):
+        assert ZernikeStandard.nmtoj(ZernikeStandard.jtonm(j)) == j
+        assert ZernikeFringe.nmtoj(ZernikeFringe.jtonm(j)) == j
+
+
+def test_fused_sag_grad_hessian():
+    """
+    Fused Hessians agree with finite differences of the gradient;
+    cached results are reused for equal points and parameters only.
+    """
+    coordinate_system = LocalCoordinates.p(name="root")
+    np.random.seed(4321)
+    x_coordinate = np.random.uniform(-3., 3., 50)
+    y_coordinate = np.random.uniform(-3., 3., 50)
+
+    shapes = [Asphere.p(coordinate_system, curv=0.05, cc=-0.5,
+                        coefficients=[1e-3, -1e-5, 2e-7, -1e-9]),
+              XYPolynomials.p(coordinate_system, normradius=4.,
+                              coefficients=[(2, 0, 0.5), (0, 2, -0.3),
+                                            (2, 1, 0.1), (1, 3, -0.2),
+                                            (4, 0, 0.05), (0, 0, 1.)])]
+    delta = 1e-5
+    for shape in shapes:
+        hessian = shape.getHessian(x_coordinate, y_coordinate)
+        for (num, (dx, dy)) in enumerate(((delta, 0.), (0., delta))):
+            gradient_plus = shape.getGrad(x_coordinate + dx,
+                                          y_coordinate + dy)
+            gradient_minus = shape.getGrad(x_coordinate - dx,
+                                           y_coordinate - dy)
+            assert np.allclose(hessian[:, num],
+                               (gradient_plus - gradient_minus)/(2.*delta),
+                               atol=1e-6)
+            sag_plus = shape.getSag(x_coordinate + dx, y_coordinate + dy)
+            sag_minus = shape.getSag(x_coordinate - dx, y_coordinate - dy)
+            assert np.allclose(shape.getGrad(x_coordinate,
+                                             y_coordinate)[num],
+                               -(sag_plus - sag_minus)/(2.*delta),
+                               atol=1e-6)
+
+    # points of any shape: meshgrid and scalar
+    (x_grid, y_grid) = np.meshgrid(x_coordinate[:5], y_coordinate[:4])
+    for shape in shapes:
+        flat_results = shape.evaluateSagGradHessian(np.ravel(x_grid),
+                                                    np.ravel(y_grid), 2)
+        grid_results = shape.evaluateSagGradHessian(x_grid, y_grid, 2)
+        for (flat, grid) in zip(flat_results, grid_results):
+            assert grid.shape == flat.shape[:-1] + (4, 5)
+            assert np.allclose(np.reshape(grid, flat.shape), flat)
+        assert shape.getSag(x_grid, y_grid).shape == (4, 5)
+        assert shape.getGrad(x_grid, y_grid).shape == (3, 4, 5)
+        assert shape.getHessian(x_grid, y_grid).shape == (3, 3, 4, 5)
+        assert np.isclose(shape.F(x_grid[1, 2], y_grid[1, 2]),
+                          grid_results[0][1, 2])
+        assert shape.gradF(x_grid[1, 2], y_grid[1, 2], 0.).shape == (3,)
+
+    asphere = shapes[0]
+    evaluated_orders = []
+    evaluate = asphere.evaluateSagGradHessian
+
+    def counting_evaluate(x, y, order):
+        evaluated_orders.append(order)
+        return evaluate(x, y, order)
+    asphere.evaluateSagGradHessian = counting_evaluate
+
+    sag = asphere.getSag(x_coordinate, y_coordinate)
+    # returned arrays are copies of the cached ones
+    sag_copy = sag.copy()
+    sag[:] = 0.
+    assert np.array_equal(asphere.getSag(x_coordinate.copy(), y_coordinate),
+                          sag_copy)
+    assert evaluated_orders == [0]
+    asphere.params["curv"].set_value(0.04)
+    sag_changed = asphere.getSag(x_coordinate, y_coordinate)
+    assert not np.allclose(sag_changed, sag)
+    assert np.allclose(sag_changed, asphere.F(x_coordinate, y_coordinate))
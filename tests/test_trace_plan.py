@@ -0,0 +1,128 @@
+#!/usr/bin/env/python
+"""
+Pyrate - Optical raytracing based on Python
+
+Copyright (C) 2014-2020
+               by     Moritz Esslinger moritz.esslinger@web.de
+               and    Johannes Hartung j.hartung@gmx.net
+               and    Uwe Lippmann  uwe.lippmann@web.de
+               and    Thomas Heinze t.heinze@uni-jena.de
+               and    others
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import numpy as np
+from pyrateoptics import build_rotationally_symmetric_optical_system
+from pyrateoptics.raytracer.ray import RayBundle, RayPath
+
+
+def build_system_and_bundle():
+    (s, seq) = build_rotationally_symmetric_optical_system(
+        [(0, 0, 0.0, None, "object", {}),
+         (20.0, -0.5, 2.0, 1.5, "front", {}),
+         (-30.0, 0, 5.0, None, "back", {}),
+         (-40.0, 0, -5.0, None, "mirror", {"is_mirror": True}),
+         (0, 0, 0.0, None, "image", {})])
+    num_rays = 7
+    x0 = np.zeros((3, num_rays))
+    x0[0] = np.linspace(-1., 1., num_rays)
+    x0[1] = 0.3
+    k0 = np.zeros((3, num_rays))
+    k0[1] = 0.05
+    k0[2] = 1.
+    return (s, seq, RayBundle(x0, k0, None))
+
+
+def assert_same_raypaths(rpaths1, rpaths2):
+    assert len(rpaths1) == len(rpaths2)
+    for (rpath1, rpath2) in zip(rpaths1, rpaths2):
+        assert len(rpath1.raybundles) == len(rpath2.raybundles)
+        for (rb1, rb2) in zip(rpath1.raybundles, rpath2.raybundles):
+            assert np.allclose(rb1.x, rb2.x)
+            assert np.allclose(rb1.k, rb2.k)
+            assert np.allclose(rb1.Efield, rb2.Efield)
+            assert np.array_equal(rb1.valid, rb2.valid)
+
+
+def test_trace_plan_same_result():
+    """
+    Trace with compiled plan gives the same raypaths as the
+    generic trace (including mirrors and recorded surfaces).
+    """
+    (s, seq, initialbundle) = build_system_and_bundle()
+    assert_same_raypaths(s.seqtrace(initialbundle, seq),
+                         s.seqtrace(initialbundle, seq, use_trace_plan=True))
+    record = [("stdelem", "back")]
+    [rpath] = s.seqtrace(initialbundle, seq, keep_history=False,
+                         record=record, use_trace_plan=True)
+    [rpath_generic] = s.seqtrace(initialbundle, seq)
+    assert len(rpath.raybundles) == 1
+    [recorded] = rpath.getRecordedRayBundles(("stdelem", "back"))
+    assert np.allclose(recorded.x, rpath_generic.raybundles[-3].x)
+
+
+def test_trace_plan_invalidation():
+    """
+    Plan is reused as long as nothing changes and is compiled again
+    after changes of variables or coordinate systems.
+    """
+    (s, seq, initialbundle) = build_system_and_bundle()
+    plan = s.getTracePlan(seq)
+    plan.seqtrace(initialbundle)
+    assert s.getTracePlan(seq) is plan
+    assert plan.isUpToDate()
+
+    surfaces = s.elements["stdelem"].surfaces
+    surfaces["front"].shape.curvature.set_value(1./15.)
+    assert not plan.isUpToDate()
+    assert_same_raypaths(s.seqtrace(initialbundle, seq),
+                         s.seqtrace(initialbundle, seq, use_trace_plan=True))
+    assert plan.isUpToDate()
+
+    lc = surfaces["back"].rootcoordinatesystem
+    lc.decz.set_value(3.)
+    lc.update()
+    assert_same_raypaths(s.seqtrace(initialbundle, seq),
+                         s.seqtrace(initialbundle, seq, use_trace_plan=True))
+
+    assert s.getTracePlan([("stdelem", seq[0][1][:-1])]) is not plan
+
+
+def test_trace_plan_local_frames():
+    """
+    Trace without history in local coordinates of the surfaces gives
+    the same final and recorded raybundles as the generic trace, also
+    for tilted and decentered surfaces.
+    """
+    (s, seq, initialbundle) = build_system_and_bundle()
+    surfaces = s.elements["stdelem"].surfaces
+    lc = surfaces["back"].rootcoordinatesystem
+    lc.tiltx.set_value(0.05)
+    lc.decy.set_value(0.2)
+    lc.update()
+    record = [("stdelem", "front"), ("stdelem", "mirror")]
+    [rpath] = s.seqtrace(initialbundle, seq, keep_history=False,
+                         record=record, use_trace_plan=True)
+    [rpath_generic] = s.seqtrace(initialbundle, seq, keep_history=False,
+                                 record=record)
+    assert len(rpath.raybundles) == 1
+    assert_same_raypaths([rpath], [rpath_generic])
+    assert np.array_equal(rpath.raybundles[-1].rayID,
+                          rpath_generic.raybundles[-1].rayID)
+    for key in record:
+        assert_same_raypaths(
+            [RayPath(rb) for rb in rpath.getRecordedRayBundles(key)],
+            [RayPath(rb) for rb in rpath_generic.getRecordedRayBundles(key)])